@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Cached discovery of the FPrintWIN folder and the wine binary
+
+The first lookup probes the usual locations; the result is kept in memory
+and in the config ("fprint_dir", "wine_path"). Later lookups only stat the
+cached file, so starting FPrint does not walk candidate directories again.
+A launch failure invalidates the cache and the next lookup searches afresh.
+An optional background indexer searches once at startup, including a
+shallow scan of the home folder for FPrintWIN installs outside the usual
+places, so restart latency never depends on that scan.
+"""
+
+import logging
+import os
+import shutil
+import stat
+import threading
+
+# A child of the shared application logger, so setup_logging() handles its output
+logger = logging.getLogger("cash_register_monitor.fprint_monitor")
+
+FPRINT_EXE = "FPrint.exe"
+WINE_CANDIDATES = ("/opt/homebrew/bin/wine", "/usr/local/bin/wine")
+COMMON_DIRS = ("~/Downloads/FPrintWIN", "~/FPrintWIN", "/Applications/FPrintWIN", "~/Desktop/FPrintWIN")
+INDEX_DEPTH = 3  # folder levels below home searched by the indexer
+INDEX_SKIP = {"Library", "Applications", "Music", "Movies", "Pictures", "node_modules"}
+
+
+def _is_file(path, executable=False):
+    """One stat call: path exists, is a regular file and optionally executable"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return stat.S_ISREG(st.st_mode) and (not executable or bool(st.st_mode & 0o111))
+
+
+class FPrintLocator:
+    """Find FPrint.exe and wine, remembering where they were"""
+
+    def __init__(self, config, save_config=None):
+        """
+        Args:
+            config: App config dict; cached paths are stored in it
+            save_config: Called after the cached paths change
+        """
+        self.config = config
+        self.save_config = save_config
+        self.installs = []  # every FPrintWIN folder found by the indexer
+        self._lock = threading.Lock()
+        self._indexer = None
+
+    def _store(self, key, value):
+        if self.config.get(key) != value:
+            self.config[key] = value
+            if self.save_config:
+                self.save_config()
+
+    def candidate_dirs(self):
+        """Folders that may hold FPrint.exe, most likely first"""
+        # Relative path (when running from source)
+        yield os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for path in COMMON_DIRS:
+            yield os.path.expanduser(path)
+        yield from self.installs
+
+    def find_fprint_dir(self):
+        """Folder containing FPrint.exe, or None"""
+        with self._lock:
+            cached = self.config.get("fprint_dir")
+            if cached and _is_file(os.path.join(cached, FPRINT_EXE)):
+                return cached
+            if cached:
+                logger.debug("Cached FPrint path no longer valid: %s", cached)
+
+            logger.debug("Looking for FPrint.exe...")
+            for path in self.candidate_dirs():
+                logger.debug("Trying: %s", path)
+                if _is_file(os.path.join(path, FPRINT_EXE)):
+                    logger.debug("Found FPrint.exe at: %s", path)
+                    self._store("fprint_dir", path)
+                    return path
+
+        logger.warning("FPrint.exe not found in any location")
+        return None
+
+    def find_wine(self, search_path=None):
+        """Path to the wine binary, or None
+
+        Args:
+            search_path: PATH to search when wine is not in a Homebrew prefix
+        """
+        with self._lock:
+            cached = self.config.get("wine_path")
+            if cached and _is_file(cached, executable=True):
+                return cached
+
+            for path in WINE_CANDIDATES:
+                if _is_file(path, executable=True):
+                    break
+            else:
+                path = shutil.which("wine", path=search_path)
+            if path:
+                logger.debug("Wine path: %s", path)
+                self._store("wine_path", path)
+            return path
+
+    def invalidate(self):
+        """Forget cached paths after a failed launch"""
+        with self._lock:
+            cleared = [key for key in ("fprint_dir", "wine_path") if self.config.pop(key, None)]
+            if cleared:
+                logger.info("Cleared cached paths: %s", ", ".join(cleared))
+                if self.save_config:
+                    self.save_config()
+
+    def index(self, root="~", depth=INDEX_DEPTH):
+        """Scan home once for folders that contain FPrint.exe"""
+        found = []
+        pending = [(os.path.expanduser(root), 0)]
+        while pending:
+            folder, level = pending.pop()
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.name == FPRINT_EXE and entry.is_file():
+                            found.append(folder)
+                        elif (level < depth and entry.is_dir(follow_symlinks=False)
+                              and not entry.name.startswith(".") and entry.name not in INDEX_SKIP):
+                            pending.append((entry.path, level + 1))
+            except OSError:
+                continue
+        self.installs = found
+        logger.debug("Indexed FPrint installs: %s", found)
+        return found
+
+    def start_indexer(self, on_done=None):
+        """Index installs and resolve the FPrint folder in a background thread, once"""
+        def run():
+            self.index()
+            self.find_fprint_dir()
+            if on_done:
+                on_done()
+
+        if self._indexer is None:
+            self._indexer = threading.Thread(target=run, name="fprint-indexer", daemon=True)
+            self._indexer.start()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Supervisor for the FPrint.exe wine process
+
+FPrint is launched directly with wine, in its own session, using the
+login-shell environment (Homebrew PATH, WINEPREFIX, ...) captured once and
+cached instead of starting a login shell for every launch. Stopping signals
+only FPrint's own process group - SIGTERM first, SIGKILL if it does not exit
+in time - so other wine programs on the Mac are left alone. Start and restart
+poll until the process is up and, if "fprint_port" is configured, that port
+accepts connections, rather than sleeping a fixed time.
+"""
+
+import logging
+import os
+import signal
+import socket
+import subprocess
+import time
+
+# A child of the shared application logger, so setup_logging() handles its output
+logger = logging.getLogger("cash_register_monitor.fprint_monitor")
+
+READY_TIMEOUT = 20.0   # seconds to wait for FPrint to come up
+STOP_TIMEOUT = 5.0     # seconds between SIGTERM and SIGKILL
+POLL_INTERVAL = 0.1
+# Without a port to check, the process must stay alive this long to count as up
+MIN_UPTIME = 1.0
+
+
+def load_login_environment():
+    """Environment of a login shell, so apps started from Finder still find wine"""
+    try:
+        result = subprocess.run(["/bin/bash", "-l", "-c", "env -0"], stdin=subprocess.DEVNULL,
+                                capture_output=True, timeout=10)
+        env = dict(item.split("=", 1)
+                   for item in result.stdout.decode("utf-8", "replace").split("\0") if "=" in item)
+        if result.returncode == 0 and env:
+            return env
+        logger.warning("Login shell environment unavailable (returncode=%s)", result.returncode)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning("Could not read login shell environment: %s", e)
+    return dict(os.environ)
+
+
+def port_listening(port, host="127.0.0.1", timeout=0.2):
+    """Check if something accepts TCP connections on a local port"""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class FPrintSupervisor:
+    """Start, stop and health-check one FPrint.exe instance"""
+
+    def __init__(self, port=None):
+        """
+        Args:
+            port: Local TCP port FPrint listens on, used as the readiness check
+        """
+        self.port = port
+        self.process = None
+        self.last_restart = None  # seconds the last restart took
+        self._env = None
+
+    @property
+    def environment(self):
+        """Login-shell environment, captured on first use"""
+        if self._env is None:
+            started = time.monotonic()
+            self._env = load_login_environment()
+            logger.debug("Captured login environment in %.0fms", (time.monotonic() - started) * 1000)
+        return self._env
+
+    def find_pids(self):
+        """PIDs of FPrint.exe processes, including ones started before this monitor"""
+        result = subprocess.run(["pgrep", "-f", "FPrint.exe"], capture_output=True, text=True)
+        logger.debug("pgrep FPrint.exe: returncode=%s, stdout=%r, stderr=%r",
+                     result.returncode, result.stdout.strip(), result.stderr.strip())
+        return [int(pid) for pid in result.stdout.split() if pid.isdigit()]
+
+    def is_running(self):
+        """Check if FPrint is running; our own child is checked without forking pgrep"""
+        if self.process is not None and self.process.poll() is None:
+            return True
+        return bool(self.find_pids())
+
+    def start(self, fprint_dir, wine_path):
+        """Launch FPrint.exe in a new session (and so a new process group)"""
+        logger.info("Launching FPrint from: %s", fprint_dir)
+        logger.debug("Wine path: %s", wine_path)
+        self.process = subprocess.Popen(
+            [wine_path, "FPrint.exe"],
+            cwd=fprint_dir,
+            env=self.environment,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        return self.process
+
+    def wait_ready(self, timeout=READY_TIMEOUT):
+        """Poll until FPrint is up (and listening, if a port is set); False on timeout or exit"""
+        started = time.monotonic()
+        deadline = started + timeout
+        while time.monotonic() < deadline:
+            if self.process is not None and self.process.poll() is not None:
+                logger.warning("FPrint exited during startup (returncode=%s)", self.process.returncode)
+                return False
+            if self.port:
+                if port_listening(self.port):
+                    return True
+            elif time.monotonic() - started >= MIN_UPTIME and self.is_running():
+                return True
+            time.sleep(POLL_INTERVAL)
+        logger.warning("FPrint not ready after %.1fs", timeout)
+        return False
+
+    def _process_groups(self):
+        """Process groups holding FPrint, never our own"""
+        if self.process is not None and self.process.poll() is None:
+            # Our child leads its own group; no need to search for it
+            pids = [self.process.pid]
+        else:
+            pids = self.find_pids()
+        own_group = os.getpgrp()
+        groups = set()
+        for pid in pids:
+            try:
+                group = os.getpgid(pid)
+            except ProcessLookupError:
+                continue
+            if group != own_group:
+                groups.add(group)
+        return groups
+
+    def _signal(self, groups, sig):
+        for group in list(groups):
+            try:
+                os.killpg(group, sig)
+            except ProcessLookupError:
+                groups.discard(group)
+
+    def _wait_groups_gone(self, groups, timeout):
+        deadline = time.monotonic() + timeout
+        while groups and time.monotonic() < deadline:
+            if self.process is not None:
+                self.process.poll()  # reap our child so its group can disappear
+            self._signal(groups, 0)
+            if groups:
+                time.sleep(POLL_INTERVAL)
+        return not groups
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Stop FPrint: SIGTERM its process group, then SIGKILL after timeout"""
+        groups = self._process_groups()
+        if groups:
+            logger.debug("Sending SIGTERM to FPrint process groups %s", sorted(groups))
+            self._signal(groups, signal.SIGTERM)
+            if not self._wait_groups_gone(groups, timeout):
+                logger.warning("FPrint did not exit after SIGTERM, sending SIGKILL")
+                self._signal(groups, signal.SIGKILL)
+                self._wait_groups_gone(groups, 1.0)
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=1.0)
+            except subprocess.TimeoutExpired:
+                pass
+            self.process = None
+        return not groups
@@ -1,17 +1,48 @@
 #!/usr/bin/env python3
 import rumps
-import subprocess
-import socket
+import sys
+import threading
 import time
-import json
+import logging
 import os
-import shutil
+from PyObjCTools.AppHelper import callAfter
+from fprint_locator import FPrintLocator
+from fprint_supervisor import FPrintSupervisor
+
+# Probing, config and history come from the monitoring core shared with win/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "win"))
+from cash_register_monitor.logging_setup import get_logger, set_log_level, setup_logging, shutdown_logging
+from cash_register_monitor.monitor_core import MonitorCore
+from cash_register_monitor.settings_manager import SettingsManager
+
+logger = get_logger("fprint_monitor")
+
+CONFIG_DIR = os.path.expanduser("~/.config/fprint_monitor")
+
+# The menu bar app watches a network printer, not a Datecs register, and logs quietly
+MAC_DEFAULTS = {
+    "targets": [{"ip": "192.168.1.100"}],
+    "port": 9100,
+    "log_level": "WARNING",
+}
 
 class UnifiedMonitor(rumps.App):
     def __init__(self):
         super(UnifiedMonitor, self).__init__("Monitor", "🖨️")
-        self.config_path = os.path.expanduser("~/.config/fprint_monitor/config.json")
-        self.load_config()
+        self.settings = SettingsManager(config_dir=CONFIG_DIR, defaults=MAC_DEFAULTS)
+        self.config = self.settings.settings
+        self.config_path = self.settings.get_config_path()
+        level = os.environ.get("FPRINT_MONITOR_LOG_LEVEL", self.config["log_level"]).upper()
+        set_log_level(level)
+
+        # The printer is the first target; the core probes it in the background
+        self.core = MonitorCore(self.settings)
+        self.core.create_monitors()
+
+        self.fprint = FPrintSupervisor(port=self.config.get("fprint_port"))
+        # Starting or stopping FPrint can take seconds; one such action runs at a time
+        self._fprint_busy = threading.Lock()
+        self.locator = FPrintLocator(self.config, self.save_config)
 
         self.menu = [
             rumps.MenuItem("FPrint Status: Checking...", callback=None),
@@ -21,10 +52,14 @@ class UnifiedMonitor(rumps.App):
             rumps.MenuItem("Restart FPrint", callback=self.restart_fprint),
             rumps.separator,
             rumps.MenuItem("Settings", callback=self.show_settings),
+            rumps.MenuItem("Debug Logging", callback=self.toggle_debug_logging),
             rumps.MenuItem("Quit All", callback=self.quit_all)
         ]
+        self.menu["Debug Logging"].state = logger.isEnabledFor(logging.DEBUG)
 
-        # Start monitoring
+        # Start monitoring; the first probe runs off the main thread
+        threading.Thread(target=self.core.start, daemon=True).start()
+        self.core.start_services(reload=self.reload_settings)
         self.timer = rumps.Timer(self.check_status, 5)
         self.timer.start()
 
@@ -32,58 +67,32 @@ class UnifiedMonitor(rumps.App):
         self.check_status(None)
 
         # Auto-start FPrint if not running
-        if not self.check_fprint_running():
-            self.start_fprint(None)
+        self.start_fprint(None, quiet=True)
 
-    def load_config(self):
-        """Load configuration from file"""
-        default_config = {
-            "printer_ip": "192.168.1.100",
-            "printer_port": 9100
-        }
-
-        try:
-            os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
-            if os.path.exists(self.config_path):
-                with open(self.config_path, 'r') as f:
-                    self.config = json.load(f)
-            else:
-                self.config = default_config
-                self.save_config()
-        except:
-            self.config = default_config
+        # Find installs and warm the launch environment off the main thread
+        if self.config.get("fprint_indexer", True):
+            self.locator.start_indexer(
+                on_done=lambda: self.locator.find_wine(self.fprint.environment.get("PATH")))
 
     def save_config(self):
         """Save configuration to file"""
-        try:
-            os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
-            with open(self.config_path, 'w') as f:
-                json.dump(self.config, f, indent=2)
-        except:
-            pass
+        self.settings.save_settings()
+
+    def reload_settings(self):
+        """Re-read the config file and restart monitoring (also used by the control API)"""
+        errors = self.settings.reload_settings()
+        self.config = self.locator.config = self.settings.settings
+        self.core.restart()
+        return errors
 
     def check_fprint_running(self):
         """Check if FPrint.exe is running"""
-        result = subprocess.run(
-            ["pgrep", "-f", "FPrint.exe"],
-            capture_output=True,
-            text=True
-        )
-        print(f"[DEBUG] pgrep FPrint.exe: returncode={result.returncode}, stdout='{result.stdout.strip()}', stderr='{result.stderr.strip()}'")
-        return result.returncode == 0
+        return self.fprint.is_running()
 
     def check_printer_connection(self):
-        """Check if printer is accessible"""
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(2)
-            result = sock.connect_ex((self.config["printer_ip"], self.config["printer_port"]))
-            sock.close()
-            print(f"[DEBUG] Printer socket connect to {self.config['printer_ip']}:{self.config['printer_port']}: result={result} (0=success)")
-            return result == 0
-        except Exception as e:
-            print(f"[DEBUG] Printer connection error: {e}")
-            return False
+        """Check if printer is accessible (last result of the background probe)"""
+        status = self.core.get_status(self.core.monitor.target) if self.core.monitor else {}
+        return bool(status.get("state") is not None and status.get("connected"))
 
     def check_status(self, _):
         """Check status of both systems"""
@@ -91,8 +100,8 @@ class UnifiedMonitor(rumps.App):
         printer_connected = self.check_printer_connection()
 
         # Debug logging
-        print(f"[DEBUG] FPrint running: {fprint_running}, Printer connected: {printer_connected}")
-        print(f"[DEBUG] Printer config: {self.config['printer_ip']}:{self.config['printer_port']}")
+        logger.debug("FPrint running: %s, Printer %s connected: %s", fprint_running,
+                     self.core.monitor and self.core.monitor.target, printer_connected)
 
         # Update menu items
         fprint_status = "✅ Running" if fprint_running else "❌ Not Running"
@@ -114,10 +123,11 @@ class UnifiedMonitor(rumps.App):
 
     def show_settings(self, _):
         """Show settings dialog"""
+        primary = self.settings.get_primary_target()
         window = rumps.Window(
             title="Monitor Settings",
-            message=f"Enter printer IP address and port:\n\nCurrent: {self.config['printer_ip']}:{self.config['printer_port']}",
-            default_text=f"{self.config['printer_ip']}:{self.config['printer_port']}",
+            message=f"Enter printer IP address and port:\n\nCurrent: {primary['ip']}:{primary['port']}",
+            default_text=f"{primary['ip']}:{primary['port']}",
             ok="Save",
             cancel="Cancel",
             dimensions=(300, 24)
@@ -128,13 +138,20 @@ class UnifiedMonitor(rumps.App):
             try:
                 parts = response.text.split(":")
                 if len(parts) == 2:
-                    self.config["printer_ip"] = parts[0].strip()
-                    self.config["printer_port"] = int(parts[1].strip())
+                    ip = parts[0].strip()
+                    port = int(parts[1].strip())
+                    self.settings.set_primary_target(ip, port, primary["interval"])
+                    errors = self.settings.validate_settings()
+                    if errors:
+                        self.reload_settings()
+                        rumps.alert("\n".join(errors.values()))
+                        return
                     self.save_config()
+                    self.core.restart()
                     rumps.notification(
                         title="Settings Saved",
                         subtitle="Configuration updated",
-                        message=f"Printer: {self.config['printer_ip']}:{self.config['printer_port']}"
+                        message=f"Printer: {ip}:{port}"
                     )
                     # Re-check status immediately
                     self.check_status(None)
@@ -143,138 +160,122 @@ class UnifiedMonitor(rumps.App):
             except ValueError:
                 rumps.alert("Invalid port number. Port must be a number (e.g., 9100)")
 
+    def toggle_debug_logging(self, sender):
+        """Switch debug output on or off without restarting"""
+        sender.state = not sender.state
+        self.config["log_level"] = "DEBUG" if sender.state else "WARNING"
+        set_log_level(self.config["log_level"])
+        self.save_config()
+
     def _find_fprint_dir(self):
         """Find the FPrintWIN directory containing FPrint.exe"""
-        print("[DEBUG] Looking for FPrint.exe...")
-
-        # Check if we have a saved path in config
-        if "fprint_dir" in self.config:
-            saved_path = self.config["fprint_dir"]
-            print(f"[DEBUG] Checking saved path: {saved_path}")
-            if os.path.exists(os.path.join(saved_path, "FPrint.exe")):
-                print(f"[DEBUG] Found FPrint.exe at saved path")
-                return saved_path
-
-        # Try relative path (when running from source)
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        fprint_dir = os.path.dirname(script_dir)
-        print(f"[DEBUG] Script dir: {script_dir}")
-        print(f"[DEBUG] Trying relative path: {fprint_dir}")
-        if os.path.exists(os.path.join(fprint_dir, "FPrint.exe")):
-            print(f"[DEBUG] Found FPrint.exe at relative path")
-            return fprint_dir
-
-        # Try common locations
-        common_paths = [
-            os.path.expanduser("~/Downloads/FPrintWIN"),
-            os.path.expanduser("~/FPrintWIN"),
-            "/Applications/FPrintWIN",
-            os.path.expanduser("~/Desktop/FPrintWIN"),
-        ]
-        for path in common_paths:
-            print(f"[DEBUG] Trying: {path}")
-            if os.path.exists(os.path.join(path, "FPrint.exe")):
-                print(f"[DEBUG] Found FPrint.exe at: {path}")
-                # Save found path to config
-                self.config["fprint_dir"] = path
-                self.save_config()
-                return path
-
-        print("[DEBUG] FPrint.exe not found in any location")
-        return None
+        return self.locator.find_fprint_dir()
+
+    def _in_background(self, action, *args):
+        """Run a slow FPrint action off the rumps main thread so the menu stays responsive"""
+        if not self._fprint_busy.acquire(blocking=False):
+            rumps.alert("FPrint is already being started or stopped")
+            return
+
+        def run():
+            try:
+                action(*args)
+            except Exception as e:
+                logger.exception("FPrint action failed")
+                callAfter(rumps.alert, f"FPrint action failed: {str(e)}")
+            finally:
+                self._fprint_busy.release()
+                callAfter(self.check_status, None)
+
+        threading.Thread(target=run, daemon=True).start()
 
     def _launch_fprint(self):
-        """Internal method to launch FPrint.exe via wine"""
+        """Internal method to launch FPrint.exe via wine. Runs on a worker thread."""
         fprint_dir = self._find_fprint_dir()
 
         if not fprint_dir:
-            rumps.alert("FPrint.exe not found. Please ensure FPrintWIN folder is in Downloads, Desktop, or Home folder.")
+            callAfter(rumps.alert, "FPrint.exe not found. Please ensure FPrintWIN folder is in Downloads, Desktop, or Home folder.")
             return False
 
-        fprint_exe = os.path.join(fprint_dir, "FPrint.exe")
-
-        # Use wine from homebrew directly
-        wine_path = "/opt/homebrew/bin/wine"
-        if not os.path.exists(wine_path):
-            wine_path = "/usr/local/bin/wine"
-        if not os.path.exists(wine_path):
-            wine_path = shutil.which("wine")
-
-        if not wine_path or not os.path.exists(wine_path):
-            rumps.alert("Wine not found. Please install wine via Homebrew: brew install wine-stable")
+        wine_path = self.locator.find_wine(self.fprint.environment.get("PATH"))
+        if not wine_path:
+            callAfter(rumps.alert, "Wine not found. Please install wine via Homebrew: brew install wine-stable")
             return False
 
-        print(f"[DEBUG] Launching FPrint from: {fprint_dir}")
-        print(f"[DEBUG] Wine path: {wine_path}")
-
-        # Use nohup + bash -l (login shell) to get full environment
-        cmd = f'nohup /bin/bash -l -c \'cd "{fprint_dir}" && "{wine_path}" FPrint.exe\' > /dev/null 2>&1 &'
-        print(f"[DEBUG] Running: {cmd}")
-
-        subprocess.Popen(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            self.fprint.start(fprint_dir, wine_path)
+        except OSError:
+            self.locator.invalidate()
+            raise
         return True
 
-    def start_fprint(self, _):
+    def start_fprint(self, _, quiet=False):
         """Start FPrint.exe if not running"""
-        if not self.check_fprint_running():
-            try:
-                if self._launch_fprint():
-                    # Wait for Wine to initialize
-                    time.sleep(4)
-                    self.check_status(None)
-
-                    if self.check_fprint_running():
-                        rumps.notification(
-                            title="FPrint Started",
-                            subtitle="",
-                            message="FPrint.exe has been started successfully"
-                        )
-                    else:
-                        rumps.alert("FPrint.exe may have failed to start. Please try again.")
-            except Exception as e:
-                rumps.alert(f"Failed to start FPrint: {str(e)}")
-        else:
-            rumps.alert("FPrint is already running")
+        self._in_background(self._start_fprint, quiet)
+
+    def _start_fprint(self, quiet):
+        if self.check_fprint_running():
+            if not quiet:
+                callAfter(rumps.alert, "FPrint is already running")
+            return
+        started = time.monotonic()
+        if self._launch_fprint():
+            ready = self.fprint.wait_ready()
+            elapsed = time.monotonic() - started
+
+            if ready:
+                logger.info("FPrint started in %.2fs", elapsed)
+                callAfter(rumps.notification, title="FPrint Started", subtitle="",
+                          message=f"FPrint.exe has been started successfully ({elapsed:.1f}s)")
+            else:
+                self.locator.invalidate()
+                callAfter(rumps.alert, "FPrint.exe may have failed to start. Please try again.")
 
     def restart_fprint(self, _):
         """Restart FPrint.exe"""
-        print("[DEBUG] Restarting FPrint...")
-
-        # Kill ALL wine-related processes thoroughly
-        subprocess.run(["pkill", "-9", "-f", "FPrint.exe"], stderr=subprocess.DEVNULL)
-        subprocess.run(["pkill", "-9", "-f", "wine"], stderr=subprocess.DEVNULL)
-        subprocess.run(["pkill", "-9", "-f", "wineserver"], stderr=subprocess.DEVNULL)
-        subprocess.run(["pkill", "-9", "-f", "winedevice"], stderr=subprocess.DEVNULL)
-
-        # Wait for processes to fully terminate
-        time.sleep(3)
-
-        print("[DEBUG] All wine processes killed, starting FPrint...")
-
-        try:
-            if self._launch_fprint():
-                # Wait for Wine to initialize
-                time.sleep(4)
-                self.check_status(None)
-
-                if self.check_fprint_running():
-                    rumps.notification(
-                        title="FPrint Restarted",
-                        subtitle="",
-                        message="FPrint.exe has been restarted successfully"
-                    )
-                else:
-                    rumps.alert("FPrint.exe may have failed to restart. Please try again.")
-        except Exception as e:
-            rumps.alert(f"Failed to restart FPrint: {str(e)}")
+        self._in_background(self._restart_fprint)
+
+    def _restart_fprint(self):
+        logger.info("Restarting FPrint...")
+        started = time.monotonic()
+
+        # Graceful stop of FPrint's own process group only
+        if not self.fprint.stop():
+            logger.warning("Some FPrint processes could not be stopped")
+        stopped = time.monotonic()
+        logger.debug("FPrint stopped in %.2fs, starting FPrint...", stopped - started)
+
+        if self._launch_fprint():
+            ready = self.fprint.wait_ready()
+            elapsed = time.monotonic() - started
+
+            if ready:
+                self.fprint.last_restart = elapsed
+                logger.info("FPrint restarted in %.2fs (stop %.2fs, start %.2fs)",
+                            elapsed, stopped - started, elapsed - (stopped - started))
+                callAfter(rumps.notification, title="FPrint Restarted", subtitle="",
+                          message=f"FPrint.exe has been restarted successfully ({elapsed:.1f}s)")
+            else:
+                self.locator.invalidate()
+                callAfter(rumps.alert, "FPrint.exe may have failed to restart. Please try again.")
 
     def quit_all(self, _):
         """Quit monitoring and FPrint"""
-        # Kill FPrint.exe
-        subprocess.run(["pkill", "-f", "FPrint.exe"], stderr=subprocess.DEVNULL)
-        # Quit this app
-        rumps.quit_application()
+        self.title = "⏳"
+
+        def stop_and_quit():
+            # Let a start or restart in progress finish before stopping FPrint
+            with self._fprint_busy:
+                self.core.stop()
+                self.fprint.stop()
+            shutdown_logging()
+            callAfter(rumps.quit_application)
+
+        threading.Thread(target=stop_and_quit, daemon=True).start()
 
 if __name__ == "__main__":
+    # Same JSON-lines log as the Windows app, kept next to the config
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    setup_logging(log_file=os.path.join(CONFIG_DIR, "monitor.log"))
     app = UnifiedMonitor()
     app.run()
@@ -2,13 +2,36 @@
 Build script to create Windows executable using PyInstaller
 """
 
+import argparse
+import json
 import os
 import sys
 import shutil
 import subprocess
+import tempfile
+import time
 from pathlib import Path
 
 
+APP_NAME = 'CashRegisterMonitor'
+
+# Modules the tray never imports; PIL only needs Image, ImageDraw, ImageFont
+# and the ICO/PNG/BMP plugins pystray uses to hand icons to Windows
+STARTUP_EXCLUDES = [
+    'PIL.ImageTk', 'PIL.ImageQt', 'PIL.ImageShow', 'PIL.ImageGrab', 'PIL.ImageCms',
+    'PIL.ImageMath', 'PIL.ImageFilter', 'PIL.ImageEnhance', 'PIL.ImageOps', 'PIL._tkinter_finder',
+    'PIL.JpegImagePlugin', 'PIL.Jpeg2KImagePlugin', 'PIL.TiffImagePlugin', 'PIL.WebPImagePlugin',
+    'PIL.GifImagePlugin', 'PIL.PdfImagePlugin', 'PIL.EpsImagePlugin', 'PIL.PsdImagePlugin',
+    'PIL.SpiderImagePlugin', 'PIL.FpxImagePlugin', 'PIL.MicImagePlugin', 'PIL.AvifImagePlugin',
+    'numpy', 'unittest', 'pydoc', 'doctest', 'lib2to3', 'test',
+]
+
+# Tcl/Tk data the Tk dialogs do not need
+TK_PRUNE_DIRS = ('tzdata', 'demos', 'images', 'sample')
+TK_PRUNE_ENCODINGS = ('big5', 'gb', 'euc-', 'jis', 'shiftjis', 'ksc', 'cns', 'dingbats', 'macJapan',
+                      'macKorean', 'macChinese')
+
+
 def clean_build_directories():
     """Clean previous build directories"""
     directories_to_clean = ['build', 'dist', '__pycache__']
@@ -24,30 +47,144 @@ def clean_build_directories():
         spec_file.unlink()
 
 
-def build_executable():
-    """Build the executable using PyInstaller"""
-    
-    # Main script path
+def build_icons():
+    """Render the .ico files and the pre-rendered tray icon pack"""
+    print("Generating icons...")
+    try:
+        subprocess.run([sys.executable, os.path.join('cash_register_monitor', 'create_icons.py')],
+                       check=True)
+        return True
+    except subprocess.CalledProcessError:
+        print("ERROR: Icon generation failed (is Pillow installed?)")
+        return False
+
+
+def build_command(profile):
+    """PyInstaller command line for a build profile"""
     main_script = os.path.join('cash_register_monitor', 'main.py')
-    
-    # Icon path
     icon_path = os.path.join('cash_register_monitor', 'icons', 'connected.ico')
     
-    # PyInstaller command
-    cmd = [
-        'pyinstaller',
-        '--onefile',                    # Create a single executable file
+    if profile == 'startup':
+        # -OO strips docstrings and asserts from the collected bytecode
+        cmd = [sys.executable, '-OO', '-m', 'PyInstaller',
+               '--onedir',                  # No unpacking to a temp dir on every launch
+               '--noupx']                   # Compressed DLLs load slower
+        cmd += [f'--exclude-module={module}' for module in STARTUP_EXCLUDES]
+    else:
+        cmd = ['pyinstaller',
+               '--onefile',                 # Create a single executable file
+               '--hidden-import=PIL._tkinter_finder']
+    
+    cmd += [
         '--windowed',                   # Don't show console window
-        '--name=CashRegisterMonitor',   # Executable name
-        f'--icon={icon_path}',         # Application icon
-        '--add-data=cash_register_monitor/icons;icons',  # Include icon files
+        f'--name={APP_NAME}',           # Executable name
+        f'--icon={icon_path}',          # Application icon
+        f'--add-data=cash_register_monitor/icons{os.pathsep}icons',  # Include icon files
         '--hidden-import=pystray._win32',  # Include hidden imports
-        '--hidden-import=PIL._tkinter_finder',
         '--clean',                      # Clean cache
         main_script
     ]
+    return cmd
+
+
+def get_executable_path(profile):
+    """Where PyInstaller puts the executable for a profile"""
+    exe_name = APP_NAME + ('.exe' if sys.platform == 'win32' else '')
+    if profile == 'startup':
+        return os.path.join('dist', APP_NAME, exe_name)
+    return os.path.join('dist', exe_name)
+
+
+def prune_tk_data(bundle_dir):
+    """Remove Tcl/Tk files the settings and status windows never load.
     
-    print("Building executable with PyInstaller...")
+    Returns:
+        Number of bytes removed
+    """
+    removed = 0
+    for root, dirs, files in os.walk(bundle_dir):
+        parts = Path(root).parts
+        if not any(part in ('_tcl_data', '_tk_data', 'tcl', 'tk') or part.startswith(('tcl8', 'tk8'))
+                   for part in parts):
+            continue
+        for name in list(dirs):
+            if name in TK_PRUNE_DIRS:
+                path = os.path.join(root, name)
+                removed += directory_size(path)
+                shutil.rmtree(path)
+                dirs.remove(name)
+        if os.path.basename(root) == 'encoding':
+            for name in files:
+                if name.startswith(TK_PRUNE_ENCODINGS):
+                    path = os.path.join(root, name)
+                    removed += os.path.getsize(path)
+                    os.remove(path)
+    return removed
+
+
+def directory_size(path):
+    """Total size of all files below path"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path)
+        for name in files
+    )
+
+
+def measure_startup(exe_path, runs=3):
+    """Launch the executable with --startup-benchmark and time it.
+    
+    The first run is reported as the cold start (nothing in the OS file cache
+    from this build yet), the rest as warm starts.
+    
+    Returns:
+        List of dicts with wall-clock 'wall_ms' and the app's own 'phases_ms'
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i in range(runs):
+            report_path = os.path.join(tmp_dir, f'startup_{i}.json')
+            started = time.perf_counter()
+            subprocess.run([os.path.abspath(exe_path), '--startup-benchmark', report_path],
+                           check=True, timeout=120)
+            wall_ms = (time.perf_counter() - started) * 1000
+            with open(report_path) as f:
+                reported = json.load(f)
+            results.append({'wall_ms': wall_ms, **reported})
+    return results
+
+
+def print_build_report(profile, exe_path, pruned_bytes=0):
+    """Print executable size and measured start-up time"""
+    bundle = os.path.dirname(exe_path) if profile == 'startup' else exe_path
+    print("\n=== Build Report ===")
+    print(f"Profile: {profile}")
+    print(f"Executable size: {os.path.getsize(exe_path) / 1024 / 1024:.1f} MB")
+    if profile == 'startup':
+        print(f"Bundle size: {directory_size(bundle) / 1024 / 1024:.1f} MB "
+              f"({pruned_bytes / 1024 / 1024:.1f} MB of Tcl/Tk data pruned)")
+    
+    try:
+        results = measure_startup(exe_path)
+    except (OSError, subprocess.SubprocessError, ValueError) as e:
+        print(f"Start-up time: not measured ({e})")
+        return
+    
+    cold, warm = results[0], results[1:]
+    print(f"Cold start: {cold['wall_ms']:.0f} ms (app ready after {cold['total_ms']:.0f} ms in main)")
+    if warm:
+        warm_ms = sorted(r['wall_ms'] for r in warm)[len(warm) // 2]
+        print(f"Warm start: {warm_ms:.0f} ms (median of {len(warm)})")
+    print("Phases (cold): " + ", ".join(f"{k} {v:.0f} ms" for k, v in cold['phases_ms'].items()))
+
+
+def build_executable(profile='onefile'):
+    """Build the executable using PyInstaller"""
+    cmd = build_command(profile)
+    
+    print(f"Building executable with PyInstaller ({profile} profile)...")
     print(f"Command: {' '.join(cmd)}")
     
     try:
@@ -56,10 +193,11 @@ def build_executable():
         print("Output:", result.stdout)
         
         # Check if executable was created
-        exe_path = os.path.join('dist', 'CashRegisterMonitor.exe')
+        exe_path = get_executable_path(profile)
         if os.path.exists(exe_path):
             print(f"Executable created: {exe_path}")
-            print(f"File size: {os.path.getsize(exe_path) / 1024 / 1024:.1f} MB")
+            pruned = prune_tk_data(os.path.dirname(exe_path)) if profile == 'startup' else 0
+            print_build_report(profile, exe_path, pruned)
             return True
         else:
             print("ERROR: Executable not found in expected location")
@@ -74,9 +212,15 @@ def build_executable():
         return False
 
 
-def create_installer_script():
+def create_installer_script(profile='onefile'):
     """Create a simple NSIS installer script"""
     
+    # A one-folder build installs the whole directory
+    if profile == 'startup':
+        install_files = f'File /r "dist\\{APP_NAME}\\*"'
+    else:
+        install_files = 'File "dist\\${APP_EXE}"'
+    
     nsis_script = '''
 ; Cash Register Monitor Installer Script
 ; Generated by build script
@@ -96,7 +240,7 @@ Page instfiles
 
 Section "Install"
     SetOutPath $INSTDIR
-    File "dist\\${APP_EXE}"
+    INSTALL_FILES
     
     ; Create uninstaller
     WriteUninstaller "$INSTDIR\\Uninstall.exe"
@@ -125,6 +269,9 @@ Section "Uninstall"
     DeleteRegKey HKLM "Software\\Microsoft\\Windows\\CurrentVersion\\Uninstall\\${APP_NAME}"
 SectionEnd
 '''
+    nsis_script = nsis_script.replace('INSTALL_FILES', install_files)
+    if profile == 'startup':
+        nsis_script = nsis_script.replace('RMDir "$INSTDIR"', 'RMDir /r "$INSTDIR"')
     
     with open('installer.nsi', 'w') as f:
         f.write(nsis_script)
@@ -135,6 +282,11 @@ SectionEnd
 
 def main():
     """Main build function"""
+    parser = argparse.ArgumentParser(description="Build the Cash Register Monitor executable")
+    parser.add_argument("--profile", choices=["onefile", "startup"], default="onefile",
+                        help="onefile: single portable exe; startup: one-folder build tuned for launch time")
+    args = parser.parse_args()
+    
     print("=== Cash Register Monitor Build Script ===")
     
     # Check if we're in the right directory
@@ -157,16 +309,21 @@ def main():
     # Clean previous builds
     clean_build_directories()
     
+    # Icons are a build artifact; the app only loads them
+    if not build_icons():
+        sys.exit(1)
+    
     # Build executable
-    if build_executable():
+    if build_executable(args.profile):
+        exe_path = get_executable_path(args.profile)
         print("\\n=== Build Complete ===")
-        print("Executable location: dist/CashRegisterMonitor.exe")
+        print(f"Executable location: {exe_path}")
         
         # Create installer script
-        create_installer_script()
+        create_installer_script(args.profile)
         
         print("\\nNext steps:")
-        print("1. Test the executable: dist/CashRegisterMonitor.exe")
+        print(f"1. Test the executable: {exe_path}")
         print("2. (Optional) Create installer using NSIS: makensis installer.nsi")
         
     else:
@@ -31,6 +31,14 @@ if exist "build" rmdir /s /q "build"
 if exist "dist" rmdir /s /q "dist"
 if exist "*.spec" del "*.spec"
 
+echo Generating icons...
+python cash_register_monitor\create_icons.py
+if errorlevel 1 (
+    echo ERROR: Icon generation failed! Is Pillow installed?
+    pause
+    exit /b 1
+)
+
 echo.
 echo Building executable...
 echo This may take a few minutes...
@@ -3,17 +3,30 @@ Datecs Cash Register Monitor
 
 A Windows system tray application that continuously monitors 
 Datecs cash register connectivity and provides real-time visual feedback.
+The monitoring core has no GUI dependencies and is shared with the macOS
+menu bar app and the headless mode.
 """
 
 __version__ = "1.0.0"
 __author__ = "Dimitar Klaturov"
 
 from .connection_monitor import ConnectionMonitor
+from .event_dispatcher import EventDispatcher
+from .monitor_core import MonitorCore
 from .settings_manager import SettingsManager
-from .tray_application import TrayApplication
 
 __all__ = [
     "ConnectionMonitor",
+    "EventDispatcher",
+    "MonitorCore",
     "SettingsManager", 
     "TrayApplication"
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    # The tray needs pystray and tkinter; import it only when asked for
+    if name == "TrayApplication":
+        from .tray_application import TrayApplication
+        return TrayApplication
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,513 @@
+"""
+Central aggregator for the monitors of many stores
+
+Every store's monitor reports to one aggregator (see status_reporter): a
+compressed JSON report over HTTP (POST /report, gzip) or UDP (one
+zlib-compressed datagram). Reports are deltas holding only the registers
+whose state changed, plus a full report every few minutes and whenever the
+aggregator asks for one because it missed a report or restarted. The
+aggregator keeps every register in memory, indexed by store, state and
+outage start, so a fleet-wide query only touches the registers it returns:
+
+    GET /registers?store=&state=&down_for=300&limit=   matching registers
+    GET /stores                                        counts per store
+    GET /summary                                       fleet totals
+    GET /transitions?store=&target=&since=&limit=      recent state changes
+
+Monitors also replay the state changes they spooled while the aggregator
+was unreachable (POST /transitions, see spool); the last TRANSITION_LOG of
+them are kept, once each.
+
+A source that has not reported for STALE_INTERVALS report intervals is
+marked stale, and so are its registers.
+"""
+
+import json
+import socket
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+try:
+    from .control_api import encode
+    from .logging_setup import get_logger
+    from .state_filter import STATE_DISCONNECTED
+except ImportError:
+    from control_api import encode
+    from logging_setup import get_logger
+    from state_filter import STATE_DISCONNECTED
+
+
+logger = get_logger(__name__)
+
+DEFAULT_PORT = 8770
+MAX_COMPRESSED = 4 * 1024 * 1024   # bytes accepted per report
+MAX_REPORT = 32 * 1024 * 1024      # bytes a report may decompress to
+STALE_INTERVALS = 3
+TRANSITION_LOG = 100000            # state changes kept for /transitions
+
+RegisterKey = Tuple[str, str]  # (source, target)
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (ValueError, TypeError):
+        return None
+
+
+def _text(value) -> Optional[str]:
+    """A reported label as a string; None for anything that is not a plain value"""
+    if isinstance(value, str) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return str(value)
+    return None
+
+
+def _flag(value) -> Optional[bool]:
+    return value if isinstance(value, bool) else None
+
+
+def decode_report(data: bytes, encoding: str = "zlib") -> Dict[str, Any]:
+    """Decompress ("zlib", "gzip" or "identity") and parse a report.
+
+    Raises:
+        ValueError: if the data is not a bounded, well-formed report
+    """
+    try:
+        if encoding == "identity":
+            raw = data
+        else:
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS)
+            raw = inflater.decompress(data, MAX_REPORT)
+            if inflater.unconsumed_tail:
+                raise ValueError("Report too large")
+        report = json.loads(raw.decode("utf-8"))
+    except zlib.error as e:
+        raise ValueError(f"Bad compression: {e}")
+    except UnicodeDecodeError:
+        raise ValueError("Report is not UTF-8")
+    if not isinstance(report, dict) or not isinstance(report.get("source"), str) \
+            or not isinstance(report.get("registers", []), list):
+        raise ValueError("Report needs a source and a list of registers")
+    return report
+
+
+class Register:
+    """Last reported state of one register"""
+
+    __slots__ = ("source", "target", "store", "name", "group", "state", "connected",
+                 "reason", "rtt", "since", "checked", "updated")
+
+    def __init__(self, source: str, target: str):
+        self.source = source
+        self.target = target
+        self.store = source
+        self.name = None
+        self.group = None
+        self.state = None
+        self.connected = None
+        self.reason = None
+        self.rtt = None
+        self.since = None
+        self.checked = None
+        self.updated = None
+
+    def to_dict(self, stale: bool = False) -> Dict[str, Any]:
+        result = {slot: getattr(self, slot) for slot in self.__slots__}
+        result["stale"] = stale
+        return result
+
+
+class Source:
+    """One reporting monitor"""
+
+    __slots__ = ("name", "session", "seq", "interval", "last_seen", "address", "targets")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.session = None
+        self.seq = None
+        self.interval = 10.0
+        self.last_seen = 0.0
+        self.address = None
+        self.targets = set()
+
+
+class FleetTable:
+    """Every register of every store, with indexes for fleet queries"""
+
+    def __init__(self, stale_intervals: int = STALE_INTERVALS):
+        self.stale_intervals = stale_intervals
+        self.registers: Dict[RegisterKey, Register] = {}
+        self.sources: Dict[str, Source] = {}
+        self.by_store: Dict[str, set] = defaultdict(set)
+        self.by_state: Dict[Optional[str], set] = defaultdict(set)
+        self.store_counts: Dict[str, Counter] = defaultdict(Counter)
+        # Outage start of every disconnected register
+        self.down: Dict[RegisterKey, float] = {}
+        self.transitions: "deque[Dict[str, Any]]" = deque(maxlen=TRANSITION_LOG)
+        self._last_transition: Dict[RegisterKey, float] = {}
+        self.reports = 0
+        self._lock = threading.Lock()
+
+    def apply(self, report: Dict[str, Any], address: str = None,
+              now: Optional[float] = None) -> bool:
+        """Merge one report; returns whether the source should send a full report"""
+        now = time.time() if now is None else now
+        full = bool(report.get("full"))
+        try:
+            seq = int(report.get("seq", 0))
+            interval = float(report.get("interval", 10.0))
+        except (ValueError, TypeError):
+            raise ValueError("Report seq and interval must be numbers")
+        with self._lock:
+            source = self.sources.get(report["source"])
+            if source is None:
+                source = self.sources[report["source"]] = Source(report["source"])
+            session = report.get("session")
+            if session != source.session:
+                # The reporter restarted: its sequence numbers start over
+                source.session = session
+                source.seq = None
+            elif not full and source.seq is not None and seq <= source.seq:
+                return False  # duplicate or reordered datagram
+            resync = not full and (source.seq is None or seq != source.seq + 1)
+            source.seq = seq
+            source.interval = interval
+            source.last_seen = now
+            source.address = address
+            self.reports += 1
+
+            seen = set()
+            for entry in report.get("registers", ()):
+                if isinstance(entry, dict) and isinstance(entry.get("target"), str):
+                    self._upsert(source, entry, now)
+                    seen.add(entry["target"])
+            if full:
+                for target in source.targets - seen:
+                    self._remove((source.name, target))
+                source.targets = seen
+            else:
+                source.targets |= seen
+        return resync
+
+    def add_transitions(self, source: str, transitions: List[Any]) -> int:
+        """Log replayed state changes; returns how many were new"""
+        added = 0
+        with self._lock:
+            for entry in transitions:
+                if not isinstance(entry, dict) or not isinstance(entry.get("target"), str):
+                    continue
+                timestamp = _number(entry.get("timestamp"))
+                key = (source, entry["target"])
+                # A register's changes are spooled in order, so an older one is a replay
+                if timestamp is None or timestamp <= self._last_transition.get(key, 0.0):
+                    continue
+                self._last_transition[key] = timestamp
+                self.transitions.append({
+                    "source": source,
+                    "target": entry["target"],
+                    "store": _text(entry.get("store")) or source,
+                    "state": _text(entry.get("state")),
+                    "connected": _flag(entry.get("connected")),
+                    "reason": _text(entry.get("reason")),
+                    "timestamp": timestamp,
+                })
+                added += 1
+        return added
+
+    def query_transitions(self, store: str = None, target: str = None, since: float = None,
+                          limit: int = None) -> List[Dict[str, Any]]:
+        """Logged state changes matching every given filter, oldest first"""
+        with self._lock:
+            results = [entry for entry in self.transitions
+                       if (store is None or entry["store"] == store)
+                       and (target is None or entry["target"] == target)
+                       and (since is None or entry["timestamp"] >= since)]
+        results.sort(key=lambda entry: entry["timestamp"])
+        return results[-limit:] if limit else results
+
+    def _upsert(self, source: Source, entry: Dict[str, Any], now: float):
+        key = (source.name, entry["target"])
+        register = self.registers.get(key)
+        if register is None:
+            register = self.registers[key] = Register(*key)
+        else:
+            self._unindex(key, register)
+        # Reports come off the network: labels are coerced so they can always be indexed
+        register.store = _text(entry.get("store")) or source.name
+        register.name = _text(entry.get("name"))
+        register.group = _text(entry.get("group"))
+        register.state = _text(entry.get("state"))
+        register.connected = _flag(entry.get("connected"))
+        register.reason = _text(entry.get("reason"))
+        register.rtt = _number(entry.get("rtt"))
+        register.since = _number(entry.get("since"))
+        register.checked = _number(entry.get("checked"))
+        register.updated = now
+        self._index(key, register)
+
+    def _index(self, key: RegisterKey, register: Register):
+        self.by_store[register.store].add(key)
+        self.by_state[register.state].add(key)
+        self.store_counts[register.store][register.state] += 1
+        if register.state == STATE_DISCONNECTED:
+            self.down[key] = register.since or register.updated
+
+    def _unindex(self, key: RegisterKey, register: Register):
+        self.by_store[register.store].discard(key)
+        self.by_state[register.state].discard(key)
+        counts = self.store_counts[register.store]
+        counts[register.state] -= 1
+        if not +counts:
+            del self.store_counts[register.store]
+            del self.by_store[register.store]
+        self.down.pop(key, None)
+
+    def _remove(self, key: RegisterKey):
+        register = self.registers.pop(key, None)
+        if register is not None:
+            self._unindex(key, register)
+
+    def is_stale(self, source: Optional[Source], now: float) -> bool:
+        return source is None or now - source.last_seen > source.interval * self.stale_intervals
+
+    def query(self, store: str = None, state: str = None, down_for: float = None,
+              limit: int = None, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Registers matching every given filter.
+
+        Args:
+            store: Only registers of this store
+            state: Only registers in this state
+            down_for: Only registers disconnected for at least this many
+                seconds, longest outage first
+            limit: Return at most this many
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            # Start from the smallest index that applies
+            if down_for is not None:
+                cutoff = now - down_for
+                keys = [key for key, since in self.down.items() if since <= cutoff]
+                keys.sort(key=self.down.__getitem__)
+            elif state is not None:
+                keys = list(self.by_state.get(state, ()))
+            elif store is not None:
+                keys = list(self.by_store.get(store, ()))
+            else:
+                keys = list(self.registers)
+            results = []
+            for key in keys:
+                register = self.registers[key]
+                if (store is not None and register.store != store) or \
+                        (state is not None and register.state != state):
+                    continue
+                results.append(register.to_dict(self.is_stale(self.sources.get(key[0]), now)))
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def stores(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Register counts per store and state"""
+        now = time.time() if now is None else now
+        with self._lock:
+            stale_sources = {name for name, source in self.sources.items()
+                             if self.is_stale(source, now)}
+            result = []
+            for store, counts in sorted(self.store_counts.items()):
+                sources = {key[0] for key in self.by_store[store]}
+                result.append({
+                    "store": store,
+                    "total": sum(counts.values()),
+                    "states": {str(state): n for state, n in counts.items() if n},
+                    "down": counts[STATE_DISCONNECTED],
+                    "stale": bool(sources & stale_sources),
+                })
+        return result
+
+    def summary(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Fleet totals"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return {
+                "registers": len(self.registers),
+                "stores": len(self.store_counts),
+                "sources": len(self.sources),
+                "stale_sources": sorted(name for name, source in self.sources.items()
+                                        if self.is_stale(source, now)),
+                "states": {str(state): len(keys) for state, keys in self.by_state.items() if keys},
+                "down": len(self.down),
+                "reports": self.reports,
+            }
+
+
+class AggregatorServer:
+    """Receive reports over HTTP and UDP on one port and answer queries"""
+
+    def __init__(self, table: FleetTable = None, host: str = "0.0.0.0",
+                 port: int = DEFAULT_PORT, token: str = None):
+        """
+        Args:
+            table: Fleet table to update; a new one is created if omitted
+            host: Listen address
+            port: TCP port for HTTP and UDP port for datagrams
+            token: Shared secret reports must carry, if set
+        """
+        self.table = table or FleetTable()
+        self.host = host
+        self.port = port
+        self.token = token or None
+        self.http = None
+        self.udp = None
+        self.running = False
+
+    def start(self) -> bool:
+        try:
+            self.http = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+            self.port = self.http.server_address[1]
+            self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp.bind((self.host, self.port))
+        except OSError as e:
+            logger.error("Could not start aggregator: %s", e, extra={"port": self.port})
+            if self.http is not None:
+                self.http.server_close()
+            return False
+        self.http.daemon_threads = True
+        self.udp.settimeout(1.0)
+        self.running = True
+        threading.Thread(target=self.http.serve_forever, name="aggregator-http", daemon=True).start()
+        threading.Thread(target=self._udp_loop, name="aggregator-udp", daemon=True).start()
+        logger.info("Aggregator listening", extra={"host": self.host, "port": self.port})
+        return True
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.http.shutdown()
+        self.http.server_close()
+        self.udp.close()
+
+    def receive(self, report: Dict[str, Any], address: str) -> bool:
+        """Check the token and apply a report; returns whether a resync is needed
+
+        Raises:
+            ValueError: if the report is rejected
+        """
+        if self.token is not None and report.get("token") != self.token:
+            raise ValueError("Invalid token")
+        return self.table.apply(report, address)
+
+    def receive_transitions(self, report: Dict[str, Any]) -> int:
+        """Check the token and log replayed transitions; returns how many were new
+
+        Raises:
+            ValueError: if the report is rejected
+        """
+        if self.token is not None and report.get("token") != self.token:
+            raise ValueError("Invalid token")
+        if not isinstance(report.get("transitions"), list):
+            raise ValueError("Report needs a list of transitions")
+        return self.table.add_transitions(report["source"], report["transitions"])
+
+    def _udp_loop(self):
+        while self.running:
+            try:
+                data, address = self.udp.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                self.receive(decode_report(data), address[0])
+            except ValueError as e:
+                logger.warning("Rejected report: %s", e, extra={"address": address[0]})
+            except Exception:
+                # One bad datagram must not stop the listener
+                logger.exception("Could not apply report", extra={"address": address[0]})
+
+
+def _make_handler(server: AggregatorServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug("Aggregator request: " + format, *args)
+
+        def send_json(self, status: int, message: Any):
+            body = encode(message)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            if len(body) > 1024 and "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = zlib.compress(body, wbits=16 + zlib.MAX_WBITS)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            if path not in ("/report", "/transitions"):
+                self.send_json(404, {"ok": False, "error": "Not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = -1
+            if not 0 < length <= MAX_COMPRESSED:
+                self.send_json(413, {"ok": False, "error": "Bad report size"})
+                self.close_connection = True
+                return
+            data = self.rfile.read(length)
+            encoding = self.headers.get("Content-Encoding", "identity").lower()
+            if encoding == "deflate":
+                encoding = "zlib"
+            try:
+                if encoding not in ("gzip", "zlib", "identity"):
+                    raise ValueError(f"Unsupported Content-Encoding {encoding}")
+                report = decode_report(data, encoding)
+                if path == "/transitions":
+                    reply = {"ok": True, "added": server.receive_transitions(report)}
+                else:
+                    reply = {"ok": True, "resync": server.receive(report, self.client_address[0])}
+            except ValueError as e:
+                logger.warning("Rejected report: %s", e, extra={"address": self.client_address[0]})
+                self.send_json(400, {"ok": False, "error": str(e)})
+                return
+            self.send_json(200, reply)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            table = server.table
+            if url.path == "/registers":
+                try:
+                    down_for = float(query["down_for"]) if "down_for" in query else None
+                    limit = int(query["limit"]) if "limit" in query else None
+                except ValueError:
+                    self.send_json(400, {"ok": False, "error": "down_for and limit must be numbers"})
+                    return
+                registers = table.query(query.get("store"), query.get("state"), down_for, limit)
+                self.send_json(200, {"count": len(registers), "registers": registers})
+            elif url.path == "/stores":
+                self.send_json(200, {"stores": table.stores()})
+            elif url.path == "/summary":
+                self.send_json(200, table.summary())
+            elif url.path == "/transitions":
+                try:
+                    since = float(query["since"]) if "since" in query else None
+                    limit = int(query["limit"]) if "limit" in query else None
+                except ValueError:
+                    self.send_json(400, {"ok": False, "error": "since and limit must be numbers"})
+                    return
+                transitions = table.query_transitions(query.get("store"), query.get("target"), since, limit)
+                self.send_json(200, {"count": len(transitions), "transitions": transitions})
+            else:
+                self.send_json(404, {"ok": False, "error": "Not found"})
+
+    return Handler
@@ -0,0 +1,225 @@
+"""
+Dependency-aware alert correlation for grouped registers
+
+When a store switch dies every register behind it goes down at once.
+AlertCorrelator sits between the monitors and the alert consumers: register
+down events are held for a short window, and if every register under a
+switch (or every switch in a store) is down by then, one group event is
+emitted instead of one event per register. Per-node down counters are kept
+incrementally, so a transition costs O(depth) and collapsing a group costs
+O(group size).
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+try:
+    from .logging_setup import get_logger
+except ImportError:
+    from logging_setup import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class _Node:
+    """A store or switch in the topology tree"""
+
+    __slots__ = ("name", "level", "parent", "children", "down", "reported_down")
+
+    def __init__(self, name: str, level: str, parent: Optional["_Node"] = None):
+        self.name = name
+        self.level = level
+        self.parent = parent
+        self.children: List[Any] = []  # _Node or register target strings
+        self.down = 0  # number of children currently down
+        self.reported_down = False
+
+    @property
+    def all_down(self) -> bool:
+        return bool(self.children) and self.down == len(self.children)
+
+
+class AlertCorrelator:
+    """Collapse simultaneous outages of a topology group into one event"""
+
+    def __init__(self, topology: Dict[str, Dict[str, List[str]]],
+                 output: Callable[[Dict[str, Any]], None], hold_time: float = 2.0):
+        """
+        Args:
+            topology: {store: {switch: [register targets "ip:port"]}}
+            output: Receives correlated events (e.g. EventDispatcher.publish)
+            hold_time: Seconds a register-down event waits for its siblings
+        """
+        self.output = output
+        self.hold_time = hold_time
+        self._lock = threading.Lock()
+        self._parent: Dict[str, _Node] = {}
+        self._down: Dict[str, bool] = {}
+        self._held: Dict[str, Dict[str, Any]] = {}
+        self._held_since: Dict[str, float] = {}
+        self._suppressed: Dict[str, Dict[str, Any]] = {}
+        self._timer = None
+        self.stores: List[_Node] = []
+
+        for store_name, switches in topology.items():
+            store = _Node(store_name, "store")
+            self.stores.append(store)
+            for switch_name, registers in switches.items():
+                switch = _Node(f"{store_name}/{switch_name}", "switch", store)
+                store.children.append(switch)
+                for target in registers:
+                    switch.children.append(target)
+                    self._parent[target] = switch
+
+    def __call__(self, events):
+        """Dispatcher subscriber entry point; accepts one event or a batch"""
+        for event in events if isinstance(events, list) else [events]:
+            self.process(event)
+
+    def process(self, event: Dict[str, Any]):
+        """Feed a monitor event; correlated events are sent to output"""
+        target = event.get("target")
+        if event.get("type") != "connection" or target not in self._parent:
+            self.output(event)
+            return
+
+        down = not event["connected"]
+        released = []
+        with self._lock:
+            if self._down.get(target, False) == down:
+                # Not a connectivity change (e.g. flapping)
+                if target in self._held:
+                    self._held[target] = event
+                elif target not in self._suppressed:
+                    released.append(event)
+            else:
+                was_held = target in self._held
+                was_suppressed = target in self._suppressed
+                self._down[target] = down
+                self._update_counts(self._parent[target], 1 if down else -1, released)
+                if down:
+                    self._held[target] = event
+                    self._held_since[target] = time.monotonic()
+                    self._schedule_flush()
+                elif was_held:
+                    # Came back within the hold window; drop both events
+                    del self._held[target]
+                    del self._held_since[target]
+                elif was_suppressed:
+                    # Its outage was only reported as part of the group
+                    self._suppressed.pop(target, None)
+                else:
+                    released.append(event)
+
+        for item in released:
+            self.output(item)
+
+    def _update_counts(self, node: _Node, delta: int, released: List[Dict[str, Any]]):
+        """Propagate a child state change up the tree. Caller holds the lock."""
+        while node is not None:
+            was_all_down = node.all_down
+            node.down += delta
+            if was_all_down == node.all_down:
+                return
+            if not node.all_down and node.reported_down:
+                self._report_group_up(node, released)
+            node = node.parent
+
+    def _report_group_up(self, node: _Node, released: List[Dict[str, Any]]):
+        """A reported group is partly back: announce it and un-suppress the rest"""
+        node.reported_down = False
+        released.append(self._group_event(node, connected=True))
+        self._release_suppressed(node, released)
+
+    def _release_suppressed(self, node: _Node, released: List[Dict[str, Any]]):
+        """Re-report what is still down below node at the finest level possible"""
+        for child in node.children:
+            if isinstance(child, _Node):
+                if not child.all_down:
+                    self._release_suppressed(child, released)
+                elif not child.reported_down:
+                    child.reported_down = True
+                    released.append(self._group_event(child, connected=False))
+            else:
+                event = self._suppressed.pop(child, None)
+                if event is not None and self._down.get(child):
+                    released.append(event)
+
+    def _schedule_flush(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.hold_time, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self, now: Optional[float] = None):
+        """Release or collapse held register-down events whose window expired"""
+        now = time.monotonic() if now is None else now
+        released = []
+        with self._lock:
+            self._timer = None
+            for target in [t for t, since in self._held_since.items()
+                           if now - since >= self.hold_time]:
+                if target not in self._held:
+                    continue
+                group = self._highest_down_ancestor(target)
+                if group is None:
+                    released.append(self._held.pop(target))
+                    del self._held_since[target]
+                    continue
+
+                leaves = [leaf for leaf in self._leaves(group) if leaf in self._held]
+                if not group.reported_down:
+                    group.reported_down = True
+                    # Registers found down at start-up are not news, nor is their group
+                    initial = all(self._held[leaf].get("initial") for leaf in leaves)
+                    released.append(self._group_event(group, connected=False, initial=initial))
+                for leaf in leaves:
+                    self._suppressed[leaf] = self._held.pop(leaf)
+                    del self._held_since[leaf]
+            if self._held:
+                self._schedule_flush()
+
+        for item in released:
+            self.output(item)
+
+    def _highest_down_ancestor(self, target: str) -> Optional[_Node]:
+        node, found = self._parent[target], None
+        while node is not None and node.all_down:
+            found = node
+            node = node.parent
+        return found
+
+    def _leaves(self, node: _Node) -> List[str]:
+        leaves = []
+        for child in node.children:
+            if isinstance(child, _Node):
+                leaves.extend(self._leaves(child))
+            else:
+                leaves.append(child)
+        return leaves
+
+    def _group_event(self, node: _Node, connected: bool, initial: bool = False) -> Dict[str, Any]:
+        members = self._leaves(node)
+        logger.warning("Group %s", "recovered" if connected else "down",
+                       extra={"group": node.name, "level": node.level,
+                              "members": len(members)})
+        return {
+            "type": "group",
+            "target": node.name,
+            "level": node.level,
+            "connected": connected,
+            "state": "group_up" if connected else "group_down",
+            "members": len(members),
+            "down": sum(1 for t in members if self._down.get(t)),
+            "initial": initial,
+            "timestamp": datetime.now(),
+        }
+
+    def stop(self):
+        """Cancel the pending flush timer"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
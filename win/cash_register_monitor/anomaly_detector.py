@@ -0,0 +1,129 @@
+"""
+Early warning of a failing register from its connect latency
+
+Register network adapters tend to degrade before they die: the RTT creeps
+up and the odd probe times out while the register still answers. Per
+target, LatencyAnomalyDetector keeps an exponentially weighted baseline of
+log RTT (mean and variance over roughly the last 500 probes), a fast
+average of the median of the last MEDIAN_WINDOW answered probes and a
+weighted share of probes that got no answer. The median keeps a lone slow
+connect (e.g. one SYN retransmit) from tripping the detector; it takes
+most of the recent probes being slow. The target is degraded while the fast average is more than
+z_threshold baseline deviations and MIN_RATIO times above the baseline, or
+while more than LOSS_HIGH of recent probes went unanswered; it clears at
+half the threshold and LOSS_LOW. A probe more than CLIP deviations off
+moves the baseline mean by a fixed step and its spread not at all, so a
+decline within an hour is not learned as normal, while a lasting change
+(e.g. a new switch) is accepted after a few hours. A decline spread over
+days only shows through unanswered probes.
+
+Each probe updates a handful of numbers: O(1) time and memory per sample.
+"""
+
+import math
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+class LatencyAnomalyDetector:
+    """EWMA z-score of recent RTT against its baseline, plus unanswered probe rate"""
+
+    SLOW_ALPHA = 0.002     # baseline
+    FAST_ALPHA = 0.2       # recent level
+    LOSS_ALPHA = 0.05      # unanswered share
+    CLIP = 3.0             # deviations one probe may pull the baseline
+    MIN_SAMPLES = 30       # answered probes before the baseline is trusted
+    MEDIAN_WINDOW = 5      # answered probes the recent level is the median of
+    MIN_DEVIATION = 0.1    # log RTT (about 10 %), so a very steady link is not too sensitive
+    MIN_RATIO = 1.5
+    LOSS_HIGH = 0.15
+    LOSS_LOW = 0.05
+
+    def __init__(self, z_threshold: float = 3.0):
+        self.z_threshold = z_threshold
+        self.reset()
+
+    def reset(self):
+        """Forget the baseline, e.g. after the target address changed"""
+        self.mean = None
+        self.var = 0.0
+        self.fast = None
+        self.loss = 0.0
+        self.samples = 0
+        self.z = 0.0
+        self.degraded = False
+        self._recent = deque(maxlen=self.MEDIAN_WINDOW)
+
+    def update(self, rtt: Optional[float]) -> bool:
+        """Feed one probe, its RTT or None if it got no answer; returns whether degraded"""
+        if rtt is None:
+            self.loss += self.LOSS_ALPHA * (1.0 - self.loss)
+        else:
+            self.loss -= self.LOSS_ALPHA * self.loss
+            x = math.log(max(rtt, 1e-6))
+            self._recent.append(x)
+            if self.mean is None:
+                self.mean = self.fast = x
+            else:
+                recent = sorted(self._recent)
+                self.fast += self.FAST_ALPHA * (recent[len(recent) // 2] - self.fast)
+                # A plain average until there are enough samples for the EWMA
+                alpha = max(self.SLOW_ALPHA, 1.0 / (self.samples + 1))
+                limit = self.CLIP * max(math.sqrt(self.var), self.MIN_DEVIATION)
+                diff = x - self.mean
+                if abs(diff) <= limit:
+                    self.mean += alpha * diff
+                    self.var = (1.0 - alpha) * (self.var + alpha * diff * diff)
+                else:
+                    # An outlier only nudges the mean and leaves the spread alone
+                    self.mean += alpha * math.copysign(limit, diff)
+            self.samples += 1
+
+        if self.samples >= self.MIN_SAMPLES:
+            self.z = (self.fast - self.mean) / max(math.sqrt(self.var), self.MIN_DEVIATION)
+        slow = self.samples >= self.MIN_SAMPLES and self.fast - self.mean >= math.log(self.MIN_RATIO)
+        if self.degraded:
+            self.degraded = (slow and self.z >= self.z_threshold / 2) or self.loss >= self.LOSS_LOW
+        else:
+            self.degraded = (slow and self.z >= self.z_threshold) or self.loss >= self.LOSS_HIGH
+        return self.degraded
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get detector state for status reporting"""
+        return {
+            "degraded": self.degraded,
+            "z": round(self.z, 2),
+            "baseline_rtt": math.exp(self.mean) if self.mean is not None else None,
+            "recent_rtt": math.exp(self.fast) if self.fast is not None else None,
+            "loss": round(self.loss, 3),
+            "samples": self.samples,
+        }
+
+    def get_baseline(self) -> Dict[str, Any]:
+        """Get the learned baseline for persistence (see state_snapshot)"""
+        return {
+            "mean": self.mean,
+            "var": self.var,
+            "fast": self.fast,
+            "loss": self.loss,
+            "samples": self.samples,
+            "degraded": self.degraded,
+        }
+
+    def load_baseline(self, baseline: Dict[str, Any]):
+        """Restore a baseline produced by get_baseline()"""
+        self.reset()
+        if baseline.get("mean") is None:
+            return
+        self.mean = baseline["mean"]
+        self.var = baseline.get("var", 0.0)
+        self.fast = baseline.get("fast")
+        if self.fast is None:
+            self.fast = self.mean
+        # The recent probes are not kept; stand-ins so one slow probe still cannot trip it
+        self._recent.extend([self.fast] * (self.MEDIAN_WINDOW // 2))
+        self.loss = baseline.get("loss", 0.0)
+        self.samples = baseline.get("samples", 0)
+        self.degraded = bool(baseline.get("degraded"))
+        if self.samples >= self.MIN_SAMPLES:
+            self.z = (self.fast - self.mean) / max(math.sqrt(self.var), self.MIN_DEVIATION)
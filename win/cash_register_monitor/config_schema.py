@@ -0,0 +1,398 @@
+"""
+Versioned configuration schema with per-target overrides
+
+Version 1 configs had one register in flat ip_address/port/check_interval
+keys. Version 2 keeps global options at the top level, where port,
+check_interval and probe act as defaults, and lists registers under
+"targets"; each entry may override port, interval, probe and group:
+
+    {"version": 2, "port": 4999, "check_interval": 5,
+     "targets": [{"ip": "192.168.1.155"},
+                 {"ip": "192.168.1.156", "port": 5000, "group": "Store 1/switch-a"}]}
+
+The schema is compiled once into a list of rule functions. ConfigValidator
+remembers the inputs and result of every rule and every target entry, so
+revalidating after a reload only re-checks what actually changed.
+"""
+
+import ipaddress
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+try:
+    from .logging_setup import get_logger
+except ImportError:
+    from logging_setup import get_logger
+
+
+logger = get_logger(__name__)
+
+SCHEMA_VERSION = 2
+
+PROBE_TYPES = ("tcp",)
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+# Per-target keys and the global default each one falls back to
+TARGET_DEFAULTS = {"port": "port", "interval": "check_interval", "probe": "probe"}
+TARGET_KEYS = ("name", "ip", "port", "interval", "probe", "group")
+
+
+def migrate(settings: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+    """Upgrade a loaded config to the current schema version.
+
+    Returns:
+        (settings, migrated) where migrated tells whether anything changed
+
+    Raises:
+        ValueError: the config is not an object or its version is unusable
+    """
+    if not isinstance(settings, dict):
+        raise ValueError("Config must be a JSON object")
+    version = settings.get("version", 1)
+    error = _check_version(version)
+    if error:
+        raise ValueError(error)
+    if version >= SCHEMA_VERSION:
+        return settings, False
+
+    settings = dict(settings)
+    if version < 2:
+        # The single register becomes the first target; port and
+        # check_interval stay where they are and now act as defaults
+        ip = settings.pop("ip_address", None)
+        target = {"ip": ip} if ip else None
+        # The macOS app stored its one printer as printer_ip/printer_port
+        printer_ip = settings.pop("printer_ip", None)
+        printer_port = settings.pop("printer_port", None)
+        if printer_ip and not target:
+            target = {"ip": printer_ip}
+            if printer_port:
+                target["port"] = printer_port
+        if "targets" not in settings:
+            settings["targets"] = [target] if target else []
+
+    settings["version"] = SCHEMA_VERSION
+    logger.info("Migrated config schema", extra={"from_version": version,
+                                                  "to_version": SCHEMA_VERSION})
+    return settings, True
+
+
+# Field checks: each returns an error message or None
+
+def _check_version(version) -> Optional[str]:
+    # bool is an int subclass but never a valid version
+    if not isinstance(version, int) or isinstance(version, bool) or version < 1:
+        return "Config version must be a positive whole number"
+    return None
+
+
+def _check_ip(value) -> Optional[str]:
+    if not value or not isinstance(value, str):
+        return "IP address cannot be empty"
+    try:
+        # Probes use IPv4 sockets
+        ipaddress.IPv4Address(value)
+    except ValueError:
+        return "Invalid IPv4 address"
+    return None
+
+
+def _check_port(value) -> Optional[str]:
+    try:
+        if not 1 <= int(value) <= 65535:
+            return "Port must be between 1 and 65535"
+    except (ValueError, TypeError):
+        return "Port must be a valid number"
+    return None
+
+
+def _check_interval(value) -> Optional[str]:
+    try:
+        if float(value) < 1:
+            return "Check interval must be at least 1 second"
+    except (ValueError, TypeError):
+        return "Check interval must be a valid number"
+    return None
+
+
+def _check_probe(value) -> Optional[str]:
+    if value not in PROBE_TYPES:
+        return f"Probe must be one of: {', '.join(PROBE_TYPES)}"
+    return None
+
+
+def _check_text(value) -> Optional[str]:
+    if value is not None and not isinstance(value, str):
+        return "Must be text"
+    return None
+
+
+TARGET_FIELD_CHECKS = {
+    "name": _check_text,
+    "ip": _check_ip,
+    "port": _check_port,
+    "interval": _check_interval,
+    "probe": _check_probe,
+    "group": _check_text,
+}
+
+
+def _check_slo(slo) -> Optional[str]:
+    try:
+        if float(slo or 0) < 0:
+            return "Detection SLO cannot be negative"
+    except (ValueError, TypeError):
+        return "Detection SLO must be a valid number"
+    return None
+
+
+def _check_hysteresis(fail_threshold, fail_window) -> Optional[str]:
+    try:
+        if not 1 <= int(fail_threshold) <= int(fail_window):
+            return "Failure threshold must be between 1 and the failure window"
+    except (ValueError, TypeError):
+        return "Failure threshold and window must be valid numbers"
+    return None
+
+
+def _check_recover(recover_threshold) -> Optional[str]:
+    try:
+        if int(recover_threshold) < 1:
+            return "Recovery threshold must be at least 1"
+    except (ValueError, TypeError):
+        return "Recovery threshold must be a valid number"
+    return None
+
+
+def _check_flap(low, high) -> Optional[str]:
+    try:
+        if not 0 <= float(low) <= float(high) <= 100:
+            return "Flap thresholds must satisfy 0 <= low <= high <= 100"
+    except (ValueError, TypeError):
+        return "Flap thresholds must be valid numbers"
+    return None
+
+
+def _check_degraded(threshold) -> Optional[str]:
+    try:
+        if float(threshold or 0) < 0:
+            return "Degraded threshold cannot be negative"
+    except (ValueError, TypeError):
+        return "Degraded threshold must be a valid number"
+    return None
+
+
+def _check_reference(reference) -> Optional[str]:
+    reference = str(reference).strip()
+    if reference.lower() in ("", "auto", "off"):
+        return None
+    host, _, port = reference.partition(":")
+    if not host:
+        return "Reference target must be auto, off or host[:port]"
+    if port and not (port.isdigit() and 1 <= int(port) <= 65535):
+        return "Reference target port must be between 1 and 65535"
+    return None
+
+
+def _check_topology(topology) -> Optional[str]:
+    topology = topology or {}
+    if not isinstance(topology, dict) or not all(
+        isinstance(switches, dict) and all(
+            isinstance(registers, list) and all(isinstance(r, str) for r in registers)
+            for registers in switches.values()
+        )
+        for switches in topology.values()
+    ):
+        return 'Topology must look like {"store": {"switch": ["ip:port", ...]}}'
+    return None
+
+
+def _check_snapshot_interval(interval) -> Optional[str]:
+    try:
+        if float(interval) < 0:
+            return "Snapshot interval cannot be negative"
+    except (ValueError, TypeError):
+        return "Snapshot interval must be a valid number"
+    return None
+
+
+def _check_stream_port(port) -> Optional[str]:
+    try:
+        if not 0 <= int(port) <= 65535:
+            return "Stream port must be between 0 (off) and 65535"
+    except (ValueError, TypeError):
+        return "Stream port must be a valid number"
+    return None
+
+
+def _check_fprint_port(port) -> Optional[str]:
+    try:
+        if not 0 <= int(port) <= 65535:
+            return "FPrint port must be between 0 (off) and 65535"
+    except (ValueError, TypeError):
+        return "FPrint port must be a valid number"
+    return None
+
+
+def _check_aggregator(url, interval) -> Optional[str]:
+    url = str(url or "").strip()
+    if url:
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https", "udp") or not parsed.hostname:
+            return "Aggregator URL must be http://host:port or udp://host:port"
+    try:
+        if float(interval) <= 0:
+            return "Report interval must be positive"
+    except (ValueError, TypeError):
+        return "Report interval must be a valid number"
+    return None
+
+
+def _check_spool(size) -> Optional[str]:
+    try:
+        if float(size) < 0:
+            return "Spool size cannot be negative"
+    except (ValueError, TypeError):
+        return "Spool size must be a valid number of megabytes"
+    return None
+
+
+def _check_history_days(days) -> Optional[str]:
+    try:
+        if int(days) < 0:
+            return "History retention cannot be negative"
+    except (ValueError, TypeError):
+        return "History retention must be a whole number of days"
+    return None
+
+
+def _check_log_level(level) -> Optional[str]:
+    if str(level).upper() not in LOG_LEVELS:
+        return "Log level must be DEBUG, INFO, WARNING, ERROR or CRITICAL"
+    return None
+
+
+# (error key, setting keys with their defaults, check)
+GLOBAL_RULES = [
+    ("version", (("version", SCHEMA_VERSION),), _check_version),
+    ("port", (("port", 4999),), _check_port),
+    ("check_interval", (("check_interval", 5),), _check_interval),
+    ("probe", (("probe", "tcp"),), _check_probe),
+    ("detection_slo", (("detection_slo", 0),), _check_slo),
+    ("fail_threshold", (("fail_threshold", 2), ("fail_window", 3)), _check_hysteresis),
+    ("recover_threshold", (("recover_threshold", 2),), _check_recover),
+    ("flap_high_threshold", (("flap_low_threshold", 20.0), ("flap_high_threshold", 30.0)), _check_flap),
+    ("degraded_threshold", (("degraded_threshold", 3.0),), _check_degraded),
+    ("reference_target", (("reference_target", "auto"),), _check_reference),
+    ("topology", (("topology", {}),), _check_topology),
+    ("snapshot_interval", (("snapshot_interval", 30),), _check_snapshot_interval),
+    ("history_days", (("history_days", 90),), _check_history_days),
+    ("stream_port", (("stream_port", 0),), _check_stream_port),
+    ("fprint_port", (("fprint_port", 0),), _check_fprint_port),
+    ("aggregator_url", (("aggregator_url", ""), ("report_interval", 10)), _check_aggregator),
+    ("spool_mb", (("spool_mb", 16),), _check_spool),
+    ("log_level", (("log_level", "INFO"),), _check_log_level),
+]
+
+
+def compile_rules(rules) -> List[Tuple[str, Callable[[Dict[str, Any]], Tuple], Callable]]:
+    """Turn rule declarations into (error key, input extractor, check) triples"""
+    compiled = []
+    for error_key, fields, check in rules:
+        def extract(settings, fields=fields):
+            return tuple(settings.get(key, default) for key, default in fields)
+        compiled.append((error_key, extract, check))
+    return compiled
+
+
+class ConfigValidator:
+    """Validate settings, re-checking only rules and targets whose inputs changed"""
+
+    def __init__(self, rules=GLOBAL_RULES):
+        self.rules = compile_rules(rules)
+        self.targets: List[Dict[str, Any]] = []
+        self.checked = 0  # rules and targets actually evaluated by the last validate()
+        self._rule_cache: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._target_cache: Dict[str, Tuple[Dict[str, Any], Dict[str, str]]] = {}
+
+    def validate(self, settings: Dict[str, Any]) -> Dict[str, str]:
+        """Validate settings and resolve targets.
+
+        Returns:
+            {setting or "targets[i].field": error message}; the resolved,
+            valid targets are left in self.targets
+        """
+        errors = {}
+        self.checked = 0
+
+        for error_key, extract, check in self.rules:
+            values = extract(settings)
+            # Compare serialized inputs so in-place edits of nested values are seen
+            values_key = json.dumps(values, sort_keys=True, default=str)
+            cached = self._rule_cache.get(error_key)
+            if cached is None or cached[0] != values_key:
+                self.checked += 1
+                cached = (values_key, check(*values))
+                self._rule_cache[error_key] = cached
+            if cached[1]:
+                errors[error_key] = cached[1]
+
+        defaults = {key: settings.get(default_key) for key, default_key in TARGET_DEFAULTS.items()}
+        defaults["probe"] = defaults["probe"] or "tcp"
+        defaults_key = json.dumps(defaults, sort_keys=True, default=str)
+
+        entries = settings.get("targets")
+        if not isinstance(entries, list):
+            errors["targets"] = "Targets must be a list"
+            entries = []
+
+        target_cache = {}
+        targets = []
+        seen = set()
+        for i, entry in enumerate(entries):
+            cache_key = defaults_key + json.dumps(entry, sort_keys=True, default=str)
+            cached = self._target_cache.get(cache_key) or target_cache.get(cache_key)
+            if cached is None:
+                self.checked += 1
+                cached = self._check_target(entry, defaults)
+            target_cache[cache_key] = cached
+
+            resolved, target_errors = cached
+            for field, message in target_errors.items():
+                errors[f"targets[{i}].{field}"] = message
+            if target_errors:
+                continue
+            if resolved["target"] in seen:
+                errors[f"targets[{i}].ip"] = f"Duplicate target {resolved['target']}"
+                continue
+            seen.add(resolved["target"])
+            targets.append(resolved)
+
+        # Keep only entries still present so the cache tracks the config size
+        self._target_cache = target_cache
+        self.targets = targets
+        return errors
+
+    @staticmethod
+    def _check_target(entry, defaults: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        if not isinstance(entry, dict):
+            return {}, {"ip": "Target must be an object"}
+
+        errors = {}
+        for key in entry:
+            if key not in TARGET_FIELD_CHECKS:
+                errors[key] = "Unknown target setting"
+
+        resolved = {key: entry.get(key, defaults.get(key)) for key in TARGET_KEYS}
+        for key, check in TARGET_FIELD_CHECKS.items():
+            message = check(resolved[key])
+            if message and key not in errors:
+                errors[key] = message
+        if errors:
+            return resolved, errors
+
+        resolved["port"] = int(resolved["port"])
+        resolved["interval"] = float(resolved["interval"])
+        resolved["target"] = f"{resolved['ip']}:{resolved['port']}"
+        resolved["name"] = resolved["name"] or resolved["target"]
+        return resolved, errors
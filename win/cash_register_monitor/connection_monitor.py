@@ -1,85 +1,491 @@
-import socket
+import bisect
 import threading
 import time
+from collections import deque
 from typing import Callable, Optional
 from datetime import datetime
+try:
+    from .anomaly_detector import LatencyAnomalyDetector
+    from .event_dispatcher import DROP_OLDEST, EventDispatcher
+    from .logging_setup import get_logger
+    from .probe_history import FLAG_INITIAL, FLAG_NETWORK_DOWN, ProbeHistory
+    from .reachability import ANSWERED_REASONS, NetworkReachability, REASON_TIMEOUT, tcp_probe
+    from .rtt_estimator import RttEstimator
+    from .state_snapshot import RTT_HISTOGRAM_BOUNDS
+    from .state_filter import (FlapDetector, HysteresisFilter, STATE_CONNECTED, STATE_DEGRADED,
+                               STATE_DISCONNECTED, STATE_FLAPPING)
+except ImportError:
+    from anomaly_detector import LatencyAnomalyDetector
+    from event_dispatcher import DROP_OLDEST, EventDispatcher
+    from logging_setup import get_logger
+    from probe_history import FLAG_INITIAL, FLAG_NETWORK_DOWN, ProbeHistory
+    from reachability import ANSWERED_REASONS, NetworkReachability, REASON_TIMEOUT, tcp_probe
+    from rtt_estimator import RttEstimator
+    from state_snapshot import RTT_HISTOGRAM_BOUNDS
+    from state_filter import (FlapDetector, HysteresisFilter, STATE_CONNECTED, STATE_DEGRADED,
+                              STATE_DISCONNECTED, STATE_FLAPPING)
+
+
+logger = get_logger(__name__)
+
+
+# Probe timing bounds used when scheduling from a detection SLO
+DEFAULT_TIMEOUT = 3
+MIN_TIMEOUT = 0.2
+MIN_INTERVAL = 0.5
+SLO_TIMEOUT_SHARE = 0.3
+# Share of the timeout after which an unanswered probe starts the reference probe
+SLOW_PROBE_SHARE = 0.25
 
 
 class ConnectionMonitor:
-    def __init__(self, ip: str = "192.168.1.155", port: int = 4999, interval: int = 5):
+    def __init__(self, ip: str = "192.168.1.155", port: int = 4999, interval: int = 5,
+                 detection_slo: Optional[float] = None, adaptive_timeout: bool = True,
+                 dispatcher: Optional[EventDispatcher] = None,
+                 fail_threshold: int = 2, fail_window: int = 3, recover_threshold: int = 2,
+                 flap_low_threshold: float = 20.0, flap_high_threshold: float = 30.0,
+                 degraded_threshold: float = 3.0,
+                 reachability: Optional[NetworkReachability] = None,
+                 history: Optional[ProbeHistory] = None):
         self.ip = ip
         self.port = port
         self.interval = interval
         self.is_connected = False
+        self.state = None
+        self.last_probe = None
+        self.network_down = False
+        self.reachability = reachability
+        self.history = history
+        self.publish_samples = False  # latency sample event after every probe
         self.last_check_time = None
         self.monitoring = False
         self.monitor_thread = None
         self.connection_callback: Optional[Callable[[bool, datetime], None]] = None
-        self.timeout = 3
-        
+        self.timeout = DEFAULT_TIMEOUT
+        self.detection_slo = detection_slo
+        self.configured_interval = interval
+        self.adaptive_timeout = adaptive_timeout
+        self.rtt = RttEstimator(max_timeout=DEFAULT_TIMEOUT)
+        self.rtt_histogram = [0] * (len(RTT_HISTOGRAM_BOUNDS) + 1)
+        self.restored = False
+
+        # Raw probe results are smoothed before they become state changes
+        self.hysteresis = HysteresisFilter(fail_threshold, fail_window, recover_threshold)
+        self.flap_detector = FlapDetector(flap_low_threshold, flap_high_threshold)
+        self.anomaly = LatencyAnomalyDetector(degraded_threshold) if degraded_threshold else None
+
+        # State changes are published here; consumers never run on the probe thread
+        self.dispatcher = dispatcher
+        self._owns_dispatcher = dispatcher is None
+        self._callback_subscriber = None
+
+        # Detection latency instrumentation (monotonic seconds)
+        self.last_success_time = None
+        self.last_failure_time = None
+        self.last_transition = None
+        self.transitions = deque(maxlen=100)
+        self.slo_breaches = 0
+        # Each run gets its own stop event, so a probe still finishing after
+        # stop_monitoring() can tell that its result is no longer wanted
+        self._stop_event = threading.Event()
+        self._run_lock = threading.Lock()
+
+        self._apply_slo()
+
+    @property
+    def target(self) -> str:
+        return f"{self.ip}:{self.port}"
+
     def set_connection_callback(self, callback: Callable[[bool, datetime], None]):
-        """Set callback function to be called when connection status changes"""
+        """Set callback function to be called when connection status changes.
+
+        The callback runs on a dispatcher worker thread, not the probe thread.
+        """
         self.connection_callback = callback
-    
+        if self._callback_subscriber is None:
+            if self.dispatcher is None:
+                self.dispatcher = EventDispatcher(workers=1, name=f"monitor-{self.target}")
+            self._callback_subscriber = self.dispatcher.subscribe(
+                self._deliver_callback,
+                name=f"callback-{id(self)}",
+                drop_policy=DROP_OLDEST,  # every event may carry a detection record to complete
+                accept=lambda event: event.get("monitor") is self,
+            )
+
+    def _deliver_callback(self, event: dict):
+        """Dispatcher-side adapter for the legacy (connected, timestamp) callback"""
+        if self.connection_callback:
+            self.connection_callback(event["connected"], event["timestamp"])
+        if event.get("detection") is not None:
+            self._record_notified(event["detection"], time.monotonic())
+
+    def _publish(self, timestamp: datetime, detection: Optional[dict] = None,
+                 initial: bool = False):
+        """Publish the current state to all dispatcher subscribers"""
+        if self.dispatcher is None:
+            return
+        self.dispatcher.publish({
+            "type": "connection",
+            "monitor": self,
+            "target": self.target,
+            "state": self.state,
+            "connected": self.is_connected,
+            "reason": self.last_probe and self.last_probe["reason"],
+            "timestamp": timestamp,
+            "detection": detection,
+            "initial": initial,
+        })
+
+    def probe(self, on_slow: Optional[Callable[[], None]] = None) -> dict:
+        """Probe the cash register and classify the outcome.
+
+        Args:
+            on_slow: Called if the register has not answered after
+                SLOW_PROBE_SHARE of the timeout
+
+        Returns:
+            dict with 'ok', 'errno', 'reason' and 'rtt' (see reachability.tcp_probe)
+        """
+        result = tcp_probe(self.ip, self.port, self.timeout, on_slow,
+                           self.timeout * SLOW_PROBE_SHARE)
+        if result["reason"] in ANSWERED_REASONS:
+            self.rtt_histogram[bisect.bisect_left(RTT_HISTOGRAM_BOUNDS, result["rtt"])] += 1
+        self._update_timeout(result)
+        self.last_probe = result
+        return result
+
     def test_connection(self) -> bool:
         """Test TCP connection to the cash register"""
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.settimeout(self.timeout)
-                result = sock.connect_ex((self.ip, self.port))
-                return result == 0
-        except Exception:
-            return False
-    
-    def update_settings(self, ip: str, port: int, interval: int):
+        return self.probe()["ok"]
+
+    def _update_timeout(self, result: dict):
+        """Feed the probe outcome into the RTT estimator and refresh the timeout"""
+        if not self.adaptive_timeout:
+            return
+        if result["reason"] in ANSWERED_REASONS:
+            self.rtt.add_sample(result["rtt"])
+        elif result["reason"] == REASON_TIMEOUT:
+            self.rtt.on_timeout()
+        self.timeout = self.rtt.timeout
+
+    def update_settings(self, ip: str, port: int, interval: int,
+                        detection_slo: Optional[float] = None):
         """Update connection settings"""
+        if (ip, port) != (self.ip, self.port):
+            self.rtt.reset()
+            if self.anomaly is not None:
+                self.anomaly.reset()
+            self.rtt_histogram = [0] * len(self.rtt_histogram)
         self.ip = ip
         self.port = port
         self.interval = interval
-    
-    def _monitor_loop(self):
+        self.configured_interval = interval
+        self.detection_slo = detection_slo
+        self._apply_slo()
+
+    def _apply_slo(self):
+        """Pick probe interval and timeout so worst-case detection meets the SLO.
+
+        A failure that starts just after a successful probe is confirmed after
+        at most fail_threshold intervals plus one probe timeout, so the SLO is
+        split between them. Without an SLO the configured values are used.
+        """
+        if not self.detection_slo:
+            max_timeout = DEFAULT_TIMEOUT
+            self.interval = self.configured_interval
+        else:
+            slo = float(self.detection_slo)
+            max_timeout = min(DEFAULT_TIMEOUT, max(MIN_TIMEOUT, slo * SLO_TIMEOUT_SHARE))
+            probes = self.hysteresis.fail_threshold
+            self.interval = min(self.configured_interval,
+                                max(MIN_INTERVAL, (slo - max_timeout) / probes))
+
+        # The RTT estimator may shorten the timeout but never exceed the budget
+        self.rtt.max_timeout = max_timeout
+        self.rtt.initial_timeout = max_timeout
+        self.timeout = self.rtt.timeout if self.adaptive_timeout else max_timeout
+
+    def _record_probe(self, connected: bool, probe_done: float):
+        """Remember when the last success/failure was observed"""
+        if connected:
+            self.last_success_time = probe_done
+        else:
+            self.last_failure_time = probe_done
+
+    def _record_transition(self, connected: bool, detected_at: float,
+                           timestamp: datetime) -> Optional[dict]:
+        """Record detection latency for a state change.
+
+        Must be called before _record_probe for the new result. detection_latency
+        is the time from the last probe with the old result to the first probe
+        with the new one; notify_latency is filled in once the callback ran.
+        """
+        previous = self.last_failure_time if connected else self.last_success_time
+        if previous is None:
+            return None
+
+        record = {
+            "connected": connected,
+            "timestamp": timestamp,
+            "since": previous,
+            "detection_latency": detected_at - previous,
+            "notify_latency": None,
+        }
+        self.last_transition = record
+        self.transitions.append(record)
+        return record
+
+    def _record_notified(self, record: dict, notified_at: float):
+        """Complete a transition record once consumers have been notified"""
+        record["notify_latency"] = notified_at - record["since"]
+        if self.detection_slo:
+            record["slo_met"] = record["notify_latency"] <= self.detection_slo
+            if not record["slo_met"]:
+                self.slo_breaches += 1
+
+    def _monitor_loop(self, stop_event: threading.Event):
         """Main monitoring loop running in background thread"""
-        while self.monitoring:
+        next_run = time.monotonic()
+        while not stop_event.is_set():
+            # Schedule from a fixed cadence so probe time does not add drift
+            next_run += self.interval
+            now = time.monotonic()
+            if next_run < now:
+                next_run = now
+            if stop_event.wait(next_run - now):
+                break
+
             try:
-                current_status = self.test_connection()
-                current_time = datetime.now()
-                
-                if current_status != self.is_connected:
-                    self.is_connected = current_status
-                    if self.connection_callback:
-                        self.connection_callback(self.is_connected, current_time)
-                
-                self.last_check_time = current_time
-                
-                time.sleep(self.interval)
+                started = time.monotonic()
+                current_status = self.probe(on_slow=self._reference_hook(started))["ok"]
+                network_down = self._network_is_down(started)
+                if stop_event.is_set():
+                    # Stopped while probing: history and consumers may already belong to a new run
+                    break
+                if network_down:
+                    # The shared reachability check reports this once for all
+                    # registers; don't count it against this one
+                    self.last_check_time = datetime.now()
+                    self._record_history(self.last_check_time, FLAG_NETWORK_DOWN)
+                    self._publish_sample(self.last_check_time)
+                    continue
+                self._process_probe(current_status, time.monotonic(), datetime.now())
             except Exception as e:
-                print(f"Error in monitoring loop: {e}")
-                time.sleep(self.interval)
-    
+                logger.warning("Error in monitoring loop: %s", e,
+                               extra={"target": self.target})
+
+    def _reference_hook(self, probe_started: float) -> Optional[Callable[[], None]]:
+        """Start the shared reference probe while a slow register probe is still waiting,
+        so a dead LAN is recognised without a second timeout after the first"""
+        if self.reachability is None:
+            return None
+        return lambda: self.reachability.check_soon(fresh_after=probe_started)
+
+    def _network_is_down(self, probe_started: float) -> bool:
+        """Check whether a probe failure is explained by the whole LAN being down"""
+        reason = self.last_probe and self.last_probe["reason"]
+        if self.reachability is None:
+            return False
+        if reason in ANSWERED_REASONS:
+            # Even a refused connection proves the network path works
+            self.reachability.note_answer()
+            return False
+        self.network_down = not self.reachability.check(fresh_after=probe_started)
+        return self.network_down
+
+    def _process_probe(self, ok: bool, detected_at: float, current_time: datetime):
+        """Run a raw probe result through hysteresis and flap detection"""
+        self.network_down = False
+        stable = self.hysteresis.update(ok)
+        flapping = self.flap_detector.update(ok)
+        if flapping:
+            new_state = STATE_FLAPPING
+        elif not stable:
+            new_state = STATE_DISCONNECTED
+        else:
+            # Only probes while up count: recovering from an outage is not degradation
+            new_state = STATE_DEGRADED if self._update_anomaly() else STATE_CONNECTED
+
+        if new_state != self.state:
+            detection = None
+            # While flapping, connectivity is frozen at its last reported value
+            if new_state != STATE_FLAPPING and stable != self.is_connected:
+                self.is_connected = stable
+                detection = self._record_transition(stable, detected_at, current_time)
+            self.state = new_state
+            logger.info("Connection state changed", extra={
+                "target": self.target,
+                "state": new_state,
+                "flap_percent": round(self.flap_detector.percent_change, 1),
+                "rtt_z": self.anomaly and round(self.anomaly.z, 1),
+                "detection_latency": detection and detection["detection_latency"],
+            })
+            self._publish(current_time, detection)
+
+        self._record_probe(ok, detected_at)
+        self.last_check_time = current_time
+        self._record_history(current_time)
+        self._publish_sample(current_time)
+
+    def _update_anomaly(self) -> bool:
+        """Feed the last probe to the latency anomaly detector; True while degraded"""
+        if self.anomaly is None:
+            return False
+        probe = self.last_probe
+        return self.anomaly.update(probe["rtt"] if probe["reason"] in ANSWERED_REASONS else None)
+
+    def _publish_sample(self, timestamp: datetime):
+        """Publish the last probe's outcome and RTT, for live dashboards"""
+        if not self.publish_samples or self.dispatcher is None or self.last_probe is None:
+            return
+        probe = self.last_probe
+        self.dispatcher.publish({
+            "type": "sample",
+            "target": self.target,
+            "ok": probe["ok"],
+            "reason": probe["reason"],
+            "rtt": probe["rtt"] if probe["reason"] in ANSWERED_REASONS else None,
+            "rtt_z": self.anomaly and round(self.anomaly.z, 2),
+            "degraded": self.state == STATE_DEGRADED,
+            "timestamp": timestamp,
+        })
+
+    def _record_history(self, timestamp: datetime, flags: int = 0):
+        """Append the last probe to the probe history, if one is kept"""
+        if self.history is None or self.last_probe is None:
+            return
+        probe = self.last_probe
+        self.history.record(timestamp, self.ip, self.port, probe["ok"], self.state,
+                            probe["reason"], probe["rtt"] if probe["reason"] in ANSWERED_REASONS else None,
+                            flags)
+
+    def get_snapshot(self) -> dict:
+        """Get the state worth keeping across restarts (see state_snapshot)"""
+        return {
+            "ip": self.ip,
+            "port": self.port,
+            "state": self.state,
+            "connected": self.is_connected,
+            "reason": self.last_probe and self.last_probe["reason"],
+            "last_check": self.last_check_time,
+            "rtt": self.rtt.get_state(),
+            "hysteresis": self.hysteresis.get_state(),
+            "flap": self.flap_detector.get_state(),
+            "anomaly": self.anomaly.get_baseline() if self.anomaly is not None else None,
+            "rtt_histogram": list(self.rtt_histogram),
+        }
+
+    def restore_snapshot(self, snapshot: dict):
+        """Resume from a snapshot taken before a restart.
+
+        The last-known state is available immediately and the estimators
+        and filters start warm; the first probe then continues from it
+        instead of starting over.
+        """
+        self.state = snapshot["state"]
+        self.is_connected = snapshot["connected"]
+        self.last_check_time = snapshot["last_check"]
+        if snapshot["reason"]:
+            self.last_probe = {"ok": snapshot["reason"] == "ok", "errno": None,
+                               "reason": snapshot["reason"], "rtt": None}
+        self.rtt.load_state(snapshot["rtt"])
+        if self.adaptive_timeout:
+            self.timeout = self.rtt.timeout
+        self.hysteresis.load_state(snapshot["hysteresis"])
+        self.flap_detector.load_state(snapshot["flap"])
+        if self.anomaly is not None and snapshot.get("anomaly"):
+            self.anomaly.load_baseline(snapshot["anomaly"])
+        if len(snapshot["rtt_histogram"]) == len(self.rtt_histogram):
+            self.rtt_histogram = list(snapshot["rtt_histogram"])
+        self.restored = True
+
     def start_monitoring(self):
         """Start background monitoring thread"""
-        if not self.monitoring:
+        with self._run_lock:
+            if self.monitoring:
+                return
             self.monitoring = True
-            self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
-            self.monitor_thread.start()
-            
+            stop_event = self._stop_event = threading.Event()
+
+        if self.dispatcher is not None:
+            self.dispatcher.start()
+        if self.restored and self.state is not None:
+            # Show the last-known state, then let the first probe update it
+            self._publish(self.last_check_time or datetime.now(), initial=True)
+            ok = self.test_connection()
+            if stop_event.is_set():
+                return
+            self._process_probe(ok, time.monotonic(), datetime.now())
+        else:
             # Perform initial connection test
-            self.is_connected = self.test_connection()
+            connected = self.test_connection()
+            if stop_event.is_set():
+                return
+            self.is_connected = connected
+            self.state = STATE_CONNECTED if self.is_connected else STATE_DISCONNECTED
+            self.hysteresis.reset(self.is_connected)
+            self.flap_detector.reset()
+            self.flap_detector.update(self.is_connected)
+            self._record_probe(self.is_connected, time.monotonic())
             self.last_check_time = datetime.now()
-            if self.connection_callback:
-                self.connection_callback(self.is_connected, self.last_check_time)
-    
+            self._record_history(self.last_check_time, FLAG_INITIAL)
+            self._publish_sample(self.last_check_time)
+            self._publish(self.last_check_time, initial=True)
+
+        with self._run_lock:
+            if stop_event.is_set():
+                return
+            self.monitor_thread = threading.Thread(target=self._monitor_loop, args=(stop_event,),
+                                                   daemon=True)
+            self.monitor_thread.start()
+
     def stop_monitoring(self):
-        """Stop background monitoring"""
-        self.monitoring = False
-        if self.monitor_thread and self.monitor_thread.is_alive():
-            self.monitor_thread.join(timeout=1)
-    
+        """Stop background monitoring.
+
+        Waits for a probe in progress to finish (up to the probe timeout);
+        its result is discarded either way.
+        """
+        with self._run_lock:
+            self.monitoring = False
+            self._stop_event.set()
+            thread = self.monitor_thread
+        if thread and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=self.timeout + 1)
+        if self._owns_dispatcher and self.dispatcher is not None:
+            self.dispatcher.stop()
+
+    def get_detection_stats(self) -> dict:
+        """Get detection latency statistics over recent transitions"""
+        latencies = sorted(
+            t["notify_latency"] for t in self.transitions
+            if t["notify_latency"] is not None
+        )
+        stats = {
+            "slo": self.detection_slo,
+            "transitions": len(latencies),
+            "slo_breaches": self.slo_breaches,
+            "last": self.last_transition,
+        }
+        if latencies:
+            stats["max"] = latencies[-1]
+            stats["median"] = latencies[len(latencies) // 2]
+        return stats
+
     def get_status(self) -> dict:
         """Get current connection status information"""
         return {
             'connected': self.is_connected,
+            'state': self.state,
+            'reason': self.last_probe and self.last_probe['reason'],
+            'errno': self.last_probe and self.last_probe['errno'],
+            'network_down': self.network_down,
+            'flap_percent': self.flap_detector.percent_change,
             'last_check': self.last_check_time,
             'target': f"{self.ip}:{self.port}",
-            'interval': self.interval
-        }
\ No newline at end of file
+            'interval': self.interval,
+            'timeout': self.timeout,
+            'rtt': self.rtt.get_state(),
+            'rtt_histogram': list(self.rtt_histogram),
+            'anomaly': self.anomaly and self.anomaly.get_state(),
+            'detection': self.get_detection_stats()
+        }
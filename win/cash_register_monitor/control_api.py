@@ -0,0 +1,294 @@
+"""
+Local control API for a running monitor
+
+Scripts and the command line talk to the already-running monitor instead of
+starting a second one: a Unix domain socket next to the config on macOS and
+Linux, a named pipe on Windows. Both are handled by
+multiprocessing.connection, so every message is one JSON object; on the Unix
+socket it is framed as a 4-byte big-endian length followed by UTF-8 JSON,
+which any language can speak.
+
+Requests look like {"cmd": "status", "target": "192.168.1.155:4999"}:
+
+    ping                        liveness check
+    status [target]             status of one or all targets
+    probe target                probe "ip:port" now, outside the schedule
+    reload                      re-read config.json and restart the monitors
+    subscribe                   stream {"event": {...}} messages for every
+                                state change until the client disconnects
+
+Replies are {"ok": true, "result": ...} or {"ok": false, "error": "..."}.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from multiprocessing.connection import Client, Listener
+from typing import Any, Callable, Dict, Iterator, Optional
+try:
+    from .connection_monitor import DEFAULT_TIMEOUT
+    from .event_dispatcher import COALESCE
+    from .logging_setup import get_logger
+    from .reachability import tcp_probe
+except ImportError:
+    from connection_monitor import DEFAULT_TIMEOUT
+    from event_dispatcher import COALESCE
+    from logging_setup import get_logger
+    from reachability import tcp_probe
+
+
+logger = get_logger(__name__)
+
+PIPE_NAME = r"\\.\pipe\cash_register_monitor"
+SOCKET_FILENAME = "control.sock"
+MAX_CLIENTS = 16
+SUBSCRIBER_QUEUE = 1000  # events kept per subscribed client before dropping the oldest
+
+
+def default_address(config_dir: str = None) -> str:
+    """Named pipe on Windows, otherwise a Unix socket in the config folder"""
+    if sys.platform == "win32":
+        return PIPE_NAME
+    if config_dir is None:
+        config_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(config_dir, SOCKET_FILENAME)
+
+
+def _family() -> str:
+    return "AF_PIPE" if sys.platform == "win32" else "AF_UNIX"
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, default=_json_default).encode("utf-8")
+
+
+def public_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Event without in-process objects such as the monitor"""
+    return {key: value for key, value in event.items() if key != "monitor"}
+
+
+class ControlServer:
+    """Serve control requests against a MonitorCore"""
+
+    def __init__(self, core, address: str = None, reload: Callable[[], Dict[str, str]] = None):
+        """
+        Args:
+            core: MonitorCore to query and command
+            address: Socket path or pipe name; see default_address()
+            reload: Reloads settings and restarts monitoring, returning
+                validation errors; defaults to reloading the core only
+        """
+        self.core = core
+        self.address = address or default_address(
+            os.path.dirname(core.settings_manager.get_config_path()))
+        self.reload_callback = reload or self._reload_core
+        self.listener = None
+        self.clients = 0
+        self._running = False
+        self._lock = threading.Lock()
+        self.commands = {
+            "ping": lambda request: "pong",
+            "status": self.cmd_status,
+            "probe": self.cmd_probe,
+            "reload": self.cmd_reload,
+        }
+
+    def start(self) -> bool:
+        """Listen in a background thread; False if another monitor already serves"""
+        if self._running:
+            return True
+        if _family() == "AF_UNIX" and os.path.exists(self.address):
+            try:
+                Client(self.address, family="AF_UNIX").close()
+                logger.warning("Control API already served by another monitor",
+                               extra={"address": self.address})
+                return False
+            except OSError:
+                os.unlink(self.address)  # left behind by a crashed run
+        try:
+            self.listener = Listener(self.address, family=_family(), backlog=MAX_CLIENTS)
+        except OSError as e:
+            logger.warning("Could not start control API: %s", e, extra={"address": self.address})
+            return False
+        if _family() == "AF_UNIX":
+            os.chmod(self.address, 0o600)
+        self._running = True
+        threading.Thread(target=self._accept_loop, name="control-accept", daemon=True).start()
+        logger.info("Control API listening", extra={"address": self.address})
+        return True
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        try:
+            # accept() is not interrupted by close(); wake it with a connection
+            Client(self.address, family=_family()).close()
+        except OSError:
+            pass
+        self.listener.close()
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                if self._running:
+                    logger.warning("Control API accept failed")
+                    time.sleep(0.1)
+                continue
+            if not self._running:
+                conn.close()
+                break
+            with self._lock:
+                if self.clients >= MAX_CLIENTS:
+                    conn.close()
+                    continue
+                self.clients += 1
+            threading.Thread(target=self._serve, args=(conn,), name="control-client", daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            while self._running:
+                try:
+                    request = json.loads(conn.recv_bytes().decode("utf-8"))
+                except (EOFError, OSError):
+                    break
+                except ValueError:
+                    conn.send_bytes(encode({"ok": False, "error": "Invalid JSON"}))
+                    continue
+                cmd = request.get("cmd") if isinstance(request, dict) else None
+                if cmd == "subscribe":
+                    self._stream(conn)
+                    break
+                conn.send_bytes(encode(self.handle(request)))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+            with self._lock:
+                self.clients -= 1
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Run one request and build its reply"""
+        command = self.commands.get(request.get("cmd")) if isinstance(request, dict) else None
+        if command is None:
+            return {"ok": False, "error": f"Unknown command; use one of: {', '.join(self.commands)}, subscribe"}
+        try:
+            return {"ok": True, "result": command(request)}
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}
+
+    def cmd_status(self, request):
+        target = request.get("target")
+        if target is not None and target not in self.core.monitors:
+            raise ValueError(f"Unknown target {target}")
+        return self.core.get_status(target)
+
+    def cmd_probe(self, request):
+        target = request.get("target") or (self.core.monitor and self.core.monitor.target)
+        if not target:
+            raise ValueError("No target to probe")
+        ip, _, port = target.rpartition(":")
+        if not ip or not port.isdigit():
+            raise ValueError("Target must be ip:port")
+        monitor = self.core.monitors.get(target)
+        # A one-off probe; the monitor's filters and estimators are left alone
+        timeout = monitor.timeout if monitor else DEFAULT_TIMEOUT
+        return dict(tcp_probe(ip, int(port), timeout), target=target)
+
+    def cmd_reload(self, request):
+        errors = self.reload_callback()
+        return {"errors": errors or {}, "targets": list(self.core.monitors)}
+
+    def _reload_core(self) -> Dict[str, str]:
+        errors = self.core.settings_manager.reload_settings()
+        self.core.restart()
+        return errors
+
+    def _stream(self, conn):
+        """Forward state changes to one client until it goes away"""
+        pending = deque(maxlen=SUBSCRIBER_QUEUE)
+        wakeup = threading.Event()
+
+        def on_events(events):
+            pending.extend(events)
+            wakeup.set()
+
+        subscriber = self.core.dispatcher.subscribe(
+            on_events,
+            name=f"control-{id(conn)}",
+            drop_policy=COALESCE,
+            batch_size=64,
+            accept=lambda event: event["type"] in ("connection", "network", "group")
+        )
+        try:
+            conn.send_bytes(encode({"ok": True, "result": "subscribed"}))
+            while self._running:
+                wakeup.wait(1.0)
+                wakeup.clear()
+                while pending:
+                    # Blocks only this client's thread if it reads slowly
+                    conn.send_bytes(encode({"event": public_event(pending.popleft())}))
+                if conn.poll(0):
+                    # Any message, or EOF, ends the subscription
+                    conn.recv_bytes()
+                    break
+        except (EOFError, OSError):
+            pass
+        finally:
+            self.core.dispatcher.unsubscribe(subscriber)
+
+
+class ControlClient:
+    """Talk to a running monitor's control API"""
+
+    def __init__(self, address: str = None):
+        self.address = address or default_address()
+        self.conn = Client(self.address, family=_family())
+
+    def request(self, cmd: str, **params) -> Any:
+        """Send a request and return its result.
+
+        Raises:
+            RuntimeError: if the monitor reports an error
+        """
+        self.conn.send_bytes(encode(dict(params, cmd=cmd)))
+        reply = json.loads(self.conn.recv_bytes().decode("utf-8"))
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error", "Request failed"))
+        return reply["result"]
+
+    def subscribe(self) -> Iterator[Dict[str, Any]]:
+        """Yield state change events as they happen"""
+        self.request("subscribe")
+        while True:
+            message = json.loads(self.conn.recv_bytes().decode("utf-8"))
+            yield message["event"]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def connect(address: str = None) -> Optional[ControlClient]:
+    """Client for a running monitor, or None if none is listening"""
+    try:
+        return ControlClient(address)
+    except OSError:
+        return None
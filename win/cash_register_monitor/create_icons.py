@@ -1,54 +1,51 @@
 """
 Script to create icon files for the Cash Register Monitor application
+
+Run as a build step (build_executable.py does this before PyInstaller). Besides
+the .ico files it writes icons/icons.pack with every tray icon variant
+pre-rendered at all HiDPI sizes, so the application never draws icons itself.
 """
 
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, ImageFont
 import os
+try:
+    from .icon_pack import (ICON_SIZES, MAX_COUNT_BADGE, OVERLAY_DEGRADED, OVERLAY_FLAPPING,
+                            PACK_FILENAME, icon_name, pack_icons)
+except ImportError:
+    from icon_pack import (ICON_SIZES, MAX_COUNT_BADGE, OVERLAY_DEGRADED, OVERLAY_FLAPPING,
+                           PACK_FILENAME, icon_name, pack_icons)
+
+
+# Tray state colours
+STATE_COLORS = {
+    'green': (0, 180, 0, 255),      # Connected
+    'red': (220, 0, 0, 255),        # Disconnected
+    'yellow': (255, 200, 0, 255),   # Checking / some targets down
+    'orange': (255, 140, 0, 255),   # Flapping
+    'purple': (150, 60, 200, 255),  # Network down
+    'gray': (128, 128, 128, 255)    # Unknown/Idle
+}
+
+# Colours that get N-down count badges in fleet mode
+COUNT_BADGE_COLORS = ('red', 'orange', 'yellow', 'purple')
+
+# Variants are drawn at this size and downscaled with LANCZOS
+RENDER_SIZE = 256
+
+# Image.Resampling was added in Pillow 9.1; older versions only have Image.LANCZOS
+LANCZOS = getattr(Image, 'Resampling', Image).LANCZOS
 
 
 def create_icon(color, filename, size=64):
     """Create a colored circle icon and save as ICO file"""
-    # Create image with transparency
-    image = Image.new('RGBA', (size, size), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(image)
-    
-    # Color mapping
-    colors = {
-        'green': (0, 180, 0, 255),      # Connected
-        'red': (220, 0, 0, 255),        # Disconnected  
-        'yellow': (255, 200, 0, 255),   # Checking
-        'gray': (128, 128, 128, 255)    # Unknown/Idle
-    }
-    
-    color_rgba = colors.get(color, colors['gray'])
-    
-    # Draw circle with border
-    margin = 6
-    border_width = 2
-    
-    # Draw border (darker version of main color)
-    border_color = tuple(max(0, c - 60) if i < 3 else c for i, c in enumerate(color_rgba))
-    draw.ellipse([margin-border_width, margin-border_width, 
-                 size-margin+border_width, size-margin+border_width], 
-                 fill=border_color)
-    
-    # Draw main circle
-    draw.ellipse([margin, margin, size-margin, size-margin], fill=color_rgba)
-    
-    # Add a small highlight for 3D effect
-    highlight_size = size // 4
-    highlight_margin = margin + size // 6
-    highlight_color = tuple(min(255, c + 40) if i < 3 else max(100, c) for i, c in enumerate(color_rgba))
-    draw.ellipse([highlight_margin, highlight_margin, 
-                 highlight_margin + highlight_size, highlight_margin + highlight_size], 
-                 fill=highlight_color)
+    image = render_state_icon(color, size)
     
     # Save as ICO file with multiple sizes
     icon_sizes = [(16, 16), (32, 32), (48, 48), (64, 64)]
     icons = []
     
     for icon_size in icon_sizes:
-        resized = image.resize(icon_size, Image.Resampling.LANCZOS)
+        resized = image.resize(icon_size, LANCZOS)
         icons.append(resized)
     
     # Create icons directory if it doesn't exist
@@ -63,6 +60,105 @@ def create_icon(color, filename, size=64):
     return ico_path
 
 
+def render_state_icon(color, size=RENDER_SIZE):
+    """Draw the base status circle (border, fill, highlight) for a state colour"""
+    image = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    color_rgba = STATE_COLORS.get(color, STATE_COLORS['gray'])
+    
+    margin = size * 6 // 64
+    border_width = max(1, size * 2 // 64)
+    border_color = tuple(max(0, c - 60) if i < 3 else c for i, c in enumerate(color_rgba))
+    draw.ellipse([margin - border_width, margin - border_width,
+                  size - margin + border_width, size - margin + border_width],
+                 fill=border_color)
+    draw.ellipse([margin, margin, size - margin, size - margin], fill=color_rgba)
+    
+    highlight_size = size // 4
+    highlight_margin = margin + size // 6
+    highlight_color = tuple(min(255, c + 40) if i < 3 else max(100, c) for i, c in enumerate(color_rgba))
+    draw.ellipse([highlight_margin, highlight_margin,
+                  highlight_margin + highlight_size, highlight_margin + highlight_size],
+                 fill=highlight_color)
+    return image
+
+
+def load_badge_font(size):
+    """A scalable bold font for count badges, falling back to PIL's default"""
+    for name in ("arialbd.ttf", "DejaVuSans-Bold.ttf", "Arial Bold.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 has only the fixed bitmap font
+        return ImageFont.load_default()
+
+
+def draw_overlay(image, overlay=None, count=None):
+    """Draw a flapping, degraded or N-down badge overlay onto a state icon"""
+    size = image.width
+    draw = ImageDraw.Draw(image)
+    
+    if overlay == OVERLAY_FLAPPING:
+        # White zigzag across the middle
+        points = [(size * x // 8, size // 2 + (size // 8 if i % 2 else -size // 8))
+                  for i, x in enumerate(range(1, 8))]
+        draw.line(points, fill=(255, 255, 255, 255), width=max(2, size // 14), joint="curve")
+    elif overlay == OVERLAY_DEGRADED:
+        # Amber warning dot in the lower right corner
+        dot = size * 3 // 8
+        draw.ellipse([size - dot, size - dot, size - 1, size - 1],
+                     fill=(40, 40, 40, 255))
+        inset = max(1, size // 32)
+        draw.ellipse([size - dot + inset, size - dot + inset, size - 1 - inset, size - 1 - inset],
+                     fill=(255, 190, 0, 255))
+    
+    if count:
+        text = "9+" if count >= MAX_COUNT_BADGE else str(count)
+        badge = size * 9 // 16
+        draw.ellipse([size - badge, 0, size - 1, badge - 1], fill=(255, 255, 255, 255),
+                     outline=(40, 40, 40, 255), width=max(1, size // 40))
+        font = load_badge_font(badge * 3 // 4 if len(text) == 1 else badge * 9 // 16)
+        draw.text((size - badge / 2, badge / 2), text, fill=(20, 20, 20, 255),
+                  font=font, anchor="mm")
+    return image
+
+
+def icon_variants():
+    """Yield (name, color, overlay, count) for every icon in the pack"""
+    for color in STATE_COLORS:
+        yield icon_name(color), color, None, None
+        for overlay in (OVERLAY_FLAPPING, OVERLAY_DEGRADED):
+            yield icon_name(color, overlay), color, overlay, None
+    for color in COUNT_BADGE_COLORS:
+        for count in range(1, MAX_COUNT_BADGE + 1):
+            yield icon_name(color, count=count), color, None, count
+
+
+def build_icon_pack(path=None):
+    """Render all variants at all sizes and write the packed icon file"""
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'icons', PACK_FILENAME)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    frames = []
+    for name, color, overlay, count in icon_variants():
+        image = draw_overlay(render_state_icon(color), overlay, count)
+        for size in ICON_SIZES:
+            resized = image.resize((size, size), LANCZOS)
+            frames.append((name, size, size, resized.tobytes()))
+    
+    data = pack_icons(frames)
+    with open(path, 'wb') as f:
+        f.write(data)
+    
+    print(f"Created {path} ({len(frames)} frames, {len(data) / 1024:.0f} KB)")
+    return path
+
+
 def main():
     """Create all icon files"""
     print("Creating icon files for Cash Register Monitor...")
@@ -73,6 +169,9 @@ def main():
     create_icon('yellow', 'checking.ico')
     create_icon('gray', 'unknown.ico')
     
+    # Pre-rendered variants loaded by the tray at runtime
+    build_icon_pack()
+    
     print("All icon files created successfully!")
     
     # Also create a larger PNG version for the application
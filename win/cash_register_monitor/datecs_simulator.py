@@ -0,0 +1,480 @@
+"""
+Datecs fiscal printer simulator for protocol-level load testing
+
+Speaks the Datecs framed protocol (preamble, length, sequence, command,
+data, status bytes, BCC, terminator) over TCP so the monitor can be
+exercised without real hardware. Many simulated registers can run on a
+single asyncio event loop in one process.
+
+Run standalone:
+    python datecs_simulator.py --count 500 --base-port 5000 --latency 0.005
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Protocol control bytes
+PREAMBLE = 0x01
+SEPARATOR = 0x04
+POSTAMBLE = 0x05
+TERMINATOR = 0x03
+NAK = 0x15
+SYN = 0x16
+
+# Sequence numbers and command codes are limited to this range
+MIN_CODE = 0x20
+MAX_CODE = 0x7F
+MAX_DATA_LENGTH = 213
+
+# How often a busy printer sends SYN while a command is being processed
+SYN_INTERVAL = 0.06
+
+# Commands understood by the simulator
+CMD_DATE_TIME = 0x3E
+CMD_STATUS = 0x4A
+CMD_DIAGNOSTIC = 0x5A
+
+# Status flag name -> (status byte index, bit mask)
+STATUS_FLAGS = {
+    "syntax_error": (0, 0x01),
+    "invalid_command": (0, 0x02),
+    "clock_not_set": (0, 0x04),
+    "mechanism_error": (0, 0x10),
+    "cover_open": (0, 0x40),
+    "paper_out": (2, 0x01),
+    "paper_near_end": (2, 0x02),
+    "fiscal_memory_error": (4, 0x01),
+    "fiscal_memory_low": (4, 0x08),
+    "fiscal_memory_full": (4, 0x10),
+}
+
+# Flags that also raise the general error bit (0.5)
+GENERAL_ERROR_FLAGS = ("syntax_error", "invalid_command", "mechanism_error",
+                       "cover_open", "paper_out")
+
+
+class FrameError(ValueError):
+    """Raised when a received frame is malformed or fails the BCC check"""
+
+
+def compute_bcc(body: bytes) -> bytes:
+    """Compute the 4-byte BCC (sum of body bytes, one nibble per byte + 0x30)"""
+    total = sum(body) & 0xFFFF
+    return bytes(0x30 + ((total >> shift) & 0x0F) for shift in (12, 8, 4, 0))
+
+
+def build_request(seq: int, cmd: int, data: bytes = b"") -> bytes:
+    """Build a host -> printer request frame"""
+    if len(data) > MAX_DATA_LENGTH:
+        raise ValueError(f"Request data too long: {len(data)} bytes")
+    length = MIN_CODE + 4 + len(data)
+    body = bytes([length, seq, cmd]) + data + bytes([POSTAMBLE])
+    return bytes([PREAMBLE]) + body + compute_bcc(body) + bytes([TERMINATOR])
+
+
+def build_response(seq: int, cmd: int, data: bytes, status: bytes) -> bytes:
+    """Build a printer -> host response frame carrying 6 status bytes"""
+    if len(status) != 6:
+        raise ValueError("Status must be exactly 6 bytes")
+    if len(data) > MAX_DATA_LENGTH:
+        raise ValueError(f"Response data too long: {len(data)} bytes")
+    length = MIN_CODE + 4 + len(data) + 1 + len(status)
+    body = (bytes([length, seq, cmd]) + data + bytes([SEPARATOR]) + status
+            + bytes([POSTAMBLE]))
+    return bytes([PREAMBLE]) + body + compute_bcc(body) + bytes([TERMINATOR])
+
+
+def parse_frame(buffer: bytes, response: bool = False) -> Tuple[Optional[Dict[str, Any]], int]:
+    """Parse one frame from the start of buffer.
+
+    Leading SYN/NAK bytes and garbage before the preamble are skipped.
+
+    Args:
+        buffer: Received bytes
+        response: True to parse a printer response (with status bytes)
+
+    Returns:
+        (frame, consumed) where frame is None if more data is needed.
+        Frame is a dict with 'seq', 'cmd', 'data' and, for responses, 'status'.
+
+    Raises:
+        FrameError: If a complete frame is malformed or the BCC does not match
+    """
+    start = buffer.find(bytes([PREAMBLE]))
+    if start < 0:
+        return None, len(buffer)
+    if len(buffer) < start + 2:
+        return None, start
+
+    length = buffer[start + 1] - MIN_CODE
+    if length < 4:
+        raise FrameError(f"Invalid length byte 0x{buffer[start + 1]:02X}")
+    end = start + 1 + length + 4 + 1
+    if len(buffer) < end:
+        return None, start
+
+    body = buffer[start + 1:start + 1 + length]
+    bcc = buffer[start + 1 + length:end - 1]
+    if buffer[end - 1] != TERMINATOR or body[-1] != POSTAMBLE:
+        raise FrameError("Missing postamble or terminator")
+    if bcc != compute_bcc(body):
+        raise FrameError("BCC mismatch")
+
+    frame = {"seq": body[1], "cmd": body[2]}
+    payload = body[3:-1]
+    if response:
+        if len(payload) < 7 or payload[-7] != SEPARATOR:
+            raise FrameError("Missing status separator")
+        frame["data"] = payload[:-7]
+        frame["status"] = payload[-6:]
+    else:
+        frame["data"] = payload
+    return frame, end
+
+
+def decode_status(status: bytes) -> Dict[str, bool]:
+    """Decode 6 status bytes into a flag name -> bool mapping"""
+    return {
+        name: bool(status[index] & mask)
+        for name, (index, mask) in STATUS_FLAGS.items()
+    }
+
+
+class SimulatedRegister:
+    """A single simulated Datecs register with scriptable status and faults"""
+
+    def __init__(self, name: str = "FP-2000", latency: float = 0.0,
+                 jitter: float = 0.0, nak_rate: float = 0.0,
+                 drop_rate: float = 0.0, corrupt_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.nak_rate = nak_rate
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        # While set the port is closed, so a connect is refused (see set_refuse_connections)
+        self.refuse_connections = False
+        self.flags = {flag: False for flag in STATUS_FLAGS}
+        self.host = None
+        self.port = None
+        self.stats = {
+            "connections": 0,
+            "requests": 0,
+            "responses": 0,
+            "naks": 0,
+            "dropped": 0,
+            "corrupted": 0,
+            "bad_frames": 0,
+        }
+        self._random = random.Random(seed)
+        self._server = None
+        self._started = False
+        self._clients = set()
+        self._last_seq = None
+        self._last_response = None
+
+    def set_flags(self, **flags: bool):
+        """Set one or more status flags, e.g. set_flags(paper_out=True)"""
+        for flag, value in flags.items():
+            if flag not in STATUS_FLAGS:
+                raise KeyError(f"Unknown status flag: {flag}")
+            self.flags[flag] = bool(value)
+
+    def status_bytes(self) -> bytes:
+        """Build the 6 status bytes for the current flag state"""
+        status = bytearray([0x80] * 6)
+        for flag, enabled in self.flags.items():
+            if enabled:
+                index, mask = STATUS_FLAGS[flag]
+                status[index] |= mask
+        if any(self.flags[flag] for flag in GENERAL_ERROR_FLAGS):
+            status[0] |= 0x20
+        if self.flags["fiscal_memory_error"] or self.flags["fiscal_memory_full"]:
+            status[4] |= 0x20
+        return bytes(status)
+
+    def execute(self, frame: Dict[str, Any]) -> bytes:
+        """Execute a parsed request and return the response frame"""
+        cmd = frame["cmd"]
+        status = bytearray(self.status_bytes())
+
+        if cmd == CMD_STATUS:
+            data = b""
+        elif cmd == CMD_DIAGNOSTIC:
+            data = f"{self.name},SIM,1.00,DT000000,00000000".encode("cp1251")
+        elif cmd == CMD_DATE_TIME:
+            data = time.strftime("%d-%m-%y %H:%M:%S").encode("ascii")
+        else:
+            data = b""
+            status[0] |= 0x22  # invalid command + general error
+
+        return build_response(frame["seq"], cmd, data, bytes(status))
+
+    def _response_delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    async def _handle_client(self, reader: asyncio.StreamReader,
+                             writer: asyncio.StreamWriter):
+        self.stats["connections"] += 1
+        task = asyncio.current_task()
+        self._clients.add(task)
+        buffer = b""
+        try:
+            while True:
+                chunk = await reader.read(4096)
+                if not chunk:
+                    break
+                buffer += chunk
+
+                while buffer:
+                    try:
+                        frame, consumed = parse_frame(buffer)
+                    except FrameError:
+                        # Drop up to the next preamble and ask for a resend
+                        self.stats["bad_frames"] += 1
+                        next_start = buffer.find(bytes([PREAMBLE]), 1)
+                        buffer = buffer[next_start:] if next_start > 0 else b""
+                        writer.write(bytes([NAK]))
+                        continue
+
+                    buffer = buffer[consumed:]
+                    if frame is None:
+                        break
+                    await self._respond(frame, writer)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._clients.discard(task)
+            writer.close()
+
+    async def _respond(self, frame: Dict[str, Any], writer: asyncio.StreamWriter):
+        self.stats["requests"] += 1
+
+        roll = self._random.random()
+        if roll < self.drop_rate:
+            self.stats["dropped"] += 1
+            return
+        if roll < self.drop_rate + self.nak_rate:
+            self.stats["naks"] += 1
+            writer.write(bytes([NAK]))
+            return
+
+        # A repeated sequence number means the host missed our answer;
+        # resend it without executing the command again.
+        if frame["seq"] == self._last_seq and self._last_response is not None:
+            response = self._last_response
+        else:
+            response = self.execute(frame)
+            self._last_seq = frame["seq"]
+            self._last_response = response
+
+        delay = self._response_delay()
+        while delay > SYN_INTERVAL:
+            await asyncio.sleep(SYN_INTERVAL)
+            writer.write(bytes([SYN]))
+            delay -= SYN_INTERVAL
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self._random.random() < self.corrupt_rate:
+            self.stats["corrupted"] += 1
+            response = response[:-2] + bytes([response[-2] ^ 0x01]) + response[-1:]
+
+        writer.write(response)
+        self.stats["responses"] += 1
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        """Start listening; port 0 picks a free port"""
+        self._server = await asyncio.start_server(self._handle_client, host, port)
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+        self._started = True
+        if self.refuse_connections:
+            await self._close()
+
+    async def set_refuse_connections(self, refuse: bool):
+        """Act like a register whose service is down, or bring it back.
+
+        The listening socket is closed, so a connect gets ECONNREFUSED just
+        like from a real register with nothing on the port; open connections
+        are dropped. Listening resumes on the same port.
+        """
+        self.refuse_connections = bool(refuse)
+        if not self._started:
+            return
+        if refuse:
+            await self._close()
+        elif self._server is None:
+            self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+
+    async def _close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        clients = list(self._clients)
+        for task in clients:
+            task.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
+
+    async def stop(self):
+        """Stop listening and drop any open client connections"""
+        self._started = False
+        await self._close()
+
+
+class SimulatorFleet:
+    """Runs many simulated registers on one event loop in a background thread"""
+
+    def __init__(self):
+        self.registers: List[SimulatedRegister] = []
+        self.loop = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._ready.set()
+        self.loop.run_forever()
+
+    def _submit(self, coroutine, timeout: float = 30):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def start(self, count: int, host: str = "127.0.0.1", base_port: int = 0,
+              **register_options) -> List[Tuple[str, int]]:
+        """Start count registers and return their (host, port) addresses.
+
+        With base_port=0 every register gets a free ephemeral port, otherwise
+        ports base_port .. base_port + count - 1 are used.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run_loop, daemon=True)
+            self._thread.start()
+            self._ready.wait()
+
+        seed = register_options.pop("seed", None)
+        new_registers = []
+        for i in range(count):
+            register = SimulatedRegister(
+                seed=None if seed is None else seed + i, **register_options
+            )
+            port = base_port + i if base_port else 0
+            self._submit(register.start(host, port))
+            new_registers.append(register)
+
+        self.registers.extend(new_registers)
+        return [(register.host, register.port) for register in new_registers]
+
+    def run_script(self, steps: List[Dict[str, Any]]):
+        """Schedule status changes on the fleet.
+
+        Each step is a dict with 'at' (seconds from now), optional 'register'
+        (index, default all) and any of the status flag names, or
+        'refuse_connections', 'latency', 'drop_rate', 'nak_rate'.
+        """
+        for step in steps:
+            step = dict(step)
+            delay = float(step.pop("at", 0))
+            index = step.pop("register", None)
+            targets = self.registers if index is None else [self.registers[index]]
+            self.loop.call_soon_threadsafe(
+                self.loop.call_later, delay, self._apply_step, targets, step
+            )
+
+    @staticmethod
+    def _apply_step(registers: List[SimulatedRegister], step: Dict[str, Any]):
+        flags = {key: value for key, value in step.items() if key in STATUS_FLAGS}
+        options = {key: value for key, value in step.items() if key not in STATUS_FLAGS}
+        refuse = options.pop("refuse_connections", None)
+        for register in registers:
+            register.set_flags(**flags)
+            for key, value in options.items():
+                setattr(register, key, value)
+            if refuse is not None:
+                asyncio.ensure_future(register.set_refuse_connections(refuse))
+
+    def set_refuse_connections(self, refuse: bool, index: Optional[int] = None):
+        """Close (or reopen) the port of one register, default all, and wait until done"""
+        registers = self.registers if index is None else [self.registers[index]]
+        for register in registers:
+            self._submit(register.set_refuse_connections(refuse))
+
+    def get_stats(self) -> Dict[str, int]:
+        """Sum request/fault counters across all registers"""
+        totals: Dict[str, int] = {}
+        for register in self.registers:
+            for key, value in register.stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def stop(self):
+        """Stop all registers and the event loop thread"""
+        if self.loop is None:
+            return
+        for register in self.registers:
+            self._submit(register.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.loop.close()
+        self.loop = None
+        self._thread = None
+        self._ready.clear()
+        self.registers = []
+
+
+def main():
+    """Run a simulated fleet until interrupted"""
+    parser = argparse.ArgumentParser(description="Datecs fiscal printer simulator")
+    parser.add_argument("--count", type=int, default=1, help="Number of registers")
+    parser.add_argument("--host", default="127.0.0.1", help="Listen address")
+    parser.add_argument("--base-port", type=int, default=4999,
+                        help="First port (0 = ephemeral ports)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Response latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency jitter (s)")
+    parser.add_argument("--nak-rate", type=float, default=0.0, help="Fraction of NAK replies")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of dropped requests")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="Fraction of bad BCC replies")
+    parser.add_argument("--script", help="JSON file with a list of timed status changes")
+    for flag in STATUS_FLAGS:
+        parser.add_argument(f"--{flag.replace('_', '-')}", action="store_true",
+                            help=f"Start with {flag.replace('_', ' ')} set")
+    args = parser.parse_args()
+
+    fleet = SimulatorFleet()
+    addresses = fleet.start(
+        args.count, host=args.host, base_port=args.base_port,
+        latency=args.latency, jitter=args.jitter, nak_rate=args.nak_rate,
+        drop_rate=args.drop_rate, corrupt_rate=args.corrupt_rate,
+    )
+    initial_flags = {flag: True for flag in STATUS_FLAGS if getattr(args, flag)}
+    if initial_flags:
+        fleet.run_script([dict(at=0, **initial_flags)])
+    if args.script:
+        with open(args.script, "r") as f:
+            fleet.run_script(json.load(f))
+
+    print(f"Simulating {len(addresses)} register(s) on {args.host}, "
+          f"ports {addresses[0][1]}..{addresses[-1][1]}")
+    print("Press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"Stats: {fleet.get_stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fleet.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Non-blocking event dispatch from the probe threads to slow consumers
+
+publish() only appends to per-subscriber bounded queues and never blocks,
+so a slow tray redraw, history write or notification cannot delay the next
+probe. A small worker pool drains the queues and delivers events in
+batches; each subscriber is served by one worker at a time so its events
+stay in order.
+"""
+
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List
+try:
+    from .logging_setup import get_logger
+except ImportError:
+    from logging_setup import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# What to do when a subscriber's queue is full
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+COALESCE = "coalesce"  # keep only the latest event per key (e.g. per target)
+
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, COALESCE)
+
+
+class Subscriber:
+    """A consumer of dispatched events with its own bounded queue"""
+
+    def __init__(self, callback: Callable, name: str = None, max_queue: int = 1000,
+                 drop_policy: str = DROP_OLDEST, batch_size: int = 1,
+                 key: Callable[[Dict[str, Any]], Any] = None,
+                 accept: Callable[[Dict[str, Any]], bool] = None):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.callback = callback
+        self.name = name or getattr(callback, "__name__", "subscriber")
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        self.batch_size = batch_size
+        self.key = key or (lambda event: event.get("target"))
+        self.accept = accept
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.active = True
+        self._queue = OrderedDict() if drop_policy == COALESCE else deque()
+        self._scheduled = False
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        """Queue an event, applying the drop policy. Caller holds the lock."""
+        if self.accept is not None and not self.accept(event):
+            return False
+        if self.drop_policy == COALESCE:
+            key = self.key(event)
+            if key in self._queue:
+                # Replace the stale update but keep its place in line
+                self._queue[key] = event
+                self.dropped += 1
+                return True
+            if len(self._queue) >= self.max_queue:
+                self._queue.popitem(last=False)
+                self.dropped += 1
+            self._queue[key] = event
+            return True
+
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            if self.drop_policy == DROP_NEWEST:
+                return False
+            self._queue.popleft()
+        self._queue.append(event)
+        return True
+
+    def take_batch(self) -> List[Dict[str, Any]]:
+        """Remove up to batch_size events. Caller holds the lock."""
+        batch = []
+        while self._queue and len(batch) < self.batch_size:
+            if self.drop_policy == COALESCE:
+                batch.append(self._queue.popitem(last=False)[1])
+            else:
+                batch.append(self._queue.popleft())
+        return batch
+
+    def deliver(self, batch: List[Dict[str, Any]]):
+        """Hand a batch to the callback (a list if batch_size > 1)"""
+        if self.batch_size > 1:
+            self.callback(batch)
+        else:
+            for event in batch:
+                self.callback(event)
+        self.delivered += len(batch)
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+
+class EventDispatcher:
+    """Fans events out to subscribers and delivers them from a worker pool"""
+
+    def __init__(self, workers: int = 2, name: str = "dispatch"):
+        self.workers = workers
+        self.name = name
+        self.subscribers: List[Subscriber] = []
+        self.published = 0
+        self._lock = threading.Lock()
+        self._ready = deque()
+        self._work_available = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._running = False
+
+    def subscribe(self, callback: Callable, **options) -> Subscriber:
+        """Register a consumer. See Subscriber for options."""
+        subscriber = Subscriber(callback, **options)
+        with self._lock:
+            self.subscribers = self.subscribers + [subscriber]
+        self.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """Remove a consumer; queued events for it are discarded.
+
+        Once this returns no further batch is delivered to it; one a worker
+        is already handing over may still finish.
+        """
+        with self._lock:
+            self.subscribers = [s for s in self.subscribers if s is not subscriber]
+            subscriber.active = False
+            subscriber._queue.clear()
+            if subscriber in self._ready:
+                self._ready.remove(subscriber)
+                subscriber._scheduled = False
+
+    def publish(self, event: Dict[str, Any]):
+        """Queue an event for every subscriber without blocking on consumers"""
+        with self._lock:
+            self.published += 1
+            for subscriber in self.subscribers:
+                if not subscriber.offer(event) and not subscriber.pending():
+                    continue
+                if not subscriber._scheduled:
+                    subscriber._scheduled = True
+                    self._ready.append(subscriber)
+            self._work_available.notify(len(self._ready))
+
+    def start(self):
+        """Start the worker pool (called automatically on first subscribe)"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._threads = [
+                threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 1):
+        """Stop the workers; undelivered events are discarded"""
+        with self._lock:
+            self._running = False
+            self._work_available.notify_all()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=timeout)
+        self._threads = []
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while self._running and not self._ready:
+                    self._work_available.wait()
+                if not self._running:
+                    return
+                subscriber = self._ready.popleft()
+                batch = subscriber.take_batch()
+
+            try:
+                if batch and subscriber.active:
+                    subscriber.deliver(batch)
+            except Exception as e:
+                subscriber.errors += 1
+                logger.warning("Error in event subscriber %s: %s", subscriber.name, e,
+                               extra={"subscriber": subscriber.name})
+
+            with self._lock:
+                # Requeue at the back so one busy subscriber cannot starve others
+                if subscriber.pending() and subscriber in self.subscribers:
+                    self._ready.append(subscriber)
+                    self._work_available.notify()
+                else:
+                    subscriber._scheduled = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-subscriber delivery counters"""
+        with self._lock:
+            return {
+                "published": self.published,
+                "subscribers": {
+                    s.name: {
+                        "pending": s.pending(),
+                        "delivered": s.delivered,
+                        "dropped": s.dropped,
+                        "errors": s.errors,
+                    }
+                    for s in self.subscribers
+                },
+            }
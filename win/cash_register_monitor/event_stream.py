@@ -0,0 +1,252 @@
+"""
+Server-Sent Events stream of state changes and latency samples
+
+Dashboards connect to GET /events and receive every state transition and,
+per probe, a latency sample, instead of polling the status of every target.
+Each event's SSE id is "<epoch>-<seq>": a sequence number prefixed with an
+epoch that is new every time the monitor starts. The hub keeps the most
+recent events in a ring buffer; a client that reconnects with Last-Event-ID
+(or ?since=ID) gets only what changed after that id, coalesced to the latest
+event per target. If the id is older than the buffer or from an earlier run,
+it gets one "snapshot" event with the full status instead.
+
+Every client has a bounded buffer of its own that also coalesces: while a
+slow client catches up, a newer sample or state for a target replaces the
+queued one, so memory per client stays bounded and nothing stale is sent.
+
+GET /status returns the full status as JSON with the current event id.
+"""
+
+import threading
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+try:
+    from .control_api import encode, public_event
+    from .event_dispatcher import DROP_OLDEST
+    from .logging_setup import get_logger
+except ImportError:
+    from control_api import encode, public_event
+    from event_dispatcher import DROP_OLDEST
+    from logging_setup import get_logger
+
+
+logger = get_logger(__name__)
+
+STREAM_EVENT_TYPES = ("connection", "network", "group", "sample")
+RING_SIZE = 10000       # recent events kept for resuming clients
+CLIENT_BUFFER = 1000    # targets pending per client before the oldest is dropped
+KEEPALIVE = 15.0        # seconds between comments that keep idle connections open
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Split an "<epoch>-<seq>" event id; None if it is missing or malformed"""
+    epoch, _, seq = (value or "").strip().rpartition("-")
+    if not epoch or not seq.isdigit():
+        return None
+    return epoch, int(seq)
+
+
+def event_key(event: Dict[str, Any]) -> Tuple[str, Any]:
+    """Coalescing key: a newer event with the same key makes the older one stale"""
+    return event["type"], event.get("target")
+
+
+class StreamClient:
+    """Pending events for one connected client, coalesced per target"""
+
+    def __init__(self, max_pending: int = CLIENT_BUFFER):
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.coalesced = 0
+        self._pending: "OrderedDict[Tuple, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        self._ready = threading.Condition()
+
+    def offer(self, seq: int, event: Dict[str, Any]):
+        with self._ready:
+            key = event_key(event)
+            if key in self._pending:
+                # Move to the back: it is sent in sequence order
+                del self._pending[key]
+                self.coalesced += 1
+            elif len(self._pending) >= self.max_pending:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+            self._pending[key] = (seq, event)
+            self._ready.notify()
+
+    def take(self, timeout: float) -> List[Tuple[int, Dict[str, Any]]]:
+        """Wait up to timeout for events and take all pending ones"""
+        with self._ready:
+            if not self._pending:
+                self._ready.wait(timeout)
+            items = list(self._pending.values())
+            self._pending.clear()
+        return items
+
+    def wake(self):
+        with self._ready:
+            self._ready.notify()
+
+
+class EventStream:
+    """Sequence-numbered event hub fed by the core's dispatcher"""
+
+    def __init__(self, core, host: str = "127.0.0.1", port: int = 8765,
+                 ring_size: int = RING_SIZE):
+        self.core = core
+        self.host = host
+        self.port = port
+        # Sequence numbers restart with every run; the epoch tells runs apart
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.ring: "deque[Tuple[int, Dict[str, Any]]]" = deque(maxlen=ring_size)
+        self.clients: List[StreamClient] = []
+        self.server = None
+        self.subscriber = None
+        self.running = False
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+        except OSError as e:
+            logger.warning("Could not start event stream: %s", e, extra={"port": self.port})
+            return False
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.running = True
+        self.subscriber = self.core.dispatcher.subscribe(
+            self.on_events,
+            name="event-stream",
+            drop_policy=DROP_OLDEST,
+            max_queue=10000,
+            batch_size=256,
+            accept=lambda event: event["type"] in STREAM_EVENT_TYPES
+        )
+        threading.Thread(target=self.server.serve_forever, name="event-stream", daemon=True).start()
+        logger.info("Event stream listening", extra={"host": self.host, "port": self.port})
+        return True
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.core.dispatcher.unsubscribe(self.subscriber)
+        with self._lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.wake()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def on_events(self, events: List[Dict[str, Any]]):
+        """Number a batch of events and hand them to every client"""
+        with self._lock:
+            numbered = []
+            for event in events:
+                self.seq += 1
+                item = (self.seq, public_event(event))
+                self.ring.append(item)
+                numbered.append(item)
+            clients = list(self.clients)
+        for client in clients:
+            for seq, event in numbered:
+                client.offer(seq, event)
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def attach(self, last_id: Optional[str]) -> Tuple[StreamClient, List[Tuple[int, Dict[str, Any]]]]:
+        """Register a client and work out what it missed since the given event id"""
+        client = StreamClient()
+        parsed = parse_event_id(last_id)
+        with self._lock:
+            self.clients.append(client)
+            if last_id is None:
+                return client, []
+            epoch, since = parsed or (None, None)
+            if epoch == self.epoch and since == self.seq:
+                return client, []
+            oldest = self.ring[0][0] if self.ring else self.seq + 1
+            if epoch != self.epoch or since > self.seq or since < oldest - 1:
+                # From before a restart or too far behind for a delta: send everything once
+                return client, [(self.seq, {"type": "snapshot", "targets": self.core.get_status(),
+                                            "timestamp": datetime.now()})]
+            missed = OrderedDict()
+            for seq, event in self.ring:
+                if seq > since:
+                    key = event_key(event)
+                    missed.pop(key, None)
+                    missed[key] = (seq, event)
+            return client, list(missed.values())
+
+    def detach(self, client: StreamClient):
+        with self._lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+
+def _make_handler(stream: EventStream):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug("Event stream request: " + format, *args)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/events":
+                self.send_events(parse_qs(url.query))
+            elif url.path == "/status":
+                with stream._lock:
+                    seq = stream.seq
+                body = encode({"id": stream.event_id(seq), "seq": seq,
+                               "targets": stream.core.get_status()})
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_error(404)
+
+        def send_events(self, query):
+            last_id = self.headers.get("Last-Event-ID") or (query.get("since") or [None])[0]
+            client, missed = stream.attach(last_id)
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "keep-alive")
+                self.end_headers()
+                self.write_events(missed)
+                while stream.running:
+                    items = client.take(KEEPALIVE)
+                    if items:
+                        self.write_events(items)
+                    else:
+                        self.wfile.write(b": keepalive\n\n")
+                        self.wfile.flush()
+            except OSError:
+                pass  # client went away
+            finally:
+                stream.detach(client)
+                self.close_connection = True
+
+        def write_events(self, items):
+            if not items:
+                return
+            chunks = []
+            for seq, event in items:
+                chunks.append(b"id: %s\nevent: %s\ndata: " % (stream.event_id(seq).encode("ascii"),
+                                                                 event["type"].encode("ascii")))
+                chunks.append(encode(event))
+                chunks.append(b"\n\n")
+            self.wfile.write(b"".join(chunks))
+            self.wfile.flush()
+
+    return Handler
@@ -0,0 +1,122 @@
+"""
+Aggregated state of many registers for the fleet tray icon
+
+FleetSummary keeps the current state of every target and a count per
+state. A transition adjusts two counters and the down-set, so it costs
+O(1) no matter how many registers are monitored; the icon colour and
+"3 down / 120" text are read straight from the counters. Only the list of
+down targets is ever iterated, and only when a menu or tooltip asks.
+"""
+
+import itertools
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+try:
+    from .state_filter import STATE_CONNECTED, STATE_DEGRADED, STATE_DISCONNECTED, STATE_FLAPPING
+except ImportError:
+    from state_filter import STATE_CONNECTED, STATE_DEGRADED, STATE_DISCONNECTED, STATE_FLAPPING
+
+
+class FleetSummary:
+    """Incrementally maintained per-state counts over a set of targets"""
+
+    def __init__(self, targets: Iterable[str], names: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            targets: Target keys ("ip:port") to track
+            names: Optional display names by target
+        """
+        self.states: Dict[str, Optional[str]] = {target: None for target in targets}
+        self.names = names or {}
+        self.total = len(self.states)
+        self.counts = Counter({None: self.total})
+        self.network_down = False
+        # Insertion ordered: oldest outage first
+        self._down: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    def update(self, target: str, state: Optional[str], timestamp: datetime = None) -> bool:
+        """Record a target's new state; returns whether anything changed"""
+        with self._lock:
+            if target not in self.states:
+                return False
+            old = self.states[target]
+            if old == state:
+                return False
+            self.states[target] = state
+            self.counts[old] -= 1
+            self.counts[state] += 1
+            if state == STATE_DISCONNECTED:
+                self._down[target] = timestamp or datetime.now()
+            elif old == STATE_DISCONNECTED:
+                del self._down[target]
+            return True
+
+    def process(self, event: Dict[str, Any]) -> bool:
+        """Apply a dispatcher event; returns whether the summary changed"""
+        if event["type"] == "network":
+            changed = self.network_down == event["network_up"]
+            self.network_down = not event["network_up"]
+            return changed
+        if event["type"] == "connection":
+            return self.update(event["target"], event["state"], event["timestamp"])
+        return False
+
+    @property
+    def down(self) -> int:
+        return self.counts[STATE_DISCONNECTED]
+
+    @property
+    def flapping(self) -> int:
+        return self.counts[STATE_FLAPPING]
+
+    @property
+    def degraded(self) -> int:
+        return self.counts[STATE_DEGRADED]
+
+    @property
+    def up(self) -> int:
+        """Registers that answer, degraded ones included"""
+        return self.counts[STATE_CONNECTED] + self.degraded
+
+    @property
+    def unknown(self) -> int:
+        return self.counts[None]
+
+    def get_color(self) -> str:
+        """Severity color: red if at least half are down, yellow if some are"""
+        if self.network_down:
+            return 'purple'
+        if self.unknown == self.total:
+            return 'gray'
+        if self.down and self.down * 2 >= self.total:
+            return 'red'
+        if self.down:
+            return 'yellow'
+        if self.flapping:
+            return 'orange'
+        return 'green'
+
+    def get_text(self) -> str:
+        """Short summary such as "3 down / 120" """
+        if self.network_down:
+            return f"Network down ({self.total} registers)"
+        if self.down:
+            text = f"{self.down} down / {self.total}"
+        elif self.unknown == self.total:
+            text = f"Checking {self.total} registers..."
+        else:
+            text = f"All {self.up} up" if not self.unknown else f"{self.up} up / {self.total}"
+        if self.flapping:
+            text += f", {self.flapping} flapping"
+        if self.degraded:
+            text += f", {self.degraded} degraded"
+        return text
+
+    def get_down(self, limit: int = None) -> List[Tuple[str, str, datetime]]:
+        """Currently down targets as (target, name, since), oldest outage first"""
+        with self._lock:
+            items = list(itertools.islice(self._down.items(), limit))
+        return [(target, self.names.get(target, target), since) for target, since in items]
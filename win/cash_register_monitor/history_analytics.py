@@ -0,0 +1,423 @@
+"""
+Vectorized analytics over the probe history (needs NumPy)
+
+Day files are memory-mapped as structured arrays whose dtype mirrors
+probe_history.RECORD, so loading costs no parsing. HistoryFrame keeps them
+mapped and runs every query as array operations over one day file at a
+time, so memory follows the size of a day and of the result, not of the
+period; Python only loops over targets, days or results, never over
+samples:
+
+    availability()        rolling share of up probes per target
+    latency_by_hour()     RTT percentiles per hour of day, per target or store
+    co_outages()          pairs of targets that were down at the same time
+    outage_events()       periods in which several targets were down at once
+    rtt_change_points()   lasting shifts in a target's RTT level
+
+NumPy is optional (it is left out of the tray executable); the module only
+fails when a frame is loaded without it.
+"""
+
+import os
+import socket
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence
+try:
+    from .probe_history import FLAG_NETWORK_DOWN, FORMAT_VERSION, HEADER, MAGIC, RECORD, history_files
+    from .state_filter import STATE_DISCONNECTED
+    from .state_snapshot import STATE_CODES
+except ImportError:
+    from probe_history import FLAG_NETWORK_DOWN, FORMAT_VERSION, HEADER, MAGIC, RECORD, history_files
+    from state_filter import STATE_DISCONNECTED
+    from state_snapshot import STATE_CODES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+DOWN = STATE_CODES.index(STATE_DISCONNECTED)
+UNKNOWN = 0
+
+
+def require_numpy():
+    """Raises RuntimeError if NumPy is not installed"""
+    if np is None:
+        raise RuntimeError("History analytics need NumPy: pip install numpy")
+
+
+def record_dtype():
+    """Structured dtype of one history record, matching probe_history.RECORD"""
+    require_numpy()
+    dtype = np.dtype([
+        ("timestamp", "<f8"), ("rtt", "<f4"), ("ip", ">u4"), ("port", "<u2"),
+        ("ok", "u1"), ("state", "u1"), ("reason", "u1"), ("flags", "u1"), ("_pad", "V2"),
+    ])
+    assert dtype.itemsize == RECORD.size
+    return dtype
+
+
+def map_file(path: str):
+    """Memory-map the whole records of one day file, or None if it is not a history file"""
+    dtype = record_dtype()
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+        count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+    except OSError:
+        return None
+    if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, FORMAT_VERSION, RECORD.size) \
+            or count <= 0:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER.size, shape=(count,))
+
+
+def target_keys(array):
+    """ip and port of every record as one integer"""
+    return (array["ip"].astype(np.uint64) << np.uint64(16)) | array["port"]
+
+
+def local_hours(timestamp):
+    """Local hour of day of every timestamp, with the UTC offset of its day"""
+    days, inverse = np.unique(np.floor(timestamp / 86400), return_inverse=True)
+    offsets = np.array([datetime.fromtimestamp(day * 86400 + 43200).astimezone()
+                        .utcoffset().total_seconds() for day in days])
+    return (((timestamp + offsets[inverse]) // 3600) % 24).astype(np.int64)
+
+
+def group_percentiles(groups, values, percentiles: Sequence[float], n_groups: int):
+    """Percentiles of values per group id in one sort; NaN for empty groups.
+
+    Returns:
+        array of shape (n_groups, len(percentiles))
+    """
+    order = np.lexsort((values, groups))
+    ordered = values[order].astype(np.float64)
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = np.full((n_groups, len(percentiles)), np.nan)
+    filled = counts > 0
+    if not filled.any():
+        return result
+    first, last = starts[filled], starts[filled] + counts[filled] - 1
+    for column, q in enumerate(percentiles):
+        position = first + (last - first) * (q / 100.0)
+        low = np.floor(position).astype(np.int64)
+        high = np.minimum(low + 1, last)
+        fraction = position - low
+        result[filled, column] = ordered[low] * (1 - fraction) + ordered[high] * fraction
+    return result
+
+
+class HistoryFrame:
+    """Probe history of a period as memory-mapped day files, queried file by file"""
+
+    # Cells of the dense block co_outages() multiplies at a time
+    BLOCK_CELLS = 1 << 22
+
+    def __init__(self, arrays: list):
+        """
+        Args:
+            arrays: Record arrays (see record_dtype) in time order, usually
+                np.memmap views of day files; they are read, never copied whole
+        """
+        require_numpy()
+        self.arrays = [array for array in arrays if len(array)]
+        if self.arrays:
+            keys = np.unique(np.concatenate([np.unique(target_keys(array)) for array in self.arrays]))
+            self.start = min(float(array["timestamp"].min()) for array in self.arrays)
+            self.end = max(float(array["timestamp"].max()) for array in self.arrays)
+        else:
+            keys = np.zeros(0, dtype=np.uint64)
+            self.start = self.end = None
+        self._keys = keys
+        self.targets = [f"{socket.inet_ntoa(int(key >> 16).to_bytes(4, 'big'))}:{int(key & 0xFFFF)}"
+                        for key in keys]
+        self._length = sum(len(array) for array in self.arrays)
+
+    @classmethod
+    def load(cls, directory: str, start: Optional[date] = None,
+             end: Optional[date] = None) -> "HistoryFrame":
+        """Map the day files between start and end (inclusive)"""
+        require_numpy()
+        return cls([array for array in map(map_file, history_files(directory, start, end))
+                    if array is not None])
+
+    def __len__(self) -> int:
+        return self._length
+
+    def target_index(self, target: str) -> int:
+        """Index of "ip:port"
+
+        Raises:
+            ValueError: if the target has no history
+        """
+        try:
+            return self.targets.index(target)
+        except ValueError:
+            raise ValueError(f"No history for {target}")
+
+    def _files(self):
+        """Each day file's records with the target index of every record"""
+        for array in self.arrays:
+            yield array, np.searchsorted(self._keys, target_keys(array)).astype(np.int64)
+
+    def _buckets(self, bucket: float):
+        """The first bucket's start and the bucket count of the period"""
+        t0 = np.floor(self.start / bucket) * bucket
+        return t0, int((self.end - t0) // bucket) + 1
+
+    def availability(self, window: float = 3600, bucket: float = 300) -> Dict[str, Any]:
+        """Share of up probes per target over a sliding window.
+
+        Probes while the local network was down or in an unknown state are
+        not counted.
+
+        Returns:
+            {"times": window end times, "targets": [...],
+             "values": array (targets x times), NaN where there were no probes}
+        """
+        if not len(self):
+            return {"times": np.zeros(0), "targets": self.targets, "values": np.zeros((0, 0))}
+        t0, n_buckets = self._buckets(bucket)
+        n_targets = len(self.targets)
+        size = n_targets * n_buckets
+        total = np.zeros(size, dtype=np.int64)
+        ups = np.zeros(size, dtype=np.int64)
+        for array, target in self._files():
+            cell = target * n_buckets + ((array["timestamp"] - t0) // bucket).astype(np.int64)
+            state = array["state"]
+            valid = (state != UNKNOWN) & ((array["flags"] & FLAG_NETWORK_DOWN) == 0)
+            total += np.bincount(cell[valid], minlength=size)
+            ups += np.bincount(cell[valid & (state != DOWN)], minlength=size)
+        total = total.reshape(n_targets, n_buckets)
+        ups = ups.reshape(n_targets, n_buckets)
+
+        width = max(1, int(round(window / bucket)))
+
+        def rolling(counts):
+            sums = np.cumsum(counts, axis=1)
+            sums[:, width:] -= sums[:, :-width].copy()
+            return sums
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = rolling(ups) / rolling(total)
+        times = t0 + (np.arange(n_buckets) + 1) * bucket
+        return {"times": times, "targets": self.targets, "values": values}
+
+    def latency_by_hour(self, percentiles: Sequence[float] = (50, 90, 99),
+                        stores: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """RTT percentiles per hour of day of answered probes.
+
+        Args:
+            stores: Group targets by these stores (others go to "") instead
+                of reporting every target
+
+        Returns:
+            {"groups": [...], "percentiles": [...],
+             "values": array (groups x 24 hours x percentiles) in seconds}
+        """
+        if stores is None:
+            groups, group_of_target = self.targets, np.arange(len(self.targets))
+        else:
+            groups = sorted({stores.get(target, "") for target in self.targets})
+            group_of_target = np.array([groups.index(stores.get(target, "")) for target in self.targets],
+                                       dtype=np.int64)
+        # Only the answered probes' RTT and group-hour cell are collected
+        cells, values = [], []
+        for array, target in self._files():
+            rtt = array["rtt"]
+            answered = ~np.isnan(rtt)
+            cells.append(group_of_target[target[answered]] * 24 + local_hours(array["timestamp"][answered]))
+            values.append(rtt[answered])
+        if not sum(len(cell) for cell in cells):
+            return {"groups": groups, "percentiles": list(percentiles),
+                    "values": np.full((len(groups), 24, len(percentiles)), np.nan)}
+        values = group_percentiles(np.concatenate(cells), np.concatenate(values),
+                                   percentiles, len(groups) * 24)
+        return {"groups": groups, "percentiles": list(percentiles),
+                "values": values.reshape(len(groups), 24, len(percentiles))}
+
+    def _down_pairs(self, bucket: float):
+        """Buckets and targets of every (bucket, target) in which a target was seen down.
+
+        Returns:
+            (buckets, targets, t0), sorted by bucket, then target
+        """
+        t0, _ = self._buckets(bucket)
+        n_targets = len(self.targets)
+        keys = [np.zeros(0, dtype=np.int64)]
+        for array, target in self._files():
+            down = array["state"] == DOWN
+            index = ((array["timestamp"][down] - t0) // bucket).astype(np.int64)
+            keys.append(np.unique(index * n_targets + target[down]))
+        keys = np.unique(np.concatenate(keys))
+        return keys // n_targets, keys % n_targets, t0
+
+    def co_outages(self, bucket: float = 60, top: int = 20) -> List[Dict[str, Any]]:
+        """Pairs of targets that were down in the same buckets, most shared down time first"""
+        if not len(self) or len(self.targets) < 2:
+            return []
+        buckets, targets, _ = self._down_pairs(bucket)
+        down_buckets = np.bincount(targets, minlength=len(self.targets))
+        # Only buckets in which at least two targets were down can be shared
+        _, counts = np.unique(buckets, return_counts=True)
+        shared = np.repeat(counts >= 2, counts)
+        if not shared.any():
+            return []
+        involved, member = np.unique(targets[shared], return_inverse=True)
+        column = np.unique(buckets[shared], return_inverse=True)[1].ravel()
+
+        # Co-occurrence of the involved targets, a block of shared buckets at a time
+        m = len(involved)
+        step = max(1, self.BLOCK_CELLS // m)
+        together = np.zeros((m, m))
+        bounds = np.searchsorted(column, np.arange(0, int(column[-1]) + 1 + step, step))
+        for block, (low, high) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if low == high:
+                continue
+            matrix = np.zeros((m, step), dtype=np.float32)
+            matrix[member[low:high], column[low:high] - block * step] = 1
+            together += matrix @ matrix.T
+
+        first, second = np.triu_indices(m, 1)
+        counts = together[first, second]
+        best = np.argsort(counts)[::-1][:top]
+        best = best[counts[best] > 0]
+        pairs = []
+        for i in best:
+            a, b = involved[first[i]], involved[second[i]]
+            pairs.append({
+                "targets": [self.targets[a], self.targets[b]],
+                "shared_down_s": float(counts[i] * bucket),
+                "down_s": [float(down_buckets[a] * bucket), float(down_buckets[b] * bucket)],
+            })
+        return pairs
+
+    def outage_events(self, bucket: float = 60, min_targets: int = 2) -> List[Dict[str, Any]]:
+        """Periods in which at least min_targets targets were down together"""
+        if not len(self):
+            return []
+        buckets, targets, t0 = self._down_pairs(bucket)
+        ids, first, counts = np.unique(buckets, return_index=True, return_counts=True)
+        active = counts >= min_targets
+        ids, first, counts = ids[active], first[active], counts[active]
+        events = []
+        # Runs of consecutive active buckets are one event each
+        for run in np.split(np.arange(len(ids)), np.flatnonzero(np.diff(ids) != 1) + 1):
+            if not len(run):
+                continue
+            rows = slice(first[run[0]], first[run[-1]] + counts[run[-1]])
+            events.append({
+                "start": float(t0 + ids[run[0]] * bucket),
+                "end": float(t0 + (ids[run[-1]] + 1) * bucket),
+                "peak": int(counts[run].max()),
+                "targets": [self.targets[i] for i in np.unique(targets[rows])],
+            })
+        return events
+
+    def rtt_change_points(self, target: str, bucket: float = 60, threshold: float = 6.0,
+                          min_change: float = 0.2, min_size: int = 10,
+                          max_points: int = 10) -> List[Dict[str, Any]]:
+        """Lasting shifts in a target's RTT level by binary segmentation.
+
+        The RTT is reduced to per-bucket medians on a log scale. A segment
+        is split where the difference of the means on either side is most
+        significant, as long as it is at least threshold standard errors and
+        a change of at least min_change (0.2 = 20%).
+        """
+        i = self.target_index(target)
+        rows = [(array, index == i) for array, index in self._files()]
+        timestamp = np.concatenate([np.zeros(0)] + [array["timestamp"][mine] for array, mine in rows])
+        rtt = np.concatenate([np.zeros(0, dtype=np.float32)] + [array["rtt"][mine] for array, mine in rows])
+        order = np.argsort(timestamp, kind="stable")
+        timestamp, rtt = timestamp[order], rtt[order]
+        answered = ~np.isnan(rtt) & (rtt > 0)
+        if answered.sum() < 2 * min_size:
+            return []
+        timestamp, rtt = timestamp[answered], rtt[answered]
+        index = ((timestamp - timestamp[0]) // bucket).astype(np.int64)
+        medians = group_percentiles(index, rtt, (50,), int(index.max()) + 1)[:, 0]
+        filled = ~np.isnan(medians)
+        series = np.log(medians[filled])
+        times = timestamp[0] + np.flatnonzero(filled) * bucket
+
+        def best_split(begin: int, finish: int):
+            x = series[begin:finish]
+            n = len(x)
+            if n < 2 * min_size:
+                return None
+            sums, squares = np.cumsum(x), np.cumsum(x * x)
+            k = np.arange(min_size, n - min_size + 1)
+            left = sums[k - 1] / k
+            right = (sums[-1] - sums[k - 1]) / (n - k)
+            residual = squares[-1] - k * left ** 2 - (n - k) * right ** 2
+            stderr = np.sqrt(np.maximum(residual / max(n - 2, 1), 1e-12) * (1.0 / k + 1.0 / (n - k)))
+            score = np.abs(left - right) / stderr
+            score[np.abs(left - right) < np.log1p(min_change)] = 0
+            best = int(np.argmax(score))
+            return score[best], begin + int(k[best])
+
+        segments = [(0, len(series))]
+        cuts = {}
+        while len(cuts) < max_points:
+            candidates = [(best_split(*segment), segment) for segment in segments]
+            candidates = [(split, segment) for split, segment in candidates if split is not None]
+            if not candidates:
+                break
+            (score, cut), segment = max(candidates, key=lambda item: item[0][0])
+            if score < threshold:
+                break
+            segments.remove(segment)
+            segments += [(segment[0], cut), (cut, segment[1])]
+            cuts[cut] = score
+
+        # Levels of the final segments on either side of each cut
+        bounds = np.array([0] + sorted(cuts) + [len(series)])
+        levels = np.exp(np.add.reduceat(series, bounds[:-1]) / np.diff(bounds)) * 1000
+        return [{"timestamp": float(times[cut]), "before_ms": float(levels[i]),
+                 "after_ms": float(levels[i + 1]), "score": float(cuts[cut])}
+                for i, cut in enumerate(bounds[1:-1])]
+
+
+QUERIES = ("availability", "latency", "co-outages", "change-points")
+
+
+def _finite(values):
+    """Nested lists of an array, None for NaN"""
+    return [_finite(row) for row in values] if np.ndim(values) > 1 \
+        else [None if np.isnan(value) else round(float(value), 6) for value in values]
+
+
+def analyze(frame: HistoryFrame, query: str, target: str = None, stores: Dict[str, str] = None,
+            default_store: str = "") -> Dict[str, Any]:
+    """Run one of QUERIES as a JSON-ready summary
+
+    Args:
+        target: Only this "ip:port" for change-points
+        stores: Store of each target for latency; others belong to default_store
+    """
+    if query == "availability":
+        if not len(frame):
+            return {"window_s": 3600, "targets": []}
+        result = frame.availability()
+        values = np.where(np.isnan(result["values"]), np.inf, result["values"])
+        worst = values.argmin(axis=1)
+        return {"window_s": 3600, "targets": [
+            {"target": name, "min_pct": round(100 * float(values[i, worst[i]]), 3),
+             "at": float(result["times"][worst[i]])}
+            for i, name in enumerate(frame.targets) if np.isfinite(values[i, worst[i]])
+        ]}
+    if query == "latency":
+        stores = stores or {}
+        result = frame.latency_by_hour(stores={t: stores.get(t, default_store) for t in frame.targets})
+        return {"percentiles": result["percentiles"], "unit": "ms",
+                "stores": dict(zip(result["groups"], _finite(result["values"] * 1000)))}
+    if query == "co-outages":
+        return {"pairs": frame.co_outages(), "events": frame.outage_events()}
+    if query == "change-points":
+        targets = [target] if target else frame.targets
+        points = {name: frame.rtt_change_points(name) for name in targets}
+        return {"targets": {name: found for name, found in points.items() if found or target}}
+    raise ValueError(f"Unknown query {query}; expected one of {', '.join(QUERIES)}")
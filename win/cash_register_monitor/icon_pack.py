@@ -0,0 +1,145 @@
+"""
+Pre-rendered tray icon pack
+
+create_icons.py renders every icon variant (state colour, overlay, size)
+at build time and packs the raw RGBA pixels into one LZMA-compressed file,
+icons/icons.pack (LZMA makes it about six times smaller than zlib for
+antialiased circles). At runtime the whole pack is read with a single file
+read and one decompress; images are wrapped with PIL.Image.frombuffer on first
+use, so no drawing or image decoding happens on the startup path.
+
+Layout:
+    header: magic "CRIP", version, entry count
+    index: per entry name length, name (utf-8), width, height, offset
+    payload: lzma(all RGBA frames back to back, the packed sprite)
+"""
+
+import lzma
+import os
+import struct
+import sys
+from typing import Dict, Iterable, Optional, Tuple
+
+
+MAGIC = b"CRIP"
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<4sHI")
+ENTRY = struct.Struct("<HHI")  # width, height, offset into the payload
+
+PACK_FILENAME = "icons.pack"
+
+# Icon sizes in the pack: 16 px at 100/125/150/200/250 % scaling, plus large
+ICON_SIZES = (16, 20, 24, 32, 40, 48, 64)
+
+# Overlays drawn on top of a state colour
+OVERLAY_FLAPPING = "flapping"
+OVERLAY_DEGRADED = "degraded"
+MAX_COUNT_BADGE = 10  # badge "9+" for ten or more
+
+
+def icon_name(color: str, overlay: Optional[str] = None, count: Optional[int] = None) -> str:
+    """Name of a variant in the pack, e.g. "red", "green+degraded", "red+count3" """
+    if count:
+        return f"{color}+count{min(count, MAX_COUNT_BADGE)}"
+    if overlay:
+        return f"{color}+{overlay}"
+    return color
+
+
+def preferred_icon_size() -> int:
+    """Tray icon size in pixels for the current display scaling"""
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            dpi = ctypes.windll.user32.GetDpiForSystem()
+            return max(16, round(16 * dpi / 96))
+        except (AttributeError, OSError):
+            pass
+    return 64
+
+
+def pack_icons(frames: Iterable[Tuple[str, int, int, bytes]]) -> bytes:
+    """Build a pack from (name, width, height, rgba_bytes) frames"""
+    index = []
+    payload = []
+    offset = 0
+    for name, width, height, rgba in frames:
+        if len(rgba) != width * height * 4:
+            raise ValueError(f"Frame {name} is not {width}x{height} RGBA")
+        encoded = name.encode("utf-8")
+        index.append(struct.pack("<H", len(encoded)) + encoded + ENTRY.pack(width, height, offset))
+        payload.append(rgba)
+        offset += len(rgba)
+    return (HEADER.pack(MAGIC, FORMAT_VERSION, len(index)) + b"".join(index)
+            + lzma.compress(b"".join(payload)))
+
+
+class IconPack:
+    """All pre-rendered icon frames, loaded from one file"""
+
+    def __init__(self, frames: Dict[Tuple[str, int], Tuple[int, int, memoryview]]):
+        self.frames = frames
+        self.sizes = sorted({size for _, size in frames})
+        self._images = {}
+
+    @classmethod
+    def load(cls, path: str = None) -> Optional["IconPack"]:
+        """Load a pack; None if it is missing or was built by another version"""
+        if path is None:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "icons", PACK_FILENAME)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            return cls.parse(data)
+        except (OSError, ValueError, struct.error, lzma.LZMAError):
+            return None
+
+    @classmethod
+    def parse(cls, data: bytes) -> "IconPack":
+        magic, version, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Not a compatible icon pack")
+
+        position = HEADER.size
+        entries = []
+        for _ in range(count):
+            (name_length,) = struct.unpack_from("<H", data, position)
+            position += 2
+            name = data[position:position + name_length].decode("utf-8")
+            position += name_length
+            width, height, offset = ENTRY.unpack_from(data, position)
+            position += ENTRY.size
+            entries.append((name, width, height, offset))
+
+        payload = memoryview(lzma.decompress(data[position:]))
+        frames = {}
+        for name, width, height, offset in entries:
+            frames[(name, width)] = (width, height, payload[offset:offset + width * height * 4])
+        return cls(frames)
+
+    def has(self, name: str) -> bool:
+        return any((name, size) in self.frames for size in self.sizes)
+
+    def best_size(self, size: int) -> int:
+        """Smallest packed size >= size, or the largest available"""
+        for available in self.sizes:
+            if available >= size:
+                return available
+        return self.sizes[-1]
+
+    def get_image(self, name: str, size: int = 64):
+        """PIL image for a variant, created once per (name, size) without drawing.
+
+        Raises:
+            KeyError: if the variant is not in the pack
+        """
+        size = self.best_size(size)
+        key = (name, size)
+        image = self._images.get(key)
+        if image is None:
+            from PIL import Image  # pystray needs PIL images; imported on first use
+            width, height, rgba = self.frames[key]
+            image = Image.frombuffer("RGBA", (width, height), bytes(rgba), "raw", "RGBA", 0, 1)
+            self._images[key] = image
+        return image
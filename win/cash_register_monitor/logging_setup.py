@@ -0,0 +1,177 @@
+"""
+Structured, rate-limited logging for the monitor
+
+Records are handed to a QueueHandler so the probe and dispatch threads never
+wait on disk or console I/O; a QueueListener thread formats them as JSON
+lines. A filter suppresses repeats of the same message so a register that
+stays down does not write the same error every few seconds.
+"""
+
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+
+LOGGER_NAME = "cash_register_monitor"
+
+# Attributes every LogRecord has; anything else was passed via extra=
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def get_logger(name: str = None) -> logging.Logger:
+    """Get the application logger or a child of it"""
+    if not name or name == LOGGER_NAME:
+        return logging.getLogger(LOGGER_NAME)
+    return logging.getLogger(f"{LOGGER_NAME}.{name.rsplit('.', 1)[-1]}")
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including extra= fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Allow at most `burst` copies of a message per `period` seconds.
+
+    Messages are keyed by logger, level, the formatted message and the
+    optional `target` extra field, so only true repeats are held back. When a message is let through again, the number
+    of copies suppressed in between is attached as `suppressed`.
+    """
+
+    def __init__(self, period: float = 60.0, burst: int = 1, max_keys: int = 10000):
+        super().__init__()
+        self.period = period
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._seen: Dict[Tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        try:
+            message = record.getMessage()
+        except (TypeError, ValueError):
+            message = str(record.msg)  # bad args; the handler reports it when formatting
+        key = (record.name, record.levelno, message, getattr(record, "target", None))
+        now = time.monotonic()
+        with self._lock:
+            state = self._seen.get(key)
+            if state is None or now - state[0] >= self.period:
+                if len(self._seen) >= self.max_keys:
+                    self._seen.clear()
+                suppressed = state[2] if state else 0
+                self._seen[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller and keeps extra fields intact"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def setup_logging(level: str = "INFO", log_file: Optional[str] = None,
+                  console: bool = True, rate_period: float = 60.0,
+                  rate_burst: int = 1) -> logging.Logger:
+    """Configure the application logger. Safe to call more than once.
+
+    Args:
+        level: Initial log level name
+        log_file: Optional path of a size-rotated JSON-lines log file
+        console: Also write JSON lines to stderr
+        rate_period: Seconds over which repeated messages are suppressed
+        rate_burst: Copies of one message allowed per period
+
+    Returns:
+        The application logger
+    """
+    global _listener
+
+    logger = logging.getLogger(LOGGER_NAME)
+    shutdown_logging()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    formatter = JsonLinesFormatter()
+    handlers = []
+    if console:
+        handlers.append(logging.StreamHandler())
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=1024 * 1024, backupCount=3, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=10000)
+    queue_handler = _DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(rate_period, rate_burst))
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    set_log_level(level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    return logger
+
+
+def set_log_level(level) -> bool:
+    """Change the application log level at runtime (name or number)"""
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    if not isinstance(level, int):
+        return False
+    logging.getLogger(LOGGER_NAME).setLevel(level)
+    return True
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
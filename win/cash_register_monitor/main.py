@@ -6,51 +6,55 @@ A Windows system tray application that monitors Datecs cash register connectivit
 import sys
 import os
 import argparse
-import tkinter as tk
-from tkinter import messagebox
+import json
+import shutil
+import signal
+import tempfile
+import threading
+from datetime import date, timedelta
+from typing import TYPE_CHECKING
 
 # Add the package directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from .tray_application import TrayApplication
+    from .aggregator import DEFAULT_PORT as AGGREGATOR_PORT, AggregatorServer
+    from .control_api import connect
+    from .monitor_core import MonitorCore
     from .settings_manager import SettingsManager
+    from .sla_report import build_report, write_csv, write_json
+    from .startup_manager import StartupManager
+    from .startup_timing import StartupTimer
+    from .logging_setup import get_logger, set_log_level, setup_logging, shutdown_logging
 except ImportError:
-    from tray_application import TrayApplication
+    from aggregator import DEFAULT_PORT as AGGREGATOR_PORT, AggregatorServer
+    from control_api import connect
+    from monitor_core import MonitorCore
     from settings_manager import SettingsManager
+    from sla_report import build_report, write_csv, write_json
+    from startup_manager import StartupManager
+    from startup_timing import StartupTimer
+    from logging_setup import get_logger, set_log_level, setup_logging, shutdown_logging
+
+if TYPE_CHECKING:
+    from .tray_application import TrayApplication
+
+
+logger = get_logger(__name__)
 
 
 def setup_windows_startup():
-    """Add application to Windows startup (Windows only)"""
+    """Add application to Windows startup (Windows only).
+    
+    The registry is read once and only written if the entry is missing or stale.
+    """
     if sys.platform != "win32":
         print("Startup integration is only available on Windows")
         return False
     
-    try:
-        import winreg
-        
-        # Get current executable path
-        if getattr(sys, 'frozen', False):
-            # Running as compiled executable
-            exe_path = sys.executable
-        else:
-            # Running as Python script
-            exe_path = f'"{sys.executable}" "{os.path.abspath(__file__)}"'
-        
-        # Registry key for startup programs
-        key_path = r"Software\Microsoft\Windows\CurrentVersion\Run"
-        key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, key_path, 0, winreg.KEY_SET_VALUE)
-        
-        # Add entry
-        winreg.SetValueEx(key, "CashRegisterMonitor", 0, winreg.REG_SZ, exe_path)
-        winreg.CloseKey(key)
-        
-        print("Successfully added to Windows startup")
-        return True
-        
-    except Exception as e:
-        print(f"Failed to add to startup: {e}")
-        return False
+    success, message = StartupManager().ensure_startup()
+    print(message)
+    return success
 
 
 def remove_windows_startup():
@@ -59,25 +63,141 @@ def remove_windows_startup():
         print("Startup integration is only available on Windows")
         return False
     
+    success, message = StartupManager().remove_from_registry_startup()
+    print(message)
+    return success
+
+
+def register_startup(settings_manager: SettingsManager):
+    """Deferred startup stage: keep the Run key in sync without delaying the tray"""
+    if not settings_manager.get_setting("auto_start") or sys.platform != "win32":
+        return
+    success, message = StartupManager().ensure_startup()
+    if success:
+        logger.info("Startup registration: %s", message)
+    else:
+        logger.warning("Startup registration: %s", message)
+
+
+def write_startup_benchmark(app: "TrayApplication", startup_timer: StartupTimer, path: str):
+    """Record time-to-ready for the build script, then shut down without probing"""
+    app.create_icon_image(app.get_state_color({"state": None}))
+    startup_timer.mark("icon_image")
+    with open(path, "w") as f:
+        json.dump({"phases_ms": startup_timer.get_phases(),
+                   "total_ms": startup_timer.get_total()}, f)
+    app.stop_monitors()
+    app.dispatcher.stop()
+
+
+def run_headless(settings_manager: SettingsManager):
+    """Run the monitoring core without a tray until interrupted.
+    
+    State changes are written to the log; used on servers and for testing on Linux.
+    """
+    set_log_level(settings_manager.get_setting("log_level", "INFO"))
+    core = MonitorCore(settings_manager)
+    core.dispatcher.subscribe(
+        lambda event: logger.info("Initial state", extra={"target": event["target"],
+                                                          "state": event["state"]}),
+        name="headless-initial",
+        accept=lambda event: event["type"] == "connection" and event.get("initial")
+    )
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopped.set())
+    
+    core.start()
+    core.start_services()
+    logger.info("Monitoring headless", extra={"targets": list(core.monitors)})
+    # Wake up regularly so signals are handled promptly on Windows too
+    while not stopped.wait(1):
+        pass
+    core.stop()
+
+
+def run_aggregator(settings_manager: SettingsManager, listen: str):
+    """Collect reports from store monitors and serve fleet queries until interrupted"""
+    set_log_level(settings_manager.get_setting("log_level", "INFO"))
+    host, _, port = listen.rpartition(":")
+    server = AggregatorServer(host=host or "0.0.0.0", port=int(port or AGGREGATOR_PORT),
+                              token=settings_manager.get_setting("aggregator_token") or None)
+    if not server.start():
+        sys.exit(1)
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopped.set())
+    while not stopped.wait(1):
+        pass
+    server.stop()
+
+
+def report_period(month: str = None, start: str = None, end: str = None):
+    """First and last day of a report: a YYYY-MM month, explicit dates, or last month"""
+    if month:
+        first = date.fromisoformat(month + "-01")
+    elif start or end:
+        return (date.fromisoformat(start) if start else None,
+                date.fromisoformat(end) if end else None)
+    else:
+        first = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+    last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return first, last
+
+
+def run_report(settings_manager: SettingsManager, fmt: str, period, output: str = None) -> bool:
+    """Write the uptime report for a period from the probe history as CSV or JSON"""
     try:
-        import winreg
-        
-        key_path = r"Software\Microsoft\Windows\CurrentVersion\Run"
-        key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, key_path, 0, winreg.KEY_SET_VALUE)
-        
-        try:
-            winreg.DeleteValue(key, "CashRegisterMonitor")
-            print("Successfully removed from Windows startup")
-            return True
-        except FileNotFoundError:
-            print("Application was not in startup list")
-            return True
-        finally:
-            winreg.CloseKey(key)
-            
-    except Exception as e:
-        print(f"Failed to remove from startup: {e}")
+        from .status_reporter import default_store
+    except ImportError:
+        from status_reporter import default_store
+    
+    start, end = period
+    report = build_report(
+        settings_manager.get_history_dir(), start, end,
+        stores=settings_manager.get_target_stores(),
+        names={t["target"]: t["name"] for t in settings_manager.get_targets() if t.get("name")},
+        default_store=settings_manager.get_setting("store_id") or default_store(),
+    )
+    if not report["registers"]:
+        print("No probe history for this period", file=sys.stderr)
+    write = write_csv if fmt == "csv" else write_json
+    if output:
+        with open(output, "w", newline="") as f:
+            write(report, f)
+    else:
+        write(report, sys.stdout)
+    return bool(report["registers"])
+
+
+def run_analysis(settings_manager: SettingsManager, query: str, period, target: str = None,
+                 output: str = None) -> bool:
+    """Print one vectorized history query (see history_analytics) as JSON; needs NumPy"""
+    try:
+        from .history_analytics import HistoryFrame, analyze
+        from .status_reporter import default_store
+    except ImportError:
+        from history_analytics import HistoryFrame, analyze
+        from status_reporter import default_store
+    
+    start, end = period
+    try:
+        frame = HistoryFrame.load(settings_manager.get_history_dir(), start, end)
+        result = analyze(frame, query, target, settings_manager.get_target_stores(),
+                         settings_manager.get_setting("store_id") or default_store())
+    except (RuntimeError, ValueError) as e:
+        print(e, file=sys.stderr)
         return False
+    if not len(frame):
+        print("No probe history for this period", file=sys.stderr)
+    result = dict({"query": query, "from": start and start.isoformat(), "to": end and end.isoformat()},
+                  **result)
+    if output:
+        with open(output, "w") as f:
+            write_json(result, f)
+    else:
+        write_json(result, sys.stdout)
+    return bool(len(frame))
 
 
 def check_dependencies():
@@ -100,6 +220,8 @@ def check_dependencies():
         
         # Try to show GUI error if tkinter is available
         try:
+            import tkinter as tk
+            from tkinter import messagebox
             root = tk.Tk()
             root.withdraw()
             messagebox.showerror("Missing Dependencies", error_msg)
@@ -124,6 +246,17 @@ Options:
     --setup-startup     Add application to Windows startup
     --remove-startup    Remove application from Windows startup
     --test-connection   Test connection with current settings
+    --headless          Monitor without a tray icon (logs state changes)
+    --aggregator [HOST:]PORT
+                        Run the central aggregator for many stores
+    --report csv|json   Uptime %, MTTR, MTBF and outages per register and store
+                        for --month YYYY-MM (default last month) or --from/--to
+                        dates; --output FILE
+    --analyze QUERY     availability, latency, co-outages or change-points over
+                        the probe history as JSON (needs NumPy); same period
+                        options, last 7 days by default; --target ip:port
+    --control CMD       Ask the running monitor: ping, status, probe, reload
+                        or watch (stream state changes); --target ip:port
     --help             Show this help message
 
 Description:
@@ -141,19 +274,26 @@ Description:
 
 
 def test_connection():
-    """Test connection with current settings"""
+    """Test connection with current settings, through the running monitor if there is one"""
     try:
         from .connection_monitor import ConnectionMonitor
     except ImportError:
         from connection_monitor import ConnectionMonitor
     
-    settings_manager = SettingsManager()
-    conn_settings = settings_manager.get_connection_settings()
-    
-    print(f"Testing connection to {conn_settings['ip']}:{conn_settings['port']}...")
-    
-    monitor = ConnectionMonitor(**conn_settings)
-    connected = monitor.test_connection()
+    client = connect()
+    if client is not None:
+        with client:
+            result = client.request("probe")
+        print(f"Testing connection to {result['target']} (via running monitor)...")
+        connected = result["ok"]
+    else:
+        settings_manager = SettingsManager()
+        conn_settings = settings_manager.get_connection_settings()
+        
+        print(f"Testing connection to {conn_settings['ip']}:{conn_settings['port']}...")
+        
+        monitor = ConnectionMonitor(**conn_settings)
+        connected = monitor.test_connection()
     
     if connected:
         print("✅ Connection successful!")
@@ -163,13 +303,55 @@ def test_connection():
     return connected
 
 
+def run_control_command(command: str, target: str = None) -> bool:
+    """Send a command to the running monitor and print the JSON reply"""
+    client = connect()
+    if client is None:
+        print("No running monitor found")
+        return False
+    with client:
+        try:
+            if command == "watch":
+                for event in client.subscribe():
+                    print(json.dumps(event, default=str), flush=True)
+                return True
+            params = {"target": target} if target else {}
+            print(json.dumps(client.request(command, **params), indent=2, default=str))
+            return True
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            return False
+        except (EOFError, OSError):
+            print("Connection to the monitor was lost")
+            return False
+
+
 def main():
     """Main application entry point"""
+    startup_timer = StartupTimer()
     parser = argparse.ArgumentParser(description="Cash Register Connection Monitor")
     parser.add_argument("--setup-startup", action="store_true", help="Add to Windows startup")
     parser.add_argument("--remove-startup", action="store_true", help="Remove from Windows startup")
     parser.add_argument("--test-connection", action="store_true", help="Test connection")
+    parser.add_argument("--headless", action="store_true",
+                        help="Run without a tray icon, logging state changes (Linux, servers)")
+    parser.add_argument("--aggregator", nargs="?", const=str(AGGREGATOR_PORT), metavar="[HOST:]PORT",
+                        help="Run the central aggregator that collects status from store monitors")
+    parser.add_argument("--control", choices=["ping", "status", "probe", "reload", "watch"],
+                        help="Send a command to the running monitor")
+    parser.add_argument("--target", metavar="IP:PORT",
+                        help="Target for --control status/probe or --analyze change-points")
+    parser.add_argument("--report", choices=["csv", "json"],
+                        help="Write an uptime report from the probe history")
+    parser.add_argument("--analyze", choices=["availability", "latency", "co-outages", "change-points"],
+                        help="Analyze the probe history (needs NumPy)")
+    parser.add_argument("--month", metavar="YYYY-MM", help="Report period (default: last month)")
+    parser.add_argument("--from", dest="start", metavar="YYYY-MM-DD", help="First day of the report")
+    parser.add_argument("--to", dest="end", metavar="YYYY-MM-DD", help="Last day of the report")
+    parser.add_argument("--output", metavar="FILE", help="Write the report to FILE instead of stdout")
     parser.add_argument("--help-extended", action="store_true", help="Show extended help")
+    parser.add_argument("--startup-benchmark", metavar="FILE",
+                        help="Start up without showing the tray, write phase timings to FILE and exit")
     
     args = parser.parse_args()
     
@@ -189,18 +371,72 @@ def main():
         test_connection()
         return
     
+    if args.report:
+        try:
+            period = report_period(args.month, args.start, args.end)
+        except ValueError:
+            parser.error("dates must be YYYY-MM-DD and months YYYY-MM")
+        sys.exit(0 if run_report(SettingsManager(), args.report, period, args.output) else 1)
+    
+    if args.analyze:
+        try:
+            if args.month or args.start or args.end:
+                period = report_period(args.month, args.start, args.end)
+            else:
+                period = (date.today() - timedelta(days=6), date.today())
+        except ValueError:
+            parser.error("dates must be YYYY-MM-DD and months YYYY-MM")
+        ok = run_analysis(SettingsManager(), args.analyze, period, args.target, args.output)
+        sys.exit(0 if ok else 1)
+    
+    if args.control:
+        try:
+            ok = run_control_command(args.control, args.target)
+        except KeyboardInterrupt:
+            ok = True
+        sys.exit(0 if ok else 1)
+    
     # Check dependencies before starting
-    if not check_dependencies():
+    if not (args.headless or args.aggregator) and not check_dependencies():
         sys.exit(1)
     
+    # The build benchmark runs against a throwaway config folder so it leaves nothing behind
+    config_dir = tempfile.mkdtemp(prefix="crm-benchmark-") if args.startup_benchmark else None
+    
+    # Structured JSON-lines log next to the config; no console in the windowed exe
+    log_file = os.path.join(config_dir or os.path.dirname(os.path.abspath(__file__)), "monitor.log")
+    logger = setup_logging(log_file=log_file, console=not getattr(sys, 'frozen', False))
+    startup_timer.mark("logging")
+    
     try:
-        # Create and run the tray application
-        app = TrayApplication()
+        # Load the config once and share it with the tray application
+        settings_manager = SettingsManager(config_dir=config_dir)
+        if args.startup_benchmark:
+            # No gateway probe thread, history folder or snapshot writer on the build machine
+            settings_manager.update_settings(reference_target="off", history_days=0,
+                                             snapshot_interval=0)
+        startup_timer.mark("config")
         
-        # Check if auto-startup should be configured
-        settings_manager = SettingsManager()
-        if settings_manager.get_setting("auto_start") and sys.platform == "win32":
-            setup_windows_startup()
+        if args.headless:
+            run_headless(settings_manager)
+            return
+        
+        if args.aggregator:
+            run_aggregator(settings_manager, args.aggregator)
+            return
+        
+        try:
+            from .tray_application import TrayApplication
+        except ImportError:
+            from tray_application import TrayApplication
+        app = TrayApplication(settings_manager, startup_timer)
+        
+        if args.startup_benchmark:
+            write_startup_benchmark(app, startup_timer, args.startup_benchmark)
+            return
+        
+        # Check if auto-startup should be configured, off the startup path
+        threading.Thread(target=register_startup, args=(settings_manager,), daemon=True).start()
         
         print("Starting Cash Register Monitor...")
         print("Application will run in system tray. Right-click the tray icon for options.")
@@ -214,9 +450,12 @@ def main():
     except Exception as e:
         error_msg = f"Application error: {str(e)}"
         print(error_msg)
+        logger.exception("Application error")
         
         # Try to show GUI error
         try:
+            import tkinter as tk
+            from tkinter import messagebox
             root = tk.Tk()
             root.withdraw()
             messagebox.showerror("Application Error", error_msg)
@@ -225,6 +464,10 @@ def main():
             pass
         
         sys.exit(1)
+    finally:
+        shutdown_logging()
+        if config_dir:
+            shutil.rmtree(config_dir, ignore_errors=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,234 @@
+"""
+Platform-neutral monitoring core
+
+MonitorCore owns everything except the user interface: the config, one
+ConnectionMonitor per target with its probe thread, the shared network
+reachability check, the event dispatcher, state snapshots and the probe
+history. The Windows tray (pystray), the macOS menu bar app (rumps) and the
+headless mode are thin front ends that subscribe to the dispatcher and read
+get_status(), and scripts reach it through the local control API, so probing
+and scheduling behave the same on every platform. It only uses the standard
+library and runs headless on Linux.
+"""
+
+import threading
+from typing import Any, Callable, Dict, List, Optional
+try:
+    from .connection_monitor import DEFAULT_TIMEOUT, ConnectionMonitor
+    from .control_api import ControlServer
+    from .event_dispatcher import EventDispatcher
+    from .event_stream import EventStream
+    from .logging_setup import get_logger
+    from .probe_history import ProbeHistory
+    from .reachability import NetworkReachability, parse_reference_target
+    from .settings_manager import SettingsManager
+    from .spool import Spool
+    from .state_snapshot import SnapshotWriter, load_snapshot
+    from .status_reporter import StatusReporter
+except ImportError:
+    from connection_monitor import DEFAULT_TIMEOUT, ConnectionMonitor
+    from control_api import ControlServer
+    from event_dispatcher import EventDispatcher
+    from event_stream import EventStream
+    from logging_setup import get_logger
+    from probe_history import ProbeHistory
+    from reachability import NetworkReachability, parse_reference_target
+    from settings_manager import SettingsManager
+    from spool import Spool
+    from state_snapshot import SnapshotWriter, load_snapshot
+    from status_reporter import StatusReporter
+
+
+logger = get_logger(__name__)
+
+
+class MonitorCore:
+    """Monitors for every configured target, independent of any tray toolkit"""
+
+    def __init__(self, settings_manager: SettingsManager = None,
+                 dispatcher: EventDispatcher = None):
+        """
+        Args:
+            settings_manager: Loaded config; a default one is created if omitted
+            dispatcher: Event dispatcher to publish on; the core creates one if omitted
+        """
+        self.settings_manager = settings_manager or SettingsManager()
+        self.dispatcher = dispatcher or EventDispatcher(name="core")
+        self.monitor = None  # the first target
+        self.monitors: Dict[str, ConnectionMonitor] = {}
+        self.reachability = None
+        self.history = None
+        self.control = None
+        self.stream = None
+        self.reporter = None
+        self.running = False
+        self._starting: List[threading.Thread] = []
+        self._lock = threading.RLock()
+
+        # Last-known state from the previous run, used once at startup
+        self.snapshot = load_snapshot(self.settings_manager.get_state_path())
+        self.snapshot_writer = SnapshotWriter(
+            self.settings_manager.get_state_path(),
+            lambda: list(self.monitors.values()),
+            interval=float(self.settings_manager.get_setting("snapshot_interval", 30))
+        )
+        self.create_history()
+
+    def create_history(self):
+        """Open the probe history if it is enabled"""
+        if self.history is not None:
+            self.history.close()
+        days = int(self.settings_manager.get_setting("history_days", 90) or 0)
+        self.history = ProbeHistory(self.settings_manager.get_history_dir(), days) if days > 0 else None
+
+    def create_monitors(self):
+        """Build monitors from current settings without probing yet"""
+        with self._lock:
+            reference = parse_reference_target(self.settings_manager.get_setting("reference_target", "auto"))
+            if reference:
+                self.reachability = NetworkReachability(*reference, dispatcher=self.dispatcher)
+                self.reachability.start()
+            else:
+                self.reachability = None
+
+            targets = self.settings_manager.get_targets() or [self.settings_manager.get_primary_target()]
+            monitors = {}
+            for target in targets:
+                conn_settings = self.settings_manager.get_connection_settings(target)
+                monitor = ConnectionMonitor(**conn_settings, dispatcher=self.dispatcher,
+                                            reachability=self.reachability, history=self.history)
+                monitor.publish_samples = self.stream is not None
+                saved = self.snapshot.pop(monitor.target, None)
+                if saved:
+                    monitor.restore_snapshot(saved)
+                monitors[monitor.target] = monitor
+            self.monitors = monitors
+            self.monitor = next(iter(monitors.values()))
+        return self.monitors
+
+    def start_monitors(self):
+        """Start probing every target.
+
+        The first target is started here; the others start in parallel so
+        one dead register's initial probe does not hold up the rest.
+        """
+        with self._lock:
+            monitors = list(self.monitors.values())
+            self.running = True
+        for monitor in monitors:
+            if monitor is not self.monitor:
+                thread = threading.Thread(target=self._start_monitor, args=(monitor,), daemon=True)
+                self._starting.append(thread)
+                thread.start()
+        if self.monitor:
+            self.monitor.start_monitoring()
+
+    def _start_monitor(self, monitor: ConnectionMonitor):
+        with self._lock:
+            if not self.running:
+                return
+        monitor.start_monitoring()
+
+    def stop_monitors(self):
+        with self._lock:
+            self.running = False
+            monitors = list(self.monitors.values())
+            starting, self._starting = self._starting, []
+        for monitor in monitors:
+            monitor.stop_monitoring()
+        # A monitor whose start thread was only just running may have started after all
+        for thread in starting:
+            thread.join(timeout=DEFAULT_TIMEOUT + 1)
+        for monitor in monitors:
+            monitor.stop_monitoring()
+        if self.history is not None:
+            self.history.flush()
+
+    def restart(self):
+        """Rebuild and restart the monitors after a settings change"""
+        self.stop_monitors()
+        self.create_history()
+        self.create_monitors()
+        self.start_monitors()
+
+    def start(self):
+        """Build the monitors if needed and start probing and snapshots"""
+        if not self.monitors:
+            self.create_monitors()
+        self.start_monitors()
+        self.snapshot_writer.start()
+
+    def start_services(self, reload: Callable[[], Dict[str, str]] = None):
+        """Start the enabled services: control API, event stream and aggregator reports"""
+        self.start_control(reload)
+        self.start_stream()
+        self.start_reporter()
+
+    def start_reporter(self) -> bool:
+        """Report to the central aggregator if aggregator_url is set (see status_reporter)"""
+        url = (self.settings_manager.get_setting("aggregator_url") or "").strip()
+        if self.reporter is not None or not url:
+            return False
+        spool = None
+        spool_mb = float(self.settings_manager.get_setting("spool_mb", 16) or 0)
+        try:
+            if spool_mb > 0 and not url.startswith("udp:"):
+                spool = Spool(self.settings_manager.get_spool_dir(), int(spool_mb * 1024 * 1024))
+            self.reporter = StatusReporter(
+                self, url,
+                store=self.settings_manager.get_setting("store_id") or None,
+                interval=float(self.settings_manager.get_setting("report_interval", 10)),
+                token=self.settings_manager.get_setting("aggregator_token") or None,
+                spool=spool,
+            )
+        except (OSError, ValueError) as e:
+            logger.warning("Not reporting to aggregator: %s", e)
+            return False
+        self.reporter.start()
+        return True
+
+    def start_stream(self) -> bool:
+        """Serve the SSE event stream if stream_port is set (see event_stream)"""
+        port = int(self.settings_manager.get_setting("stream_port", 0) or 0)
+        if self.stream is not None or port <= 0:
+            return False
+        stream = EventStream(self, self.settings_manager.get_setting("stream_host", "127.0.0.1"), port)
+        if not stream.start():
+            return False
+        self.stream = stream
+        for monitor in list(self.monitors.values()):
+            monitor.publish_samples = True
+        return True
+
+    def start_control(self, reload: Callable[[], Dict[str, str]] = None) -> bool:
+        """Serve the local control API if enabled (see control_api)"""
+        if self.control is not None or not self.settings_manager.get_setting("control_api", True):
+            return False
+        self.control = ControlServer(self, reload=reload)
+        if not self.control.start():
+            self.control = None
+        return self.control is not None
+
+    def stop(self):
+        """Stop probing, write a last snapshot and flush history"""
+        if self.control is not None:
+            self.control.stop()
+            self.control = None
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream = None
+        if self.reporter is not None:
+            self.reporter.stop()
+            self.reporter = None
+        self.stop_monitors()
+        self.snapshot_writer.stop()
+        if self.history is not None:
+            self.history.close()
+        self.dispatcher.stop()
+
+    def get_status(self, target: Optional[str] = None) -> Dict[str, Any]:
+        """Status of one target, or of all targets keyed by "ip:port" """
+        if target is not None:
+            monitor = self.monitors.get(target)
+            return monitor.get_status() if monitor else {}
+        return {key: monitor.get_status() for key, monitor in list(self.monitors.items())}
@@ -0,0 +1,202 @@
+"""
+Append-only probe history
+
+Every probe result is appended as one fixed-size binary record to a file
+per day (history/YYYY-MM-DD.bin). Fixed records keep the files cheap to
+stream for reports and let analytics map them straight into arrays.
+Records are collected in memory and written every few seconds, so probe
+threads never wait on the disk; days older than the retention period are
+deleted when the day rolls over.
+
+Layout (little endian):
+    header: magic "CRMH", version, record size
+    records: RECORD * n (a partial record at the end of a file is ignored)
+"""
+
+import math
+import os
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, Optional
+try:
+    from .logging_setup import get_logger
+    from .state_snapshot import REASON_CODES, STATE_CODES
+except ImportError:
+    from logging_setup import get_logger
+    from state_snapshot import REASON_CODES, STATE_CODES
+
+
+logger = get_logger(__name__)
+
+MAGIC = b"CRMH"
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<4sHH")
+RECORD = struct.Struct(
+    "<d"      # timestamp (epoch seconds)
+    "f"       # rtt in seconds, NaN if the register did not answer
+    "4sH"     # ip, port
+    "BBBB"    # ok, state code, reason code, flags
+    "2x"
+)
+
+FLAG_NETWORK_DOWN = 1  # probe failed while the reference target was down too
+FLAG_INITIAL = 2       # first probe after start
+
+FILE_SUFFIX = ".bin"
+
+HistoryRecord = namedtuple("HistoryRecord", "timestamp rtt target ok state reason flags")
+
+
+def _code(values: tuple, value) -> int:
+    return values.index(value) if value in values else 0
+
+
+def history_files(directory: str, start: Optional[date] = None,
+                  end: Optional[date] = None) -> List[str]:
+    """Day files in directory between start and end (inclusive), oldest first"""
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return []
+    files = []
+    for name in names:
+        if not name.endswith(FILE_SUFFIX):
+            continue
+        try:
+            day = date.fromisoformat(name[:-len(FILE_SUFFIX)])
+        except ValueError:
+            continue
+        if (start and day < start) or (end and day > end):
+            continue
+        files.append(os.path.join(directory, name))
+    return files
+
+
+def read_chunks(path: str, chunk_records: int = 8192) -> Iterator[bytes]:
+    """Raw record bytes of one day file, whole records only, for RECORD.iter_unpack"""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        magic, version, record_size = HEADER.unpack(header)
+        if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD.size:
+            logger.warning("Skipping incompatible history file %s", path)
+            return
+        while True:
+            chunk = f.read(RECORD.size * chunk_records)
+            usable = len(chunk) - len(chunk) % RECORD.size
+            if not usable:
+                return
+            yield chunk[:usable] if usable < len(chunk) else chunk
+
+
+def target_name(ip: bytes, port: int) -> str:
+    """"ip:port" of a record's packed address"""
+    return f"{socket.inet_ntoa(ip)}:{port}"
+
+
+def iter_file(path: str, chunk_records: int = 8192) -> Iterator[HistoryRecord]:
+    """Stream the records of one day file in constant memory"""
+    ips = {}
+    for chunk in read_chunks(path, chunk_records):
+        for timestamp, rtt, ip, port, ok, state, reason, flags in RECORD.iter_unpack(chunk):
+            key = (ip, port)
+            target = ips.get(key)
+            if target is None:
+                target = ips[key] = target_name(ip, port)
+            yield HistoryRecord(
+                timestamp, None if math.isnan(rtt) else rtt, target, bool(ok),
+                STATE_CODES[state] if state < len(STATE_CODES) else None,
+                REASON_CODES[reason] if reason < len(REASON_CODES) else None,
+                flags,
+            )
+
+
+def iter_history(directory: str, start: Optional[date] = None,
+                 end: Optional[date] = None) -> Iterator[HistoryRecord]:
+    """Stream every record between start and end, in time order per file"""
+    for path in history_files(directory, start, end):
+        yield from iter_file(path)
+
+
+class ProbeHistory:
+    """Buffered writer of probe records, one file per day"""
+
+    def __init__(self, directory: str, retention_days: int = 90, flush_interval: float = 5.0):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.flush_interval = flush_interval
+        self._buffer = bytearray()
+        self._day = None
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            logger.warning("Could not create history directory: %s", e)
+
+    def record(self, timestamp: datetime, ip: str, port: int, ok: bool,
+               state: Optional[str], reason: Optional[str], rtt: Optional[float],
+               flags: int = 0):
+        """Append one probe result"""
+        try:
+            packed = RECORD.pack(
+                timestamp.timestamp(), math.nan if rtt is None else rtt,
+                socket.inet_aton(ip), port, bool(ok),
+                _code(STATE_CODES, state), _code(REASON_CODES, reason), flags,
+            )
+        except (OSError, struct.error) as e:
+            logger.warning("Could not pack history record: %s", e, extra={"target": f"{ip}:{port}"})
+            return
+        day = timestamp.date()
+        with self._lock:
+            if day != self._day:
+                self._flush_locked()
+                self._prune(day)
+                self._day = day
+            self._buffer += packed
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def flush(self):
+        """Write buffered records to disk"""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        self.flush()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        path = os.path.join(self.directory, self._day.isoformat() + FILE_SUFFIX)
+        try:
+            with open(path, "ab") as f:
+                size = f.tell()
+                if size < HEADER.size:
+                    f.truncate(0)
+                    f.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.size))
+                elif (size - HEADER.size) % RECORD.size:
+                    # Drop a record torn by a crash so later ones stay aligned
+                    f.truncate(size - (size - HEADER.size) % RECORD.size)
+                f.write(self._buffer)
+        except OSError as e:
+            logger.warning("Could not write probe history: %s", e)
+        self._buffer.clear()
+
+    def _prune(self, today: date):
+        """Delete day files that fell out of the retention period"""
+        if self.retention_days <= 0:
+            return
+        cutoff = today - timedelta(days=self.retention_days)
+        for path in history_files(self.directory, end=cutoff - timedelta(days=1)):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning("Could not delete old history file: %s", e)
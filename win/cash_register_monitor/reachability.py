@@ -0,0 +1,287 @@
+"""
+Failure classification and shared network reachability check
+
+A failed connect is not just "disconnected": a refused connection means the
+register is up but nothing listens on the port, a timeout or EHOSTUNREACH
+means the register (or the path to it) is gone. NetworkReachability probes
+one reference target, by default the default gateway, on behalf of all
+monitors so a dead shop LAN produces a single "network down" event instead
+of one register-down event per register.
+"""
+
+import errno
+import re
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+try:
+    from .logging_setup import get_logger
+except ImportError:
+    from logging_setup import get_logger
+
+
+logger = get_logger(__name__)
+
+REASON_OK = "ok"
+REASON_PORT_CLOSED = "port_closed"
+REASON_TIMEOUT = "timeout"
+REASON_HOST_UNREACHABLE = "host_unreachable"
+REASON_NETWORK_UNREACHABLE = "network_unreachable"
+REASON_ERROR = "error"
+
+# Reasons that prove the host answered at the IP level
+ANSWERED_REASONS = (REASON_OK, REASON_PORT_CLOSED)
+
+# errno values (POSIX and WinSock) for each failure reason
+_REASON_BY_ERRNO = {
+    0: REASON_OK,
+    errno.ECONNREFUSED: REASON_PORT_CLOSED, 10061: REASON_PORT_CLOSED,
+    errno.ETIMEDOUT: REASON_TIMEOUT, 10060: REASON_TIMEOUT,
+    errno.EAGAIN: REASON_TIMEOUT, errno.EWOULDBLOCK: REASON_TIMEOUT,
+    10035: REASON_TIMEOUT,
+    errno.EHOSTUNREACH: REASON_HOST_UNREACHABLE, 10065: REASON_HOST_UNREACHABLE,
+    errno.EHOSTDOWN: REASON_HOST_UNREACHABLE, 10064: REASON_HOST_UNREACHABLE,
+    errno.ENETUNREACH: REASON_NETWORK_UNREACHABLE, 10051: REASON_NETWORK_UNREACHABLE,
+    errno.ENETDOWN: REASON_NETWORK_UNREACHABLE, 10050: REASON_NETWORK_UNREACHABLE,
+}
+
+# connect_ex() results of a non-blocking connect that is under way
+_IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, 10035)
+
+# Ports tried on the gateway; a RST proves reachability as well as a SYN-ACK
+GATEWAY_PORTS = (80, 53, 443)
+
+
+def classify_errno(result: int) -> str:
+    """Map a connect_ex() result to a failure reason"""
+    return _REASON_BY_ERRNO.get(result, REASON_ERROR)
+
+
+def tcp_probe(ip: str, port: int, timeout: float,
+              on_slow: Optional[Callable[[], None]] = None, slow_after: float = 0.0) -> dict:
+    """Attempt a TCP connect and describe the outcome.
+
+    Args:
+        on_slow: Called once if there is no answer after slow_after seconds;
+            the probe keeps waiting for the rest of the timeout meanwhile
+
+    Returns:
+        dict with 'ok', 'errno', 'reason' and 'rtt' (seconds)
+    """
+    started = time.monotonic()
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setblocking(False)
+            result = sock.connect_ex((ip, port))
+            if result in _IN_PROGRESS:
+                result = _wait_connected(sock, started + timeout, on_slow, started + slow_after)
+    except socket.timeout:
+        result = errno.ETIMEDOUT
+    except socket.gaierror:
+        result = errno.EHOSTUNREACH
+    except OSError as e:
+        result = e.errno or -1
+    rtt = time.monotonic() - started
+
+    reason = classify_errno(result)
+    # Some stacks report a timed-out connect as a generic error
+    if reason == REASON_ERROR and rtt >= timeout * 0.9:
+        reason = REASON_TIMEOUT
+    return {"ok": result == 0, "errno": result, "reason": reason, "rtt": rtt}
+
+
+def _wait_connected(sock: socket.socket, deadline: float,
+                    on_slow: Optional[Callable[[], None]], slow_at: float) -> int:
+    """Wait for a non-blocking connect to finish; returns its errno"""
+    with selectors.DefaultSelector() as selector:
+        # A failed connect shows up as writable (or as an exception on Windows, which
+        # the select-based selector folds into writable)
+        selector.register(sock, selectors.EVENT_WRITE)
+        if on_slow is not None and slow_at < deadline:
+            if selector.select(max(0.0, slow_at - time.monotonic())):
+                return sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            on_slow()
+        if selector.select(max(0.0, deadline - time.monotonic())):
+            return sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+    return errno.ETIMEDOUT
+
+
+def find_default_gateway() -> Optional[str]:
+    """Best-effort lookup of the IPv4 default gateway"""
+    try:
+        if sys.platform.startswith("linux"):
+            with open("/proc/net/route") as f:
+                for line in f.readlines()[1:]:
+                    fields = line.split()
+                    if fields[1] == "00000000" and int(fields[3], 16) & 2:
+                        return socket.inet_ntoa(bytes.fromhex(fields[2])[::-1])
+            return None
+        if sys.platform == "win32":
+            output = subprocess.run(["route", "print", "-4", "0.0.0.0"],
+                                    capture_output=True, text=True, timeout=5,
+                                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)).stdout
+            match = re.search(r"^\s*0\.0\.0\.0\s+0\.0\.0\.0\s+(\d+\.\d+\.\d+\.\d+)", output, re.M)
+        else:
+            output = subprocess.run(["route", "-n", "get", "default"],
+                                    capture_output=True, text=True, timeout=5).stdout
+            match = re.search(r"gateway:\s*(\d+\.\d+\.\d+\.\d+)", output)
+        return match.group(1) if match else None
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def parse_reference_target(value: str) -> Optional[Tuple[str, Optional[int]]]:
+    """Parse the reference_target setting: 'auto', 'off' or 'host[:port]'"""
+    value = (value or "").strip()
+    if not value or value.lower() == "off":
+        return None
+    if value.lower() == "auto":
+        return ("auto", None)
+    host, _, port = value.partition(":")
+    return (host, int(port) if port else None)
+
+
+class NetworkReachability:
+    """Shared reference probe telling monitors whether the LAN itself is down"""
+
+    UNVERIFIED_RETRY = 60.0  # seconds between probes of a reference that never answered
+
+    def __init__(self, host: str = "auto", port: Optional[int] = None,
+                 timeout: float = 1.0, max_age: float = 5.0, dispatcher=None):
+        self.configured_host = host
+        self.host = None if host == "auto" else host
+        self.ports = (port,) if port else GATEWAY_PORTS
+        self.timeout = timeout
+        self.max_age = max_age
+        self.dispatcher = dispatcher
+        self.network_up = True
+        self.verified = False
+        self.checked_at = 0.0
+        self.last_result = None
+        self._answering_port = None
+        self._lock = threading.Lock()
+        self._probe_done = threading.Condition(self._lock)
+        self._probing = False
+
+    @property
+    def reference(self) -> str:
+        return f"{self.host or 'gateway'}:{'/'.join(str(p) for p in self.ports)}"
+
+    def start(self):
+        """Resolve the gateway and verify the reference in the background"""
+        threading.Thread(target=self.check, daemon=True).start()
+
+    def check(self, fresh_after: float = 0.0) -> bool:
+        """Return whether the network is up.
+
+        A cached result is reused if it was taken after fresh_after (a
+        monotonic time, usually when the caller's own probe started), so N
+        monitors failing together cause one reference probe. While the
+        network is down, results up to max_age old are reused because every
+        probe of a dead reference costs a full timeout; a reference that has
+        never answered is only retried every UNVERIFIED_RETRY seconds. The
+        probe runs outside the lock; callers arriving meanwhile wait for its
+        result instead of probing again.
+        """
+        with self._lock:
+            while self._probing and not self._is_fresh(fresh_after):
+                self._probe_done.wait()
+            if self._is_fresh(fresh_after):
+                return self.network_up
+            self._probing = True
+            host = self.host
+            # Once a port has answered, only that one is needed
+            ports = (self._answering_port,) if self._answering_port else self.ports
+
+        result = None
+        try:
+            if host is None:
+                host = find_default_gateway()
+            if host is not None:
+                for port in ports:
+                    result = tcp_probe(host, port, self.timeout)
+                    if result["reason"] in ANSWERED_REASONS:
+                        break
+        finally:
+            with self._lock:
+                self._probing = False
+                self._probe_done.notify_all()
+                self.checked_at = time.monotonic()
+                if self.host is None:
+                    self.host = host
+                if result is not None:
+                    self._record(result, port)
+        return self.network_up
+
+    def check_soon(self, fresh_after: float = 0.0):
+        """Start check() in the background, e.g. while a register probe is still waiting.
+
+        Nothing happens if a reference probe is already under way or the
+        cached result is fresh; a later check() then waits for or reuses it.
+        """
+        with self._lock:
+            if self._probing or self._is_fresh(fresh_after):
+                return
+        threading.Thread(target=self.check, args=(fresh_after,), name="reachability",
+                         daemon=True).start()
+
+    def _is_fresh(self, fresh_after: float) -> bool:
+        """Whether the cached result answers a check. Caller holds the lock."""
+        if not self.checked_at:
+            return False
+        age = time.monotonic() - self.checked_at
+        if self.checked_at >= fresh_after:
+            return True
+        if not self.network_up and age < self.max_age:
+            return True
+        # An unverified reference cannot prove an outage, so probing it on every failure is wasted
+        return not self.verified and age < self.UNVERIFIED_RETRY
+
+    def _record(self, result: dict, port: int):
+        """Apply a reference probe result. Caller holds the lock."""
+        self.last_result = result
+        if result["reason"] in ANSWERED_REASONS:
+            self._answering_port = port
+            if not self.verified:
+                logger.info("Reference target verified", extra={"reference": self.reference})
+            self.verified = True
+            self._set_network_up(True)
+        elif self.verified:
+            # Only a reference that has answered before can prove an outage
+            self._set_network_up(False)
+
+    def note_answer(self):
+        """A monitored register answered, which proves the network is back"""
+        if self.network_up:
+            return
+        with self._lock:
+            self.checked_at = time.monotonic()
+            self._set_network_up(True)
+
+    def _set_network_up(self, up: bool):
+        if up == self.network_up:
+            return
+        self.network_up = up
+        logger.warning("Network %s", "up" if up else "down",
+                       extra={"reference": self.reference,
+                              "reason": self.last_result and self.last_result["reason"]})
+        if self.dispatcher is not None:
+            self.dispatcher.publish({
+                "type": "network",
+                "target": "network",
+                "network_up": up,
+                "reference": self.reference,
+                "timestamp": datetime.now(),
+            })
+
+    def reset(self):
+        """Re-resolve the gateway on the next check (e.g. after a DHCP change)"""
+        with self._lock:
+            self.host = None if self.configured_host == "auto" else self.configured_host
+            self.checked_at = 0.0
+            self._answering_port = None
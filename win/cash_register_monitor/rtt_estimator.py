@@ -0,0 +1,89 @@
+"""
+Adaptive probe timeout derived from observed round-trip times
+
+Follows the TCP retransmission timeout calculation (RFC 6298): a smoothed
+RTT and its mean deviation are tracked per target, and the timeout is
+SRTT + K * RTTVAR clamped to sane bounds. The first BACKOFF_LIMIT timeouts
+in a row back off exponentially so a slow link is given more time before it
+is declared down; after that the target is dead rather than slow and is
+probed at the RTT-based timeout again, so it keeps failing fast.
+"""
+
+from typing import Any, Dict, Optional
+
+
+class RttEstimator:
+    """Smoothed RTT / variance tracker producing a per-target probe timeout"""
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+    BACKOFF_LIMIT = 2  # consecutive timeouts that widen the timeout
+
+    def __init__(self, min_timeout: float = 0.25, max_timeout: float = 3.0,
+                 initial_timeout: Optional[float] = None):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.initial_timeout = max_timeout if initial_timeout is None else initial_timeout
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+        self.backoff = 1
+        self.timeouts = 0
+
+    def add_sample(self, rtt: float):
+        """Feed the duration of a probe that got an answer (success or refusal)"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.samples += 1
+        self.backoff = 1
+        self.timeouts = 0
+
+    def on_timeout(self):
+        """Double the timeout after a probe got no answer at all, up to BACKOFF_LIMIT times"""
+        self.timeouts += 1
+        if self.timeouts > self.BACKOFF_LIMIT:
+            # Still no answer: waiting longer would only slow down every probe
+            self.backoff = 1
+        elif self.timeout < self.max_timeout:
+            self.backoff *= 2
+
+    @property
+    def timeout(self) -> float:
+        """Current probe timeout in seconds"""
+        if self.srtt is None:
+            base = self.initial_timeout
+        else:
+            base = self.srtt + self.K * self.rttvar
+        return min(self.max_timeout, max(self.min_timeout, base * self.backoff))
+
+    def reset(self):
+        """Forget all samples, e.g. after the target address changed"""
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+        self.backoff = 1
+        self.timeouts = 0
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get estimator state for status reporting and persistence"""
+        return {
+            "srtt": self.srtt,
+            "rttvar": self.rttvar,
+            "samples": self.samples,
+            "backoff": self.backoff,
+            "timeouts": self.timeouts,
+            "timeout": self.timeout,
+        }
+
+    def load_state(self, state: Dict[str, Any]):
+        """Restore state produced by get_state()"""
+        self.srtt = state.get("srtt")
+        self.rttvar = state.get("rttvar")
+        self.samples = state.get("samples", 0)
+        self.backoff = state.get("backoff", 1)
+        self.timeouts = state.get("timeouts", 0)
@@ -1,23 +1,71 @@
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List
+try:
+    from .config_schema import SCHEMA_VERSION, ConfigValidator, migrate
+    from .logging_setup import get_logger
+except ImportError:
+    from config_schema import SCHEMA_VERSION, ConfigValidator, migrate
+    from logging_setup import get_logger
+
+
+logger = get_logger(__name__)
 
 
 class SettingsManager:
-    def __init__(self, config_file: str = "config.json"):
+    def __init__(self, config_file: str = "config.json", config_dir: str = None,
+                 defaults: Dict[str, Any] = None):
+        """
+        Args:
+            config_file: Config file name
+            config_dir: Folder holding the config and state files; defaults
+                to the package folder
+            defaults: Platform-specific default settings that replace the
+                built-in ones (e.g. the macOS app's printer)
+        """
         self.config_file = config_file
+        self.config_dir = config_dir
         self.default_settings = {
-            "ip_address": "192.168.1.155",
-            "port": 4999,  # Standard Datecs communication port
-            "check_interval": 5,
+            "version": SCHEMA_VERSION,
+            "targets": [{"ip": "192.168.1.155"}],  # Registers; may override port/interval/probe/group
+            "port": 4999,  # Standard Datecs communication port (default for targets)
+            "check_interval": 5,  # Default for targets
+            "probe": "tcp",  # Default for targets
+            "detection_slo": 0,  # Target seconds from outage to alert, 0 = off
+            "adaptive_timeout": True,  # Derive probe timeout from measured RTT
+            "fail_threshold": 2,  # Failures within fail_window probes to go down
+            "fail_window": 3,
+            "recover_threshold": 2,  # Consecutive successes to come back up
+            "flap_low_threshold": 20.0,  # Percent state change to stop flapping
+            "flap_high_threshold": 30.0,  # Percent state change to start flapping
+            "degraded_threshold": 3.0,  # RTT z-score above baseline that marks a register degraded, 0 = off
+            "reference_target": "auto",  # "auto" (default gateway), "off" or "host[:port]"
+            "topology": {},  # {store: {switch: ["ip[:port]", ...]}} for alert grouping
+            "alert_hold_time": 2.0,  # Seconds to wait for sibling outages before alerting
+            "notifications": False,  # Show tray notifications for outages
+            "snapshot_interval": 30,  # Seconds between state snapshots, 0 = off
+            "history_days": 90,  # Days of probe history to keep, 0 = no history
+            "control_api": True,  # Local socket/named pipe for scripts (see control_api)
+            "stream_port": 0,  # HTTP port of the SSE event stream for dashboards, 0 = off
+            "stream_host": "127.0.0.1",  # Address the event stream listens on
+            "aggregator_url": "",  # http://host:port or udp://host:port of the central aggregator, "" = off
+            "store_id": "",  # Name reported to the aggregator, "" = computer name
+            "report_interval": 10,  # Seconds between reports to the aggregator
+            "aggregator_token": "",  # Shared secret between stores and the aggregator
+            "spool_mb": 16,  # Disk space for state changes kept while the aggregator is unreachable, 0 = off
+            "fprint_port": 0,  # macOS: local port FPrint.exe listens on, checked before it counts as started, 0 = off
             "auto_start": True,
-            "minimize_to_tray": True
+            "minimize_to_tray": True,
+            "log_level": "INFO"
         }
+        self.default_settings.update(defaults or {})
+        self.validator = ConfigValidator()
         self.settings = self.load_settings()
+        self.log_validation_errors()
     
     def get_config_path(self) -> str:
         """Get the full path to the config file"""
-        app_dir = os.path.dirname(os.path.abspath(__file__))
+        app_dir = self.config_dir or os.path.dirname(os.path.abspath(__file__))
         return os.path.join(app_dir, self.config_file)
     
     def load_settings(self) -> Dict[str, Any]:
@@ -25,23 +73,63 @@ class SettingsManager:
         config_path = self.get_config_path()
         
         try:
+            if self.config_dir:
+                os.makedirs(self.config_dir, exist_ok=True)
             if os.path.exists(config_path):
                 with open(config_path, 'r') as f:
                     loaded_settings = json.load(f)
                 
+                loaded_settings, migrated = migrate(loaded_settings)
+                
                 # Merge with defaults to ensure all keys exist
                 settings = self.default_settings.copy()
                 settings.update(loaded_settings)
+                if migrated:
+                    self.backup_config(config_path)
+                    self.save_settings(settings)
                 return settings
             else:
                 # Create config file with defaults
                 self.save_settings(self.default_settings)
                 return self.default_settings.copy()
                 
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error loading settings: {e}")
+        except (ValueError, IOError) as e:
+            # ValueError covers malformed JSON and a config migrate() cannot read
+            logger.error("Error loading settings: %s", e)
             return self.default_settings.copy()
     
+    def backup_config(self, config_path: str):
+        """Keep a copy of a config before it is rewritten by a migration"""
+        try:
+            with open(config_path, 'rb') as src, open(config_path + ".bak", 'wb') as dst:
+                dst.write(src.read())
+        except IOError as e:
+            logger.warning("Could not back up config before migration: %s", e)
+    
+    def get_state_path(self) -> str:
+        """Get the path of the binary state snapshot, next to the config file"""
+        return os.path.join(os.path.dirname(self.get_config_path()), "state.bin")
+    
+    def get_history_dir(self) -> str:
+        """Get the folder of the daily probe history files, next to the config file"""
+        return os.path.join(os.path.dirname(self.get_config_path()), "history")
+    
+    def get_spool_dir(self) -> str:
+        """Folder of the store-and-forward spool, next to the config file"""
+        return os.path.join(os.path.dirname(self.get_config_path()), "spool")
+    
+    def reload_settings(self) -> Dict[str, str]:
+        """Re-read the config file and revalidate what changed"""
+        self.settings = self.load_settings()
+        return self.log_validation_errors()
+    
+    def log_validation_errors(self) -> Dict[str, str]:
+        """Validate settings and log each problem once"""
+        errors = self.validate_settings()
+        for key, message in errors.items():
+            logger.warning("Invalid setting %s: %s", key, message, extra={"setting": key})
+        return errors
+    
     def save_settings(self, settings: Dict[str, Any] = None) -> bool:
         """Save settings to JSON file"""
         if settings is None:
@@ -55,7 +143,7 @@ class SettingsManager:
             self.settings = settings
             return True
         except IOError as e:
-            print(f"Error saving settings: {e}")
+            logger.error("Error saving settings: %s", e)
             return False
     
     def get_setting(self, key: str, default=None):
@@ -76,51 +164,94 @@ class SettingsManager:
         return self.save_settings()
     
     def validate_settings(self) -> Dict[str, str]:
-        """Validate current settings and return any errors"""
-        errors = {}
-        
-        # Validate IP address
-        ip = self.settings.get("ip_address", "")
-        if not ip:
-            errors["ip_address"] = "IP address cannot be empty"
-        else:
-            parts = ip.split(".")
-            if len(parts) != 4:
-                errors["ip_address"] = "Invalid IP address format"
-            else:
-                try:
-                    for part in parts:
-                        num = int(part)
-                        if not 0 <= num <= 255:
-                            errors["ip_address"] = "Invalid IP address range"
-                            break
-                except ValueError:
-                    errors["ip_address"] = "Invalid IP address format"
+        """Validate current settings and return any errors.
         
-        # Validate port
-        port = self.settings.get("port", 0)
-        try:
-            port_num = int(port)
-            if not 1 <= port_num <= 65535:
-                errors["port"] = "Port must be between 1 and 65535"
-        except (ValueError, TypeError):
-            errors["port"] = "Port must be a valid number"
-        
-        # Validate check interval
-        interval = self.settings.get("check_interval", 0)
-        try:
-            interval_num = int(interval)
-            if interval_num < 1:
-                errors["check_interval"] = "Check interval must be at least 1 second"
-        except (ValueError, TypeError):
-            errors["check_interval"] = "Check interval must be a valid number"
+        Only rules and targets whose values changed since the previous call
+        are checked again.
+        """
+        return self.validator.validate(self.settings)
+    
+    def get_targets(self) -> List[Dict[str, Any]]:
+        """Get all valid targets with defaults applied"""
+        self.validate_settings()
+        return [dict(target) for target in self.validator.targets]
+    
+    def get_primary_target(self) -> Dict[str, Any]:
+        """Get the first target, the one shown by the tray icon"""
+        targets = self.get_targets()
+        if targets:
+            return targets[0]
+        return {
+            "ip": "192.168.1.155",
+            "port": int(self.settings.get("port", 4999)),
+            "interval": self.settings.get("check_interval", 5),
+        }
+    
+    def set_primary_target(self, ip: str, port: int, interval: int):
+        """Update the first target from the settings window.
         
-        return errors
+        Port and interval are written where they are defined: on the target
+        if it overrides them, otherwise on the global defaults.
+        """
+        targets = [dict(t) if isinstance(t, dict) else t for t in self.settings.get("targets") or []]
+        if not targets or not isinstance(targets[0], dict):
+            targets.insert(0, {})
+        primary = targets[0]
+        primary["ip"] = ip
+        if "port" in primary:
+            primary["port"] = port
+        else:
+            self.settings["port"] = port
+        if "interval" in primary:
+            primary["interval"] = interval
+        else:
+            self.settings["check_interval"] = interval
+        self.settings["targets"] = targets
     
-    def get_connection_settings(self) -> Dict[str, Any]:
-        """Get settings specifically for connection monitoring"""
+    def get_connection_settings(self, target: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Get settings for monitoring a target (the primary target by default)"""
+        if target is None:
+            target = self.get_primary_target()
         return {
-            "ip": self.settings.get("ip_address", "192.168.1.155"),
-            "port": self.settings.get("port", 4999),
-            "interval": self.settings.get("check_interval", 5)
-        }
\ No newline at end of file
+            "ip": target["ip"],
+            "port": target["port"],
+            "interval": target["interval"],
+            "detection_slo": self.settings.get("detection_slo") or None,
+            "adaptive_timeout": bool(self.settings.get("adaptive_timeout", True)),
+            "fail_threshold": int(self.settings.get("fail_threshold", 2)),
+            "fail_window": int(self.settings.get("fail_window", 3)),
+            "recover_threshold": int(self.settings.get("recover_threshold", 2)),
+            "flap_low_threshold": float(self.settings.get("flap_low_threshold", 20.0)),
+            "flap_high_threshold": float(self.settings.get("flap_high_threshold", 30.0)),
+            "degraded_threshold": float(self.settings.get("degraded_threshold", 3.0) or 0)
+        }
+    
+    def get_topology(self) -> Dict[str, Dict[str, list]]:
+        """Get the store -> switch -> register topology with targets as ip:port.
+        
+        Targets with a "store/switch" group are added to the configured topology.
+        """
+        default_port = self.settings.get("port", 4999)
+        topology = {}
+        for store, switches in (self.settings.get("topology") or {}).items():
+            topology[store] = {
+                switch: [r if ":" in r else f"{r}:{default_port}" for r in registers]
+                for switch, registers in switches.items()
+            }
+        for target in self.get_targets():
+            if not target.get("group"):
+                continue
+            store, _, switch = target["group"].partition("/")
+            registers = topology.setdefault(store, {}).setdefault(switch or store, [])
+            if target["target"] not in registers:
+                registers.append(target["target"])
+        return topology
+    
+    def get_target_stores(self) -> Dict[str, str]:
+        """Get the topology store of every target that has one (ip:port -> store)"""
+        stores = {}
+        for store, switches in self.get_topology().items():
+            for registers in switches.values():
+                for target in registers:
+                    stores.setdefault(target, store)
+        return stores
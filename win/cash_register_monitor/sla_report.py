@@ -0,0 +1,130 @@
+"""
+Uptime report over the probe history
+
+One pass over the day files in time order (see probe_history) keeps a few
+counters per register, so memory depends on the number of registers and
+not on the length of the period, and records are unpacked straight from
+the file without building objects. The time between two records of a
+register is credited to the state of the first; gaps longer than max_gap
+(the monitor was not running) and time while the local network was down
+count as unmonitored. Per register and per store:
+
+    uptime %   up time / (up + down time)
+    outages    times the register went down, or was down when the period began
+    MTTR       down time / outages
+    MTBF       up time / outages
+"""
+
+import csv
+import json
+from datetime import date
+from typing import Any, Dict, IO, Iterable, List, Optional
+try:
+    from .probe_history import FLAG_NETWORK_DOWN, RECORD, history_files, read_chunks, target_name
+    from .state_filter import STATE_DISCONNECTED
+    from .state_snapshot import STATE_CODES
+except ImportError:
+    from probe_history import FLAG_NETWORK_DOWN, RECORD, history_files, read_chunks, target_name
+    from state_filter import STATE_DISCONNECTED
+    from state_snapshot import STATE_CODES
+
+
+DOWN = STATE_CODES.index(STATE_DISCONNECTED)
+UNKNOWN = 0
+DEFAULT_MAX_GAP = 300.0  # seconds between records after which time is unmonitored
+
+CSV_FIELDS = ["level", "store", "target", "name", "uptime_pct", "outages", "mttr_s", "mtbf_s",
+              "up_s", "down_s", "unmonitored_s"]
+
+# Accumulator slots, a list per register for speed
+_LAST, _STATE, _FLAGS, _UP, _DOWN, _UNMONITORED, _OUTAGES = range(7)
+
+
+def accumulate(paths: Iterable[str], max_gap: float = DEFAULT_MAX_GAP) -> Dict[str, List]:
+    """Up, down and unmonitored seconds and outage counts per target, in one pass"""
+    accumulators: Dict[tuple, List] = {}
+    # Locals and literal slots: this loop runs once per record (see _LAST ... _OUTAGES)
+    get = accumulators.get
+    down, unknown, network_down = DOWN, UNKNOWN, FLAG_NETWORK_DOWN
+    for path in paths:
+        for chunk in read_chunks(path, 65536):
+            for timestamp, _, ip, port, _, state, _, flags in RECORD.iter_unpack(chunk):
+                acc = get((ip, port))
+                if acc is None:
+                    accumulators[(ip, port)] = [timestamp, state, flags, 0.0, 0.0, 0.0, int(state == down)]
+                    continue
+                elapsed = timestamp - acc[0]
+                previous = acc[1]
+                if elapsed > 0:
+                    if elapsed > max_gap or acc[2] & network_down or previous == unknown:
+                        acc[5] += elapsed
+                    elif previous == down:
+                        acc[4] += elapsed
+                    else:
+                        acc[3] += elapsed
+                if state == down and previous != down:
+                    acc[6] += 1
+                acc[0] = timestamp
+                acc[1] = state
+                acc[2] = flags
+    return {target_name(*key): acc for key, acc in accumulators.items()}
+
+
+def summarize(up: float, down: float, unmonitored: float, outages: int) -> Dict[str, Any]:
+    measured = up + down
+    return {
+        "uptime_pct": round(100.0 * up / measured, 3) if measured else None,
+        "outages": outages,
+        "mttr_s": round(down / outages, 1) if outages else None,
+        "mtbf_s": round(up / outages, 1) if outages else None,
+        "up_s": round(up),
+        "down_s": round(down),
+        "unmonitored_s": round(unmonitored),
+    }
+
+
+def build_report(history_dir: str, start: Optional[date] = None, end: Optional[date] = None,
+                 stores: Dict[str, str] = None, names: Dict[str, str] = None,
+                 default_store: str = "", max_gap: float = DEFAULT_MAX_GAP) -> Dict[str, Any]:
+    """Availability per register and per store between start and end (inclusive)
+
+    Args:
+        history_dir: Folder with the day files
+        stores: Store of each target; others belong to default_store
+        names: Display name of each target
+    """
+    stores = stores or {}
+    names = names or {}
+    accumulators = accumulate(history_files(history_dir, start, end), max_gap)
+
+    registers = []
+    totals: Dict[str, List[float]] = {}
+    for target in sorted(accumulators):
+        acc = accumulators[target]
+        store = stores.get(target, default_store)
+        registers.append(dict(level="register", store=store, target=target, name=names.get(target),
+                              **summarize(acc[_UP], acc[_DOWN], acc[_UNMONITORED], acc[_OUTAGES])))
+        total = totals.setdefault(store, [0.0, 0.0, 0.0, 0])
+        for i, slot in enumerate((_UP, _DOWN, _UNMONITORED, _OUTAGES)):
+            total[i] += acc[slot]
+
+    return {
+        "from": start.isoformat() if start else None,
+        "to": end.isoformat() if end else None,
+        "registers": registers,
+        "stores": [dict(level="store", store=store, target=None, name=None, **summarize(*total))
+                   for store, total in sorted(totals.items())],
+    }
+
+
+def write_csv(report: Dict[str, Any], out: IO[str]):
+    """One row per register, then one per store"""
+    writer = csv.DictWriter(out, CSV_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(report["registers"])
+    writer.writerows(report["stores"])
+
+
+def write_json(report: Dict[str, Any], out: IO[str]):
+    json.dump(report, out, indent=2)
+    out.write("\n")
@@ -0,0 +1,251 @@
+"""
+Disk-backed store-and-forward spool
+
+Transitions that must reach the aggregator survive a WAN outage and a
+restart: they are appended to segment files (spool/000000000001.seg, ...)
+and only removed after the aggregator acknowledged them. Each record is
+length-prefixed and checksummed, so a record torn by a power cut is cut off
+when the spool is opened and a corrupt one is skipped instead of replayed.
+The spool is capped in size; when it is full the oldest segment is dropped,
+so a long outage costs the oldest transitions, never memory or the disk.
+
+Layout (little endian):
+    segment header: magic "CRMS", version
+    records: length, CRC-32 of the payload, payload
+The read position is kept in "cursor" as the segment number and offset.
+"""
+
+import os
+import struct
+import threading
+import zlib
+from typing import List, Optional, Tuple
+try:
+    from .logging_setup import get_logger
+except ImportError:
+    from logging_setup import get_logger
+
+
+logger = get_logger(__name__)
+
+MAGIC = b"CRMS"
+FORMAT_VERSION = 1
+SEGMENT_HEADER = struct.Struct("<4sH2x")
+RECORD_HEADER = struct.Struct("<II")  # payload length, CRC-32
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+Cursor = Tuple[int, int]  # (segment number, offset)
+
+
+class Spool:
+    """Size-capped FIFO of byte records in checksummed segment files"""
+
+    def __init__(self, directory: str, max_bytes: int = 16 * 1024 * 1024,
+                 segment_bytes: int = 1024 * 1024):
+        """
+        Args:
+            directory: Folder holding the segment files
+            max_bytes: Size the spool may reach before the oldest segment is dropped
+            segment_bytes: Size at which a new segment is started
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # At least a few segments, so dropping one only loses the oldest part
+        self.segment_bytes = max(4096, min(segment_bytes, max_bytes // 4))
+        self.dropped_bytes = 0
+        self._segments: List[int] = []
+        self._sizes = {}
+        self._cursor: Cursor = (0, SEGMENT_HEADER.size)
+        self._writer = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:012d}{SEGMENT_SUFFIX}")
+
+    def _open(self):
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit():
+                segment = int(name[:-len(SEGMENT_SUFFIX)])
+                self._segments.append(segment)
+                self._sizes[segment] = os.path.getsize(self._path(segment))
+        if self._segments:
+            self._repair(self._segments[-1])
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                segment, offset = (int(part) for part in f.read().split())
+            self._cursor = (segment, offset)
+        except (OSError, ValueError):
+            self._cursor = (self._segments[0] if self._segments else 1, SEGMENT_HEADER.size)
+        if self._cursor[0] not in self._sizes:
+            # Its segment is gone: continue with the next one there is
+            later = [s for s in self._segments if s > self._cursor[0]]
+            self._cursor = (later[0] if later else self._cursor[0], SEGMENT_HEADER.size)
+        elif self._cursor[1] > self._sizes[self._cursor[0]]:
+            self._cursor = (self._cursor[0], self._sizes[self._cursor[0]])  # segment was repaired
+
+    def _repair(self, segment: int):
+        """Cut a record torn by a crash off the end of the last segment.
+
+        A complete record with a bad checksum is passed over rather than
+        treated as the end, so the records after it are kept.
+        """
+        path = self._path(segment)
+        valid = SEGMENT_HEADER.size
+        with open(path, "rb") as f:
+            header = f.read(SEGMENT_HEADER.size)
+            if len(header) < SEGMENT_HEADER.size or SEGMENT_HEADER.unpack(header) != (MAGIC, FORMAT_VERSION):
+                logger.warning("Removing unreadable spool segment", extra={"segment": segment})
+                self._delete(segment)
+                return
+            for _ in self._scan(f, skip_corrupt=True):
+                valid = f.tell()
+        if valid != self._sizes[segment]:
+            logger.warning("Truncating damaged spool segment", extra={"segment": segment,
+                                                                      "bytes": self._sizes[segment] - valid})
+            with open(path, "r+b") as f:
+                f.truncate(valid)
+            self._sizes[segment] = valid
+
+    @staticmethod
+    def _scan(f, limit: Optional[int] = None, skip_corrupt: bool = False):
+        """Yield valid payloads from the current position until the end or a bad record.
+
+        With skip_corrupt, a complete record whose checksum does not match
+        is passed over; its length still says where the next one starts.
+        """
+        while limit is None or limit > 0:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            length, crc = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) == length and zlib.crc32(payload) != crc and skip_corrupt:
+                logger.warning("Skipping spool record with a bad checksum", extra={"bytes": length})
+                continue
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                f.seek(-len(header) - len(payload), os.SEEK_CUR)
+                return
+            yield payload
+            if limit is not None:
+                limit -= 1
+
+    @property
+    def size(self) -> int:
+        """Bytes on disk"""
+        return sum(self._sizes.values())
+
+    def append(self, payload: bytes):
+        """Add one record; it is on disk when this returns"""
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            try:
+                writer = self._get_writer(len(record))
+                writer.write(record)
+                writer.flush()
+                os.fsync(writer.fileno())
+            except OSError as e:
+                logger.warning("Could not write to spool: %s", e)
+                self._close_writer()
+                return
+            self._sizes[self._segments[-1]] += len(record)
+            self._enforce_cap()
+
+    def _get_writer(self, needed: int):
+        if self._segments and self._sizes[self._segments[-1]] + needed > self.segment_bytes \
+                and self._sizes[self._segments[-1]] > SEGMENT_HEADER.size:
+            self._close_writer()
+            self._new_segment()
+        elif not self._segments:
+            self._new_segment()
+        if self._writer is None:
+            self._writer = open(self._path(self._segments[-1]), "ab")
+        return self._writer
+
+    def _new_segment(self):
+        segment = max(self._segments[-1] + 1 if self._segments else 1, self._cursor[0])
+        with open(self._path(segment), "wb") as f:
+            f.write(SEGMENT_HEADER.pack(MAGIC, FORMAT_VERSION))
+        self._segments.append(segment)
+        self._sizes[segment] = SEGMENT_HEADER.size
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _enforce_cap(self):
+        while self.size > self.max_bytes and len(self._segments) > 1:
+            segment = self._segments[0]
+            self.dropped_bytes += self._sizes[segment]
+            logger.warning("Spool full, dropping oldest segment", extra={"segment": segment})
+            self._delete(segment)
+            if self._cursor[0] <= segment:
+                self._cursor = (self._segments[0], SEGMENT_HEADER.size)
+                self._save_cursor()
+
+    def _delete(self, segment: int):
+        self._segments.remove(segment)
+        del self._sizes[segment]
+        try:
+            os.remove(self._path(segment))
+        except OSError as e:
+            logger.warning("Could not delete spool segment: %s", e)
+
+    def read_batch(self, max_records: int = 500, max_bytes: int = 256 * 1024) -> Tuple[List[bytes], Cursor]:
+        """Oldest unacknowledged records and the cursor to ack() once they are delivered"""
+        records: List[bytes] = []
+        total = 0
+        with self._lock:
+            segment, offset = self._cursor
+            for segment in [s for s in self._segments if s >= self._cursor[0]]:
+                if segment != self._cursor[0]:
+                    offset = SEGMENT_HEADER.size
+                end = self._sizes[segment]
+                if offset < end:
+                    with open(self._path(segment), "rb") as f:
+                        f.seek(offset)
+                        for payload in self._scan(f, max_records - len(records), skip_corrupt=True):
+                            records.append(payload)
+                            total += len(payload)
+                            if total >= max_bytes:
+                                break
+                        offset = f.tell()
+                    if offset < end and len(records) < max_records and total < max_bytes:
+                        # A record cut short: its length is wrong, so the rest cannot be found
+                        logger.warning("Skipping corrupt spool records", extra={"segment": segment,
+                                                                                "bytes": end - offset})
+                        offset = end
+                if len(records) >= max_records or total >= max_bytes:
+                    break
+            return records, (segment, offset)
+
+    def ack(self, cursor: Cursor):
+        """Forget records up to cursor, deleting segments that were fully delivered"""
+        with self._lock:
+            self._cursor = cursor
+            for segment in [s for s in self._segments if s < cursor[0]]:
+                self._delete(segment)
+            self._save_cursor()
+
+    def pending(self) -> bool:
+        """Whether there are records not acknowledged yet"""
+        with self._lock:
+            segment, offset = self._cursor
+            return any(self._sizes[s] > (offset if s == segment else SEGMENT_HEADER.size)
+                       for s in self._segments if s >= segment)
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        try:
+            with open(path + ".tmp", "w") as f:
+                f.write("%d %d" % self._cursor)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning("Could not save spool cursor: %s", e)
+
+    def close(self):
+        with self._lock:
+            self._close_writer()
@@ -7,6 +7,9 @@ import sys
 import shutil
 
 
+RUN_KEY_PATH = r"Software\Microsoft\Windows\CurrentVersion\Run"
+
+
 class StartupManager:
     """Manages Windows startup integration"""
     
@@ -30,12 +33,11 @@ class StartupManager:
             import winreg
             
             exe_path = self.get_executable_path()
-            key_path = r"Software\Microsoft\Windows\CurrentVersion\Run"
             
             # Open the registry key
             key = winreg.OpenKey(
                 winreg.HKEY_CURRENT_USER, 
-                key_path, 
+                RUN_KEY_PATH, 
                 0, 
                 winreg.KEY_SET_VALUE
             )
@@ -56,12 +58,10 @@ class StartupManager:
         try:
             import winreg
             
-            key_path = r"Software\Microsoft\Windows\CurrentVersion\Run"
-            
             # Open the registry key
             key = winreg.OpenKey(
                 winreg.HKEY_CURRENT_USER, 
-                key_path, 
+                RUN_KEY_PATH, 
                 0, 
                 winreg.KEY_SET_VALUE
             )
@@ -172,8 +172,7 @@ class StartupManager:
         try:
             import winreg
             
-            key_path = r"Software\Microsoft\Windows\CurrentVersion\Run"
-            key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, key_path, 0, winreg.KEY_READ)
+            key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, RUN_KEY_PATH, 0, winreg.KEY_READ)
             
             try:
                 value, _ = winreg.QueryValueEx(key, self.app_name)
@@ -228,4 +227,25 @@ class StartupManager:
         return {
             "registry": {"enabled": registry_status, "path": registry_path},
             "folder": {"enabled": folder_status, "path": folder_path}
-        }
\ No newline at end of file
+        }
+    
+    def ensure_startup(self, status=None):
+        """Make sure the application starts with Windows, touching the registry only if needed.
+        
+        The current state is read once through get_startup_status() (or taken
+        from status) and the Run key is written only when it is missing or
+        points at a different executable. A startup folder shortcut counts as
+        enabled, so the app is never registered to launch twice.
+        
+        Returns:
+            (success, message)
+        """
+        if status is None:
+            status = self.get_startup_status()
+        
+        if status["folder"]["enabled"]:
+            return True, "Already in startup folder"
+        if status["registry"]["enabled"] and status["registry"]["path"] == self.get_executable_path():
+            return True, "Startup registry entry is up to date"
+        
+        return self.add_to_registry_startup()
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+Per-phase startup timing
+
+Startup runs in stages (config, tray, icon visible, first probe). Each
+stage calls mark() when it finishes; log() writes all phase durations as
+one structured record so regressions show up in monitor.log.
+"""
+
+import threading
+import time
+from typing import Dict, List, Tuple
+try:
+    from .logging_setup import get_logger
+except ImportError:
+    from logging_setup import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class StartupTimer:
+    """Record how long each startup phase took"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks: List[Tuple[str, float]] = []
+        self.logged = False
+        self._lock = threading.Lock()
+
+    def mark(self, phase: str):
+        """Record that a phase just finished"""
+        with self._lock:
+            self.marks.append((phase, time.perf_counter()))
+
+    def get_phases(self) -> Dict[str, float]:
+        """Get phase durations in milliseconds, in the order they finished"""
+        with self._lock:
+            marks = list(self.marks)
+        phases = {}
+        previous = self.started
+        for phase, at in marks:
+            phases[phase] = round((at - previous) * 1000, 1)
+            previous = at
+        return phases
+
+    def get_total(self) -> float:
+        """Milliseconds from start to the last mark"""
+        with self._lock:
+            last = self.marks[-1][1] if self.marks else self.started
+        return round((last - self.started) * 1000, 1)
+
+    def log(self):
+        """Log all phases once"""
+        if self.logged:
+            return
+        self.logged = True
+        logger.info("Startup timing", extra={"phases_ms": self.get_phases(),
+                                             "total_ms": self.get_total()})
@@ -0,0 +1,138 @@
+"""
+Hysteresis and flap detection for raw probe results
+
+A single lost SYN should not turn the icon red. HysteresisFilter only
+reports a target down after N failures within the last M probes and back
+up after K consecutive successes. FlapDetector follows Nagios: it keeps
+the last 21 raw results, weights recent state changes more heavily, and
+marks the target flapping while the weighted change rate is above a
+threshold, so alerts for an unstable link are replaced by one "flapping"
+state instead of a stream of up/down transitions. A register that is up
+but whose latency looks like a failing adapter (see anomaly_detector) is
+"degraded".
+"""
+
+from collections import deque
+from typing import Optional
+
+
+STATE_CONNECTED = "connected"
+STATE_DISCONNECTED = "disconnected"
+STATE_FLAPPING = "flapping"
+STATE_DEGRADED = "degraded"
+
+
+class HysteresisFilter:
+    """N-of-M failures to go down, K consecutive successes to come back up"""
+
+    def __init__(self, fail_threshold: int = 2, fail_window: int = 3,
+                 recover_threshold: int = 2):
+        if not 1 <= fail_threshold <= fail_window:
+            raise ValueError("fail_threshold must be between 1 and fail_window")
+        if recover_threshold < 1:
+            raise ValueError("recover_threshold must be at least 1")
+        self.fail_threshold = fail_threshold
+        self.fail_window = fail_window
+        self.recover_threshold = recover_threshold
+        self.state: Optional[bool] = None
+        self._recent = deque(maxlen=fail_window)
+        self._failures = 0
+        self._successes_in_row = 0
+
+    def reset(self, state: Optional[bool] = None):
+        """Forget history; optionally start from a known state"""
+        self.state = state
+        self._recent.clear()
+        self._failures = 0
+        self._successes_in_row = 0
+
+    def get_state(self) -> dict:
+        """Get filter state for persistence"""
+        return {
+            "state": self.state,
+            "recent": list(self._recent),
+            "successes_in_row": self._successes_in_row,
+        }
+
+    def load_state(self, state: dict):
+        """Restore state produced by get_state()"""
+        self.reset(state.get("state"))
+        self._recent.extend(state.get("recent", []))
+        self._failures = sum(1 for ok in self._recent if not ok)
+        self._successes_in_row = state.get("successes_in_row", 0)
+
+    def update(self, ok: bool) -> bool:
+        """Feed a raw probe result and return the filtered state"""
+        if len(self._recent) == self._recent.maxlen and not self._recent[0]:
+            self._failures -= 1
+        self._recent.append(ok)
+        if not ok:
+            self._failures += 1
+        self._successes_in_row = self._successes_in_row + 1 if ok else 0
+
+        if self.state is None:
+            self.state = ok
+        elif self.state and self._failures >= self.fail_threshold:
+            self.state = False
+        elif not self.state and self._successes_in_row >= self.recover_threshold:
+            self.state = True
+        return self.state
+
+
+class FlapDetector:
+    """Nagios-style flap detection over a weighted window of raw results"""
+
+    HISTORY = 21
+
+    def __init__(self, low_threshold: float = 20.0, high_threshold: float = 30.0):
+        if low_threshold > high_threshold:
+            raise ValueError("low_threshold must not exceed high_threshold")
+        self.low_threshold = low_threshold
+        self.high_threshold = high_threshold
+        self.is_flapping = False
+        self.percent_change = 0.0
+        self._history = deque(maxlen=self.HISTORY)
+
+    def reset(self):
+        self._history.clear()
+        self.is_flapping = False
+        self.percent_change = 0.0
+
+    def get_state(self) -> dict:
+        """Get detector state for persistence"""
+        return {"history": list(self._history), "is_flapping": self.is_flapping}
+
+    def load_state(self, state: dict):
+        """Restore state produced by get_state()"""
+        self._history.clear()
+        self._history.extend(state.get("history", []))
+        self.is_flapping = bool(state.get("is_flapping"))
+        self.percent_change = self._weighted_change()
+
+    def update(self, ok: bool) -> bool:
+        """Feed a raw probe result and return whether the target is flapping"""
+        self._history.append(ok)
+        self.percent_change = self._weighted_change()
+
+        if self.is_flapping and self.percent_change < self.low_threshold:
+            self.is_flapping = False
+        elif not self.is_flapping and self.percent_change >= self.high_threshold:
+            self.is_flapping = True
+        return self.is_flapping
+
+    def _weighted_change(self) -> float:
+        """Percentage of state changes, oldest weighted 0.8 and newest 1.2"""
+        history = self._history
+        slots = self.HISTORY - 1
+        if len(history) < 2:
+            return 0.0
+
+        # Align to the end of a full window so weights do not shift as it fills
+        offset = slots - (len(history) - 1)
+        weighted = 0.0
+        previous = history[0]
+        for i, current in enumerate(list(history)[1:]):
+            if current != previous:
+                weighted += 0.8 + 0.4 * (offset + i) / (slots - 1)
+            previous = current
+        return weighted * 100.0 / slots
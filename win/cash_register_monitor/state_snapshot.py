@@ -0,0 +1,241 @@
+"""
+Compact binary snapshot of monitor state for warm restarts
+
+Every target is stored as one fixed-size record: address, last state and
+failure reason, RTT estimator, hysteresis window, flap history, latency
+anomaly baseline and the RTT histogram. The file is written atomically (temp file + rename) and loaded
+through mmap, so restoring hundreds of targets takes well under a
+millisecond and the tray can show last-known state before the first probe.
+
+Layout (little endian):
+    header: magic "CRMS", version, record size, record count, saved_at, crc32
+    records: RECORD * count
+"""
+
+import math
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+try:
+    from .logging_setup import get_logger
+except ImportError:
+    from logging_setup import get_logger
+
+
+logger = get_logger(__name__)
+
+MAGIC = b"CRMS"
+FORMAT_VERSION = 3
+
+# Upper bounds (seconds) of the RTT histogram buckets; one more bucket
+# collects everything slower
+RTT_HISTOGRAM_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+                        0.1, 0.2, 0.5, 1.0, 2.0)
+HISTOGRAM_BUCKETS = len(RTT_HISTOGRAM_BOUNDS) + 1
+
+HEADER = struct.Struct("<4sHHIdI")
+RECORD = struct.Struct(
+    "<4sH"    # ip, port
+    "BBB"     # state, connected, reason
+    "d"       # last_check (epoch seconds, 0 = never)
+    "ddIHH"   # srtt, rttvar (NaN = no samples), samples, backoff, timeouts in a row
+    "BBIH"    # hysteresis state, window length, window bits, successes in a row
+    "BIB"     # flap history length, history bits, is_flapping
+    "ddddIB"  # anomaly mean, var, fast (NaN = no baseline), loss, samples, degraded
+    f"{HISTOGRAM_BUCKETS}I"
+)
+
+# Small integer codes for strings stored in records; 0 means None
+STATE_CODES = (None, "connected", "disconnected", "flapping", "degraded")
+REASON_CODES = (None, "ok", "port_closed", "timeout", "host_unreachable",
+                "network_unreachable", "error")
+_TRISTATE = (None, False, True)
+
+
+def _code(values: tuple, value) -> int:
+    return values.index(value) if value in values else 0
+
+
+def _pack_bits(flags: List[bool]) -> int:
+    bits = 0
+    for i, flag in enumerate(flags[-32:]):
+        if flag:
+            bits |= 1 << i
+    return bits
+
+
+def _unpack_bits(bits: int, length: int) -> List[bool]:
+    return [bool(bits >> i & 1) for i in range(length)]
+
+
+def _none_to_nan(value: Optional[float]) -> float:
+    return math.nan if value is None else value
+
+
+def _nan_to_none(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def pack_record(snapshot: Dict[str, Any]) -> bytes:
+    """Pack one ConnectionMonitor.get_snapshot() dict"""
+    rtt = snapshot["rtt"]
+    hysteresis = snapshot["hysteresis"]
+    flap = snapshot["flap"]
+    recent = hysteresis["recent"][-32:]
+    history = flap["history"][-32:]
+    last_check = snapshot["last_check"]
+    anomaly = snapshot.get("anomaly") or {}
+    return RECORD.pack(
+        socket.inet_aton(snapshot["ip"]), snapshot["port"],
+        _code(STATE_CODES, snapshot["state"]), bool(snapshot["connected"]),
+        _code(REASON_CODES, snapshot["reason"]),
+        last_check.timestamp() if last_check else 0.0,
+        _none_to_nan(rtt["srtt"]), _none_to_nan(rtt["rttvar"]),
+        min(rtt["samples"], 0xFFFFFFFF), min(rtt["backoff"], 0xFFFF),
+        min(rtt.get("timeouts", 0), 0xFFFF),
+        _code(_TRISTATE, hysteresis["state"]), len(recent), _pack_bits(recent),
+        min(hysteresis["successes_in_row"], 0xFFFF),
+        len(history), _pack_bits(history), bool(flap["is_flapping"]),
+        _none_to_nan(anomaly.get("mean")), anomaly.get("var", 0.0),
+        _none_to_nan(anomaly.get("fast")), anomaly.get("loss", 0.0),
+        min(anomaly.get("samples", 0), 0xFFFFFFFF), bool(anomaly.get("degraded")),
+        *(min(count, 0xFFFFFFFF) for count in snapshot["rtt_histogram"]),
+    )
+
+
+def unpack_record(data, offset: int = 0) -> Dict[str, Any]:
+    """Inverse of pack_record()"""
+    (ip, port, state, connected, reason, last_check,
+     srtt, rttvar, samples, backoff, timeouts,
+     hyst_state, recent_len, recent_bits, successes_in_row,
+     history_len, history_bits, is_flapping,
+     anomaly_mean, anomaly_var, anomaly_fast, anomaly_loss, anomaly_samples, anomaly_degraded,
+     *histogram) = RECORD.unpack_from(data, offset)
+    ip = socket.inet_ntoa(ip)
+    return {
+        "ip": ip,
+        "port": port,
+        "target": f"{ip}:{port}",
+        "state": STATE_CODES[state] if state < len(STATE_CODES) else None,
+        "connected": bool(connected),
+        "reason": REASON_CODES[reason] if reason < len(REASON_CODES) else None,
+        "last_check": datetime.fromtimestamp(last_check) if last_check else None,
+        "rtt": {
+            "srtt": _nan_to_none(srtt),
+            "rttvar": _nan_to_none(rttvar),
+            "samples": samples,
+            "backoff": backoff,
+            "timeouts": timeouts,
+        },
+        "hysteresis": {
+            "state": _TRISTATE[hyst_state] if hyst_state < len(_TRISTATE) else None,
+            "recent": _unpack_bits(recent_bits, recent_len),
+            "successes_in_row": successes_in_row,
+        },
+        "flap": {
+            "history": _unpack_bits(history_bits, history_len),
+            "is_flapping": bool(is_flapping),
+        },
+        "anomaly": {
+            "mean": _nan_to_none(anomaly_mean),
+            "var": anomaly_var,
+            "fast": _nan_to_none(anomaly_fast),
+            "loss": anomaly_loss,
+            "samples": anomaly_samples,
+            "degraded": bool(anomaly_degraded),
+        },
+        "rtt_histogram": list(histogram),
+    }
+
+
+def save_snapshot(path: str, snapshots: Iterable[Dict[str, Any]]) -> bool:
+    """Atomically write monitor snapshots to path"""
+    try:
+        records = b"".join(pack_record(s) for s in snapshots)
+    except (KeyError, OSError, struct.error) as e:
+        logger.warning("Could not pack state snapshot: %s", e)
+        return False
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.size,
+                         len(records) // RECORD.size, time.time(), zlib.crc32(records))
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(records)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        logger.warning("Could not write state snapshot: %s", e)
+        return False
+
+
+def load_snapshot(path: str) -> Dict[str, Dict[str, Any]]:
+    """Load snapshots keyed by "ip:port"; empty if missing, stale format or corrupt"""
+    try:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return _parse(data)
+    except (OSError, ValueError) as e:
+        # ValueError: mmap of an empty file
+        if not isinstance(e, FileNotFoundError):
+            logger.warning("Could not read state snapshot: %s", e)
+        return {}
+
+
+def _parse(data) -> Dict[str, Dict[str, Any]]:
+    if len(data) < HEADER.size:
+        return {}
+    magic, version, record_size, count, _saved_at, crc = HEADER.unpack_from(data, 0)
+    end = HEADER.size + record_size * count
+    if (magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD.size
+            or len(data) < end or zlib.crc32(data[HEADER.size:end]) != crc):
+        logger.warning("Ignoring incompatible or corrupt state snapshot")
+        return {}
+
+    snapshots = {}
+    for offset in range(HEADER.size, end, RECORD.size):
+        snapshot = unpack_record(data, offset)
+        snapshots[snapshot["target"]] = snapshot
+    return snapshots
+
+
+class SnapshotWriter:
+    """Periodically snapshot the monitors returned by get_monitors"""
+
+    def __init__(self, path: str, get_monitors: Callable[[], Iterable[Any]],
+                 interval: float = 30.0):
+        self.path = path
+        self.get_monitors = get_monitors
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def save(self) -> bool:
+        """Write a snapshot now"""
+        return save_snapshot(self.path, [m.get_snapshot() for m in self.get_monitors()])
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self, final_save: bool = True):
+        """Stop the writer, optionally writing one last snapshot"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+        if final_save:
+            self.save()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.save()
@@ -0,0 +1,304 @@
+"""
+Report register status to a central aggregator
+
+StatusReporter follows the core's state changes and, every report
+interval, sends the aggregator (see aggregator) the registers that changed
+since the last report as one compressed JSON document: gzip over HTTP
+(http://host:port) or a single zlib-compressed datagram (udp://host:port).
+Nothing changed still sends an empty report, which tells the aggregator the
+store is alive. Every FULL_EVERY reports, after a failed send, and when the
+aggregator replies that it missed something, the report carries every
+register instead, so the central table heals itself.
+
+A report only carries the latest state. With a spool (see spool), every
+state change is also written to disk and replayed to POST /transitions in
+compressed batches once the aggregator answers again, backing off
+exponentially while it does not, so changes made during a WAN outage are
+not lost. Replay needs HTTP: UDP gives no acknowledgement.
+
+Reports look like:
+
+    {"source": "shop-12", "session": "...", "seq": 42, "full": false,
+     "interval": 10, "sent": 1760000000.0,
+     "registers": [{"target": "192.168.1.155:4999", "store": "shop-12",
+                    "name": ..., "group": ..., "state": "disconnected",
+                    "connected": false, "reason": "timeout", "rtt": 0.004,
+                    "since": 1759999990.0, "checked": 1759999999.0}]}
+"""
+
+import gzip
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional
+from urllib.error import URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+try:
+    from .aggregator import DEFAULT_PORT
+    from .control_api import encode
+    from .event_dispatcher import DROP_OLDEST
+    from .logging_setup import get_logger
+    from .spool import Spool
+except ImportError:
+    from aggregator import DEFAULT_PORT
+    from control_api import encode
+    from event_dispatcher import DROP_OLDEST
+    from logging_setup import get_logger
+    from spool import Spool
+
+
+logger = get_logger(__name__)
+
+FULL_EVERY = 30        # reports between full reports
+SEND_TIMEOUT = 5.0     # seconds
+MAX_DATAGRAM = 65000   # bytes; larger UDP reports are not sent
+REPLAY_BATCHES = 20    # spool batches replayed per report interval at most
+MAX_BACKOFF = 300.0    # seconds between replay attempts at most
+
+
+def default_store() -> str:
+    """Store name when none is configured: this computer's name"""
+    return socket.gethostname()
+
+
+class StatusReporter:
+    """Send status deltas of a MonitorCore to the aggregator"""
+
+    def __init__(self, core, url: str, store: str = None, interval: float = 10.0,
+                 token: str = None, full_every: int = FULL_EVERY, spool: Spool = None):
+        """
+        Args:
+            core: MonitorCore whose registers are reported
+            url: Aggregator address, http://host:port[/report] or udp://host:port
+            store: Name of this store (and reporting source); the computer
+                name if omitted
+            interval: Seconds between reports
+            token: Shared secret the aggregator expects, if any
+            full_every: Reports between full reports
+            spool: Disk spool for state changes to replay (HTTP only)
+        """
+        self.core = core
+        self.url = urlparse(url)
+        if self.url.scheme not in ("http", "https", "udp") or not self.url.hostname:
+            raise ValueError("Aggregator URL must be http://host:port or udp://host:port")
+        self.store = store or default_store()
+        self.interval = interval
+        self.token = token or None
+        self.full_every = full_every
+        self.spool = spool if self.url.scheme != "udp" else None
+        self.replayed = 0
+        self._replay_failures = 0
+        self._replay_at = 0.0
+        self.session = uuid.uuid4().hex
+        self.seq = 0
+        self.sent = 0
+        self.failures = 0
+        self.running = False
+        self._since: Dict[str, Optional[float]] = {}
+        self._states: Dict[str, Optional[str]] = {}
+        self._dirty = set()
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        self._full = True
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._subscriber = None
+        self._socket = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._stop.clear()
+        self._meta = self._load_meta()
+        with self._lock:
+            # Monitors that already have a state published it before we subscribed
+            for target, monitor in list(self.core.monitors.items()):
+                if monitor.state is not None and target not in self._states:
+                    transition = monitor.last_transition
+                    self._states[target] = monitor.state
+                    self._since[target] = (transition["timestamp"].timestamp() if transition
+                                           else time.time())
+        self._subscriber = self.core.dispatcher.subscribe(
+            self.on_events,
+            name="status-reporter",
+            drop_policy=DROP_OLDEST,  # every transition is spooled, not just the latest
+            batch_size=64,
+            accept=lambda event: event["type"] == "connection"
+        )
+        threading.Thread(target=self._run, name="status-reporter", daemon=True).start()
+        logger.info("Reporting to aggregator", extra={"url": self.url.geturl(), "store": self.store})
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.core.dispatcher.unsubscribe(self._subscriber)
+        self._stop.set()
+
+    def on_events(self, events: List[Dict[str, Any]]):
+        changes = []
+        with self._lock:
+            for event in events:
+                target = event["target"]
+                if self._states.get(target, "") != event["state"]:
+                    self._states[target] = event["state"]
+                    self._since[target] = event["timestamp"].timestamp()
+                    changes.append(event)
+                self._dirty.add(target)
+        if self.spool is not None:
+            for event in changes:
+                self.spool.append(encode({
+                    "target": event["target"],
+                    "store": self._meta.get(event["target"], {}).get("store", self.store),
+                    "state": event["state"],
+                    "connected": event["connected"],
+                    "reason": event["reason"],
+                    "timestamp": event["timestamp"].timestamp(),
+                }))
+
+    def request_full(self):
+        """Send every register with the next report"""
+        with self._lock:
+            self._full = True
+
+    def build_report(self) -> Dict[str, Any]:
+        """Take the pending changes (or everything) as the next report"""
+        with self._lock:
+            full = self._full or self.seq % self.full_every == 0
+            dirty, self._dirty = self._dirty, set()
+            self._full = False
+            self.seq += 1
+            seq = self.seq
+        if full:
+            self._meta = self._load_meta()  # settings may have changed
+        monitors = self.core.monitors
+        targets = list(monitors) if full else [target for target in dirty if target in monitors]
+        registers = [self._register(target, monitors[target]) for target in targets]
+        report = {
+            "source": self.store,
+            "session": self.session,
+            "seq": seq,
+            "full": full,
+            "interval": self.interval,
+            "sent": time.time(),
+            "registers": registers,
+        }
+        if self.token:
+            report["token"] = self.token
+        return report
+
+    def _register(self, target: str, monitor) -> Dict[str, Any]:
+        meta = self._meta.get(target, {})
+        last_check = monitor.last_check_time
+        return {
+            "target": target,
+            "store": meta.get("store", self.store),
+            "name": meta.get("name"),
+            "group": meta.get("group"),
+            "state": monitor.state,
+            "connected": monitor.is_connected,
+            "reason": monitor.last_probe and monitor.last_probe["reason"],
+            "rtt": monitor.rtt.srtt,
+            "since": self._since.get(target),
+            "checked": last_check.timestamp() if last_check else None,
+        }
+
+    def _load_meta(self) -> Dict[str, Dict[str, Any]]:
+        """Name, group and topology store of every configured target"""
+        settings = self.core.settings_manager
+        meta = {target: {"store": store} for target, store in settings.get_target_stores().items()}
+        for target in settings.get_targets():
+            entry = meta.setdefault(target["target"], {})
+            entry["name"] = target.get("name")
+            entry["group"] = target.get("group")
+        return meta
+
+    def send(self, report: Dict[str, Any]) -> bool:
+        """Send one report; False if it did not reach the aggregator"""
+        body = encode(report)
+        try:
+            if self.url.scheme == "udp":
+                return self._send_udp(zlib.compress(body))
+            return self._send_http(gzip.compress(body))
+        except (OSError, ValueError) as e:
+            logger.warning("Could not report to aggregator: %s", e, extra={"url": self.url.geturl()})
+            return False
+
+    def _endpoint(self, name: str) -> str:
+        """URL of an aggregator endpoint; the configured path is its base"""
+        base = self.url.path.rstrip("/")
+        if base.endswith("/report"):
+            base = base[:-len("/report")]
+        return self.url._replace(path=f"{base}/{name}").geturl()
+
+    def _post(self, name: str, data: bytes) -> Dict[str, Any]:
+        request = Request(self._endpoint(name), data=data, method="POST", headers={
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+        })
+        try:
+            with urlopen(request, timeout=SEND_TIMEOUT) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except URLError as e:
+            raise OSError(e.reason)
+
+    def _send_http(self, data: bytes) -> bool:
+        if self._post("report", data).get("resync"):
+            self.request_full()
+        return True
+
+    def replay(self):
+        """Send spooled state changes in batches until the spool is empty or a send fails"""
+        if self.spool is None or time.monotonic() < self._replay_at:
+            return
+        header = {"source": self.store, "session": self.session}
+        if self.token:
+            header["token"] = self.token
+        header = encode(header)
+        for _ in range(REPLAY_BATCHES):
+            records, cursor = self.spool.read_batch()
+            if not records:
+                return
+            # The records are JSON already; splice them into the body as they are
+            body = header[:-1] + b', "transitions": [' + b", ".join(records) + b"]}"
+            try:
+                self._post("transitions", gzip.compress(body))
+            except (OSError, ValueError) as e:
+                self._replay_failures += 1
+                delay = min(MAX_BACKOFF, self.interval * 2 ** self._replay_failures)
+                self._replay_at = time.monotonic() + delay * random.uniform(0.5, 1.0)
+                logger.warning("Could not replay spooled changes: %s", e,
+                               extra={"pending_bytes": self.spool.size, "retry_in": round(delay)})
+                return
+            self.spool.ack(cursor)
+            self.replayed += len(records)
+            self._replay_failures = 0
+
+    def _send_udp(self, data: bytes) -> bool:
+        if len(data) > MAX_DATAGRAM:
+            raise ValueError(f"Report of {len(data)} bytes is too large for UDP; use http://")
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.sendto(data, (self.url.hostname, self.url.port or DEFAULT_PORT))
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            report = self.build_report()
+            if self.send(report):
+                self.sent += 1
+                self.replay()
+            else:
+                # The aggregator missed these changes; catch up in one go
+                self.failures += 1
+                self.request_full()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        if self.spool is not None:
+            self.spool.close()
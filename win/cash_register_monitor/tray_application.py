@@ -1,7 +1,6 @@
 import pystray
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import Image, ImageDraw
 import threading
 import os
 import sys
@@ -9,9 +8,47 @@ from datetime import datetime
 try:
     from .connection_monitor import ConnectionMonitor
     from .settings_manager import SettingsManager
+    from .alert_correlator import AlertCorrelator
+    from .fleet_summary import FleetSummary
+    from .anomaly_detector import LatencyAnomalyDetector
+    from .icon_pack import OVERLAY_DEGRADED, OVERLAY_FLAPPING, IconPack, icon_name, preferred_icon_size
+    from .event_dispatcher import COALESCE, EventDispatcher
+    from .logging_setup import set_log_level
+    from .monitor_core import MonitorCore
+    from .state_filter import STATE_DEGRADED, STATE_FLAPPING
+    from .startup_timing import StartupTimer
 except ImportError:
     from connection_monitor import ConnectionMonitor
     from settings_manager import SettingsManager
+    from alert_correlator import AlertCorrelator
+    from fleet_summary import FleetSummary
+    from anomaly_detector import LatencyAnomalyDetector
+    from icon_pack import OVERLAY_DEGRADED, OVERLAY_FLAPPING, IconPack, icon_name, preferred_icon_size
+    from event_dispatcher import COALESCE, EventDispatcher
+    from logging_setup import set_log_level
+    from monitor_core import MonitorCore
+    from state_filter import STATE_DEGRADED, STATE_FLAPPING
+    from startup_timing import StartupTimer
+
+
+# Human-readable failure reasons for the tooltip and status window
+REASON_TEXT = {
+    'port_closed': "port closed - register is on but not accepting connections",
+    'timeout': "no response",
+    'host_unreachable': "host unreachable",
+    'network_unreachable': "network unreachable",
+    'error': "connection error",
+}
+
+
+def describe_degradation(anomaly: dict) -> str:
+    """Why a register is degraded, e.g. "RTT 40 ms, usually 3 ms" """
+    if not anomaly or anomaly["recent_rtt"] is None:
+        return "unanswered probes"
+    text = f"RTT {anomaly['recent_rtt'] * 1000:.0f} ms, usually {anomaly['baseline_rtt'] * 1000:.0f} ms"
+    if anomaly["loss"] >= LatencyAnomalyDetector.LOSS_LOW:
+        text += f", {anomaly['loss']:.0%} unanswered"
+    return text
 
 
 class SettingsWindow:
@@ -44,22 +81,23 @@ class SettingsWindow:
     def create_widgets(self):
         main_frame = ttk.Frame(self.window, padding="20")
         main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        primary = self.settings_manager.get_primary_target()
         
         # IP Address
         ttk.Label(main_frame, text="Cash Register IP Address:").grid(row=0, column=0, sticky=tk.W, pady=(0, 5))
-        self.ip_var = tk.StringVar(value=self.settings_manager.get_setting("ip_address"))
+        self.ip_var = tk.StringVar(value=primary["ip"])
         ip_entry = ttk.Entry(main_frame, textvariable=self.ip_var, width=20)
         ip_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), pady=(0, 5))
         
         # Port
         ttk.Label(main_frame, text="Port:").grid(row=1, column=0, sticky=tk.W, pady=(0, 5))
-        self.port_var = tk.StringVar(value=str(self.settings_manager.get_setting("port")))
+        self.port_var = tk.StringVar(value=str(primary["port"]))
         port_entry = ttk.Entry(main_frame, textvariable=self.port_var, width=20)
         port_entry.grid(row=1, column=1, sticky=(tk.W, tk.E), pady=(0, 5))
         
         # Check Interval
         ttk.Label(main_frame, text="Check Interval (seconds):").grid(row=2, column=0, sticky=tk.W, pady=(0, 5))
-        self.interval_var = tk.StringVar(value=str(self.settings_manager.get_setting("check_interval")))
+        self.interval_var = tk.StringVar(value=f"{primary['interval']:g}")
         interval_entry = ttk.Entry(main_frame, textvariable=self.interval_var, width=20)
         interval_entry.grid(row=2, column=1, sticky=(tk.W, tk.E), pady=(0, 5))
         
@@ -110,7 +148,7 @@ class SettingsWindow:
             # Validate inputs
             ip = self.ip_var.get().strip()
             port = int(self.port_var.get().strip())
-            interval = int(self.interval_var.get().strip())
+            interval = float(self.interval_var.get().strip())
             
             if not ip:
                 raise ValueError("IP address cannot be empty")
@@ -120,10 +158,8 @@ class SettingsWindow:
                 raise ValueError("Check interval must be at least 1 second")
             
             # Update settings
+            self.settings_manager.set_primary_target(ip, port, interval)
             self.settings_manager.update_settings(
-                ip_address=ip,
-                port=port,
-                check_interval=interval,
                 auto_start=self.auto_start_var.get(),
                 minimize_to_tray=self.minimize_var.get()
             )
@@ -149,42 +185,115 @@ class SettingsWindow:
 
 
 class TrayApplication:
-    def __init__(self):
-        self.settings_manager = SettingsManager()
-        self.monitor = None
+    def __init__(self, settings_manager: SettingsManager = None,
+                 startup_timer: StartupTimer = None):
+        self.startup_timer = startup_timer or StartupTimer()
+        self.settings_manager = settings_manager or SettingsManager()
+        self.fleet = None
+        self.fleet_subscriber = None
         self.icon = None
         self.settings_window = None
+        self.correlator = None
+        self.alert_subscriber = None
+        set_log_level(self.settings_manager.get_setting("log_level", "INFO"))
         
-        # Initialize monitor with current settings
-        self.restart_monitor()
-        
-    def create_icon_image(self, color: str) -> Image.Image:
-        """Create a colored circle icon"""
-        width = height = 64
-        image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(image)
+        # Pre-rendered icons (built by create_icons.py); drawn with PIL only if missing
+        self.icon_pack = IconPack.load()
+        self.icon_size = preferred_icon_size()
         
-        # Color mapping
-        colors = {
-            'green': (0, 255, 0, 255),
-            'red': (255, 0, 0, 255),
-            'yellow': (255, 255, 0, 255),
-            'gray': (128, 128, 128, 255)
-        }
+        # Shared by the monitor and the network check; the tray only consumes
+        self.dispatcher = EventDispatcher(name="tray")
+        self.core = MonitorCore(self.settings_manager, self.dispatcher)
+        self.dispatcher.subscribe(
+            self.on_network_change,
+            name="tray-network",
+            drop_policy=COALESCE,
+            accept=lambda event: event["type"] == "network"
+        )
+        self.startup_timer.mark("snapshot_load")
         
-        color_rgba = colors.get(color, colors['gray'])
+        # Build the monitor from current settings; probing starts once the
+        # icon is visible (see run) so a dead register cannot delay the tray
+        self.create_monitor()
+        self.startup_timer.mark("tray_init")
         
-        # Draw circle
-        margin = 8
-        draw.ellipse([margin, margin, width-margin, height-margin], fill=color_rgba)
+    @property
+    def monitors(self):
+        return self.core.monitors
+    
+    @property
+    def monitor(self):
+        """The first target; the only one outside fleet mode"""
+        return self.core.monitor
+    
+    def create_icon_image(self, color: str, overlay: str = None, count: int = None):
+        """Get the tray icon for a state color, with an optional overlay or count badge"""
+        if self.icon_pack is not None:
+            for name in (icon_name(color, overlay, count), icon_name(color)):
+                try:
+                    return self.icon_pack.get_image(name, self.icon_size)
+                except KeyError:
+                    continue
+        return self.draw_icon_image(color, overlay, count)
+    
+    def draw_icon_image(self, color: str, overlay: str = None, count: int = None):
+        """Draw the icon at run time (fallback when no icon pack was built)"""
+        try:
+            from .create_icons import draw_overlay, render_state_icon
+        except ImportError:
+            from create_icons import draw_overlay, render_state_icon
         
-        return image
+        return draw_overlay(render_state_icon(color, 64), overlay, count)
+    
+    def get_state_color(self, status: dict) -> str:
+        """Map monitor state to an icon color"""
+        if status.get('state') is None:
+            return 'gray'
+        if status.get('network_down'):
+            return 'purple'
+        if status.get('state') == STATE_FLAPPING:
+            return 'orange'
+        return 'green' if status['connected'] else 'red'
+    
+    def get_state_icon(self, status: dict):
+        """Icon image for a monitor status"""
+        overlays = {STATE_FLAPPING: OVERLAY_FLAPPING, STATE_DEGRADED: OVERLAY_DEGRADED}
+        return self.create_icon_image(self.get_state_color(status), overlays.get(status.get('state')))
+    
+    def get_fleet_icon(self):
+        """Icon image for the fleet summary, with the number of down registers"""
+        overlay = OVERLAY_DEGRADED if self.fleet.degraded else None
+        return self.create_icon_image(self.fleet.get_color(), overlay, count=self.fleet.down or None)
+    
+    def get_fleet_tooltip_text(self) -> str:
+        """Fleet summary plus as many down registers as fit in a tray tooltip"""
+        text = f"Cash Registers: {self.fleet.get_text()}"
+        for _, name, _ in self.fleet.get_down(limit=5):
+            line = f"\n✗ {name}"
+            # Windows truncates tray tooltips at 127 characters
+            if len(text) + len(line) > 120:
+                text += "\n…"
+                break
+            text += line
+        return text
     
     def get_tooltip_text(self) -> str:
         """Generate tooltip text based on current status"""
+        if self.fleet:
+            return self.get_fleet_tooltip_text()
         if self.monitor:
             status = self.monitor.get_status()
             connected_text = "Connected" if status['connected'] else "Disconnected"
+            if status.get('state') is None:
+                connected_text = "Checking..."
+            elif status.get('network_down'):
+                connected_text = "Network down"
+            elif status.get('state') == STATE_FLAPPING:
+                connected_text = "Flapping (unstable connection)"
+            elif status.get('state') == STATE_DEGRADED:
+                connected_text = f"Degraded ({describe_degradation(status.get('anomaly'))})"
+            elif not status['connected'] and status.get('reason') in REASON_TEXT:
+                connected_text += f" ({REASON_TEXT[status['reason']].split(' - ')[0]})"
             target = status['target']
             
             if status['last_check']:
@@ -194,22 +303,134 @@ class TrayApplication:
                 return f"Cash Register: {connected_text}\nTarget: {target}"
         return "Cash Register Monitor"
     
+    def on_network_change(self, event: dict):
+        """Callback when the shared reachability check sees the LAN go down/up"""
+        self.on_connection_change(self.monitor.is_connected if self.monitor else False,
+                                  event["timestamp"])
+    
+    def on_fleet_events(self, events: list):
+        """Apply a batch of state changes to the fleet summary and redraw once"""
+        fleet = self.fleet
+        if fleet is None:
+            return
+        changed = False
+        for event in events:
+            changed = fleet.process(event) or changed
+        if changed and self.icon:
+            self.icon.icon = self.get_fleet_icon()
+            self.icon.title = self.get_fleet_tooltip_text()
+    
+    def get_down_menu_items(self):
+        """Menu entries for the down registers, built only when the menu opens"""
+        if not self.fleet:
+            return []
+        items = [
+            pystray.MenuItem(f"{name} (since {since.strftime('%H:%M:%S')})", None, enabled=False)
+            for _, name, since in self.fleet.get_down(limit=30)
+        ]
+        if self.fleet.down > len(items):
+            items.append(pystray.MenuItem(f"… and {self.fleet.down - len(items)} more", None, enabled=False))
+        return items
+    
     def on_connection_change(self, connected: bool, timestamp: datetime):
         """Callback when connection status changes"""
-        if self.icon:
-            color = 'green' if connected else 'red'
-            self.icon.icon = self.create_icon_image(color)
+        if self.fleet:
+            return
+        if self.icon and self.monitor:
+            self.icon.icon = self.get_state_icon(self.monitor.get_status())
             self.icon.title = self.get_tooltip_text()
     
-    def restart_monitor(self):
-        """Restart monitor with current settings"""
-        if self.monitor:
-            self.monitor.stop_monitoring()
+    def on_alert(self, event: dict):
+        """Show a notification for a (correlated) outage or recovery"""
+        if not self.icon or event.get("initial"):
+            return
+        if not self.settings_manager.get_setting("notifications", False):
+            return
         
-        conn_settings = self.settings_manager.get_connection_settings()
-        self.monitor = ConnectionMonitor(**conn_settings)
+        if event["type"] == "group":
+            state = "recovered" if event["connected"] else "DOWN"
+            message = f"{event['level'].title()} {event['target']} {state} ({event['down']}/{event['members']} registers down)"
+        elif event["type"] == "network":
+            message = "Network is back" if event["network_up"] else "Network DOWN - gateway not reachable"
+        elif event.get("state") == STATE_FLAPPING:
+            message = f"Cash register {event['target']} connection is unstable"
+        elif event.get("state") == STATE_DEGRADED:
+            message = f"Cash register {event['target']} is responding slowly - it may be about to fail"
+        else:
+            message = f"Cash register {event['target']} {'connected' if event['connected'] else 'DISCONNECTED'}"
+        
+        try:
+            self.icon.notify(message, "Cash Register Monitor")
+        except Exception:
+            pass
+    
+    def setup_alert_pipeline(self):
+        """Route monitor events to notifications, through the correlator if a topology is set"""
+        if self.alert_subscriber:
+            self.dispatcher.unsubscribe(self.alert_subscriber)
+        if self.correlator:
+            self.correlator.stop()
+        
+        topology = self.settings_manager.get_topology()
+        if topology:
+            self.correlator = AlertCorrelator(
+                topology, self.on_alert,
+                hold_time=float(self.settings_manager.get_setting("alert_hold_time", 2.0))
+            )
+            consumer = self.correlator
+        else:
+            self.correlator = None
+            consumer = self.on_alert
+        
+        self.alert_subscriber = self.dispatcher.subscribe(
+            consumer,
+            name="tray-alerts",
+            accept=lambda event: event["type"] in ("connection", "network")
+        )
+    
+    def restart_monitor(self):
+        """Restart monitors with current settings"""
+        self.stop_monitors()
+        self.core.create_history()
+        self.create_monitor()
+        self.start_monitors()
+    
+    def start_monitors(self):
+        """Start probing every target"""
+        self.core.start_monitors()
+    
+    def stop_monitors(self):
+        self.core.stop_monitors()
+    
+    def create_monitor(self):
+        """Build the monitors from current settings without probing yet"""
+        self.setup_alert_pipeline()
+        self.core.create_monitors()
         self.monitor.set_connection_callback(self.on_connection_change)
-        self.monitor.start_monitoring()
+        self.setup_fleet_summary()
+    
+    def setup_fleet_summary(self):
+        """With more than one target the icon shows an aggregate instead of one register"""
+        if self.fleet_subscriber:
+            self.dispatcher.unsubscribe(self.fleet_subscriber)
+            self.fleet_subscriber = None
+        if len(self.monitors) < 2:
+            self.fleet = None
+            return
+        
+        self.fleet = FleetSummary(self.monitors, names={
+            target["target"]: target["name"] for target in self.settings_manager.get_targets()
+        })
+        for monitor in self.monitors.values():
+            # Restored snapshots seed the counts so the first icon is meaningful
+            self.fleet.update(monitor.target, monitor.state, monitor.last_check_time)
+        self.fleet_subscriber = self.dispatcher.subscribe(
+            self.on_fleet_events,
+            name="tray-fleet",
+            drop_policy=COALESCE,
+            batch_size=256,
+            accept=lambda event: event["type"] in ("connection", "network")
+        )
     
     def show_settings(self, icon=None, item=None):
         """Show settings window"""
@@ -231,17 +452,41 @@ class TrayApplication:
     
     def on_settings_saved(self):
         """Callback when settings are saved"""
+        set_log_level(self.settings_manager.get_setting("log_level", "INFO"))
         self.restart_monitor()
     
+    def reload_settings(self) -> dict:
+        """Re-read the config file and apply it (control API "reload")"""
+        errors = self.settings_manager.reload_settings()
+        self.on_settings_saved()
+        return errors
+    
     def show_status(self, icon=None, item=None):
         """Show current status in message box"""
         def show_in_main_thread():
             root = tk.Tk()
             root.withdraw()
             
-            if self.monitor:
+            if self.fleet:
+                message = f"Status: {self.fleet.get_text()}"
+                down = self.fleet.get_down(limit=20)
+                if down:
+                    message += "\n\nDown:"
+                    for _, name, since in down:
+                        message += f"\n❌ {name} (since {since.strftime('%H:%M:%S')})"
+                    if self.fleet.down > len(down):
+                        message += f"\n… and {self.fleet.down - len(down)} more"
+            elif self.monitor:
                 status = self.monitor.get_status()
                 connected_text = "✅ Connected" if status['connected'] else "❌ Disconnected"
+                if status.get('network_down'):
+                    connected_text = "🌐 Network down (reference target not reachable)"
+                elif status.get('state') == STATE_FLAPPING:
+                    connected_text = f"⚠️ Flapping ({status['flap_percent']:.0f}% state change)"
+                elif status.get('state') == STATE_DEGRADED:
+                    connected_text = f"⚠️ Degraded ({describe_degradation(status.get('anomaly'))})"
+                elif not status['connected'] and status.get('reason') in REASON_TEXT:
+                    connected_text += f" ({REASON_TEXT[status['reason']]})"
                 target = status['target']
                 
                 if status['last_check']:
@@ -249,6 +494,12 @@ class TrayApplication:
                     message = f"Status: {connected_text}\nTarget: {target}\nLast check: {time_str}"
                 else:
                     message = f"Status: {connected_text}\nTarget: {target}"
+                
+                last_transition = status['detection']['last']
+                if last_transition and last_transition['notify_latency'] is not None:
+                    message += f"\nDetection latency: {last_transition['notify_latency']:.1f}s"
+                    if status['detection']['slo']:
+                        message += f" (SLO {status['detection']['slo']}s)"
             else:
                 message = "Monitor not initialized"
             
@@ -259,8 +510,9 @@ class TrayApplication:
     
     def quit_application(self, icon=None, item=None):
         """Quit the application"""
-        if self.monitor:
-            self.monitor.stop_monitoring()
+        self.core.stop()
+        if self.correlator:
+            self.correlator.stop()
         if self.icon:
             self.icon.stop()
     
@@ -268,29 +520,42 @@ class TrayApplication:
         """Create system tray context menu"""
         return pystray.Menu(
             pystray.MenuItem("Status", self.show_status),
+            pystray.MenuItem(
+                lambda item: f"Down ({self.fleet.down})" if self.fleet else "Down",
+                pystray.Menu(self.get_down_menu_items),
+                visible=lambda item: bool(self.fleet and self.fleet.down)
+            ),
             pystray.MenuItem("Settings", self.show_settings),
             pystray.Menu.SEPARATOR,
             pystray.MenuItem("Quit", self.quit_application)
         )
     
+    def on_icon_ready(self, icon):
+        """Second startup stage, run by pystray once the icon is visible"""
+        icon.visible = True
+        self.startup_timer.mark("icon_visible")
+        
+        self.start_monitors()
+        self.startup_timer.mark("first_probe")
+        self.startup_timer.log()
+        
+        self.core.snapshot_writer.start()
+        self.core.start_services(reload=self.reload_settings)
+    
     def run(self):
         """Start the system tray application"""
-        # Initial icon (gray until first check)
-        icon_image = self.create_icon_image('gray')
+        # Last-known state if a snapshot was restored, otherwise gray until the first check
+        if self.fleet:
+            icon_image = self.get_fleet_icon()
+        else:
+            icon_image = self.get_state_icon(self.monitor.get_status() if self.monitor else {"state": None})
         
         self.icon = pystray.Icon(
             "cash_register_monitor",
             icon_image,
-            "Cash Register Monitor",
+            self.get_tooltip_text(),
             menu=self.create_menu()
         )
         
-        # Update icon after first connection check
-        if self.monitor:
-            initial_status = self.monitor.get_status()
-            color = 'green' if initial_status['connected'] else 'red'
-            self.icon.icon = self.create_icon_image(color)
-            self.icon.title = self.get_tooltip_text()
-        
-        # Run the tray icon
-        self.icon.run()
\ No newline at end of file
+        # Run the tray icon; probing starts from on_icon_ready
+        self.icon.run(setup=self.on_icon_ready)
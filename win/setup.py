@@ -31,7 +31,7 @@ setup(
     url="https://github.com/dimitarklaturov/datecs-cash-register-monitor",
     packages=find_packages(),
     package_data={
-        'cash_register_monitor': ['icons/*.ico', 'icons/*.png'],
+        'cash_register_monitor': ['icons/*.ico', 'icons/*.png', 'icons/*.pack'],
     },
     include_package_data=True,
     install_requires=read_requirements(),
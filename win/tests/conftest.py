@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the package as cash_register_monitor, like main.py run with -m
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
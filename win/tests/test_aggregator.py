@@ -0,0 +1,125 @@
+import json
+import socket
+import time
+import zlib
+
+import pytest
+
+from cash_register_monitor.aggregator import AggregatorServer, FleetTable, decode_report
+
+
+def entry(target, state="connected", **fields):
+    return dict(target=target, state=state, connected=state == "connected", **fields)
+
+
+def report(registers, source="store-1", seq=1, session="s1", full=False, **fields):
+    return dict(source=source, session=session, seq=seq, full=full, interval=10,
+                registers=registers, **fields)
+
+
+def store_counts(table):
+    return {row["store"]: (row["total"], row["down"]) for row in table.stores(now=0)}
+
+
+def test_store_counts_follow_state_changes():
+    table = FleetTable()
+    table.apply(report([entry("a"), entry("b"), entry("c", "disconnected", since=5.0)], full=True), now=0)
+    table.apply(report([entry("x", store="store-2")], source="hub", full=True), now=0)
+    assert store_counts(table) == {"store-1": (3, 1), "store-2": (1, 0)}
+
+    table.apply(report([entry("a", "disconnected", since=8.0), entry("c")], seq=2), now=0)
+    assert store_counts(table) == {"store-1": (3, 1), "store-2": (1, 0)}
+    assert table.summary(now=0)["states"] == {"connected": 3, "disconnected": 1}
+
+    # A register moving to another store leaves the old one's index
+    table.apply(report([entry("x", store="store-3")], source="hub", seq=2), now=0)
+    assert store_counts(table) == {"store-1": (3, 1), "store-3": (1, 0)}
+    assert [r["target"] for r in table.query(store="store-2", now=0)] == []
+
+
+def test_down_for_lists_longest_outage_first():
+    table = FleetTable()
+    table.apply(report([entry("a", "disconnected", since=900.0),
+                        entry("b", "disconnected", since=100.0),
+                        entry("c", "disconnected", since=990.0),
+                        entry("d")], full=True), now=1000)
+    assert [r["target"] for r in table.query(down_for=50, now=1000)] == ["b", "a"]
+    assert [r["target"] for r in table.query(down_for=50, limit=1, now=1000)] == ["b"]
+    assert [r["target"] for r in table.query(state="connected", now=1000)] == ["d"]
+
+
+def test_full_report_removes_registers_it_no_longer_lists():
+    table = FleetTable()
+    table.apply(report([entry("a"), entry("b", "disconnected")], full=True), now=0)
+    table.apply(report([entry("a")], seq=2, full=True), now=0)
+    assert [r["target"] for r in table.query(now=0)] == ["a"]
+    assert table.summary(now=0)["down"] == 0
+    assert store_counts(table) == {"store-1": (1, 0)}
+
+
+def test_delta_reports_resync_on_gaps_and_restarts():
+    table = FleetTable()
+    # First contact: the aggregator has no baseline yet
+    assert table.apply(report([entry("a")], seq=1)) is True
+    assert table.apply(report([entry("a")], seq=2, full=True)) is False
+    assert table.apply(report([], seq=3)) is False
+    # A lost datagram
+    assert table.apply(report([], seq=5)) is True
+    # Duplicates and reordered datagrams are ignored
+    assert table.apply(report([entry("a", "disconnected")], seq=4)) is False
+    assert table.query(state="disconnected") == []
+    # The reporter restarted: its sequence starts over in a new session
+    assert table.apply(report([], seq=1, session="s2")) is True
+
+
+def test_replayed_transitions_are_logged_once():
+    table = FleetTable()
+    transitions = [{"target": "a", "state": "disconnected", "connected": False, "timestamp": 10.0},
+                   {"target": "a", "state": "connected", "connected": True, "timestamp": 20.0},
+                   {"target": "b", "state": "disconnected", "connected": False, "timestamp": 15.0}]
+    assert table.add_transitions("store-1", transitions) == 3
+    assert table.add_transitions("store-1", transitions) == 0
+    assert table.add_transitions("store-1", [{"target": "a", "timestamp": 30.0}, "junk", {}]) == 1
+
+    logged = table.query_transitions(target="a")
+    assert [t["timestamp"] for t in logged] == [10.0, 20.0, 30.0]
+    assert [t["target"] for t in table.query_transitions(since=15.0, limit=2)] == ["a", "a"]
+
+
+@pytest.mark.parametrize("bad", [[], {}, ["x"], {"a": 1}])
+def test_malformed_fields_do_not_poison_the_table(bad):
+    table = FleetTable()
+    table.apply(report([entry("a")], full=True), now=0)
+    table.apply(report([dict(entry("a"), state=bad, reason=bad, name=bad, group=bad, store=bad)],
+                       seq=2), now=0)
+    table.apply(report([entry("a", "disconnected", since=1.0)], seq=3), now=0)
+    [register] = table.query(now=0)
+    assert register["state"] == "disconnected"
+    assert register["store"] == "store-1"
+    assert store_counts(table) == {"store-1": (1, 1)}
+
+
+def test_decode_report_rejects_bad_input():
+    assert decode_report(zlib.compress(b'{"source": "s"}'))["source"] == "s"
+    for data in (b"not zlib", zlib.compress(b"[1, 2]"), zlib.compress(b'{"registers": []}')):
+        with pytest.raises(ValueError):
+            decode_report(data)
+
+
+def test_udp_listener_survives_a_malformed_datagram():
+    server = AggregatorServer(host="127.0.0.1", port=0)
+    if not server.start():
+        pytest.skip("cannot bind a local port")
+    try:
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for state in ([], "connected"):
+            message = report([entry("a", state)], full=True)
+            sender.sendto(zlib.compress(json.dumps(message).encode()), ("127.0.0.1", server.port))
+            time.sleep(0.2)
+        sender.close()
+        deadline = time.time() + 2
+        while not server.table.query(state="connected") and time.time() < deadline:
+            time.sleep(0.05)
+        assert [r["target"] for r in server.table.query(state="connected")] == ["a"]
+    finally:
+        server.stop()
@@ -0,0 +1,101 @@
+from cash_register_monitor.alert_correlator import AlertCorrelator
+
+
+TOPOLOGY = {
+    "shop": {
+        "sw1": ["10.0.0.1:4999", "10.0.0.2:4999"],
+        "sw2": ["10.0.1.1:4999", "10.0.1.2:4999"],
+    },
+}
+
+
+def connection(target, connected, initial=False):
+    return {"type": "connection", "target": target, "connected": connected,
+            "state": "connected" if connected else "disconnected", "initial": initial}
+
+
+def make_correlator():
+    out = []
+    correlator = AlertCorrelator(TOPOLOGY, out.append, hold_time=2.0)
+    return correlator, out
+
+
+def summary(events):
+    return [(e["type"], e["target"], e["connected"]) for e in events]
+
+
+def test_single_register_down_is_released_after_hold():
+    correlator, out = make_correlator()
+    correlator.process(connection("10.0.0.1:4999", False))
+    assert out == []
+    correlator.flush(now=float("inf"))
+    correlator.stop()
+    assert summary(out) == [("connection", "10.0.0.1:4999", False)]
+
+
+def test_switch_outage_collapses_into_group_event():
+    correlator, out = make_correlator()
+    correlator.process(connection("10.0.0.1:4999", False))
+    correlator.process(connection("10.0.0.2:4999", False))
+    correlator.flush(now=float("inf"))
+    correlator.stop()
+    assert summary(out) == [("group", "shop/sw1", False)]
+    assert out[0]["level"] == "switch"
+    assert (out[0]["members"], out[0]["down"]) == (2, 2)
+    assert out[0]["initial"] is False
+
+
+def test_store_outage_reports_only_the_store():
+    correlator, out = make_correlator()
+    for target in ("10.0.0.1:4999", "10.0.0.2:4999", "10.0.1.1:4999", "10.0.1.2:4999"):
+        correlator.process(connection(target, False))
+    correlator.flush(now=float("inf"))
+    correlator.stop()
+    assert summary(out) == [("group", "shop", False)]
+
+
+def test_recovery_within_hold_window_is_dropped():
+    correlator, out = make_correlator()
+    correlator.process(connection("10.0.0.1:4999", False))
+    correlator.process(connection("10.0.0.1:4999", True))
+    correlator.flush(now=float("inf"))
+    correlator.stop()
+    assert out == []
+
+
+def test_partial_group_recovery_re_reports_the_rest():
+    correlator, out = make_correlator()
+    correlator.process(connection("10.0.0.1:4999", False))
+    correlator.process(connection("10.0.0.2:4999", False))
+    correlator.flush(now=float("inf"))
+    del out[:]
+
+    correlator.process(connection("10.0.0.1:4999", True))
+    correlator.stop()
+    assert summary(out) == [
+        ("group", "shop/sw1", True),
+        ("connection", "10.0.0.2:4999", False),
+    ]
+
+    # The register's own recovery follows its individual down event
+    correlator.process(connection("10.0.0.2:4999", True))
+    assert summary(out[2:]) == [("connection", "10.0.0.2:4999", True)]
+
+
+def test_group_from_start_up_events_is_initial():
+    correlator, out = make_correlator()
+    correlator.process(connection("10.0.0.1:4999", False, initial=True))
+    correlator.process(connection("10.0.0.2:4999", False, initial=True))
+    correlator.flush(now=float("inf"))
+    correlator.stop()
+    assert summary(out) == [("group", "shop/sw1", False)]
+    assert out[0]["initial"] is True
+
+
+def test_other_events_pass_through():
+    correlator, out = make_correlator()
+    network = {"type": "network", "target": "network", "network_up": False}
+    unknown = connection("10.9.9.9:4999", False)
+    correlator([network, unknown])
+    correlator.stop()
+    assert out == [network, unknown]
@@ -0,0 +1,65 @@
+import random
+
+from cash_register_monitor.anomaly_detector import LatencyAnomalyDetector
+
+
+def steady(detector, probes=300, rtt=0.004, seed=1):
+    rng = random.Random(seed)
+    return [detector.update(rtt * rng.uniform(0.9, 1.1)) for _ in range(probes)]
+
+
+def test_steady_baseline_stays_clear():
+    detector = LatencyAnomalyDetector()
+    assert not any(steady(detector))
+    assert abs(detector.get_state()["baseline_rtt"] - 0.004) < 0.0005
+    assert detector.get_state()["loss"] == 0
+
+
+def test_isolated_spike_does_not_trip():
+    detector = LatencyAnomalyDetector()
+    steady(detector)
+    # One SYN retransmit: a single connect of about a second
+    assert [detector.update(1.0)] + steady(detector, probes=10) == [False] * 11
+
+
+def test_scattered_spikes_rarely_trip():
+    detector = LatencyAnomalyDetector()
+    rng = random.Random(7)
+    flips = sum(detector.update(1.0 if rng.random() < 0.02 else 0.004 * rng.uniform(0.9, 1.1))
+                for _ in range(20000))
+    assert flips < 50
+
+
+def test_sustained_ramp_trips_then_clears():
+    detector = LatencyAnomalyDetector()
+    steady(detector)
+    ramp = [detector.update(0.004 * (1 + 0.1 * i)) for i in range(40)]
+    assert not ramp[0] and ramp[-1]
+    assert detector.get_state()["z"] >= detector.z_threshold
+    # Back to normal: it clears within a few probes
+    assert not steady(detector, probes=30)[-1]
+
+
+def test_unanswered_probes_alone_trip():
+    detector = LatencyAnomalyDetector()
+    steady(detector)
+    results = [detector.update(None if i % 3 == 0 else 0.004) for i in range(30)]
+    assert results[-1]
+    assert detector.get_state()["loss"] >= detector.LOSS_LOW
+
+
+def test_untrusted_baseline_only_reacts_to_loss():
+    detector = LatencyAnomalyDetector()
+    assert not any(detector.update(rtt) for rtt in (0.004, 0.5, 0.8, 1.0, 1.2))
+
+
+def test_baseline_survives_a_restore():
+    detector = LatencyAnomalyDetector()
+    steady(detector)
+    restored = LatencyAnomalyDetector()
+    restored.load_baseline(detector.get_baseline())
+    assert restored.get_state() == detector.get_state()
+    assert not restored.update(1.0)
+
+    restored.load_baseline({"mean": None})
+    assert restored.get_baseline()["samples"] == 0
@@ -0,0 +1,119 @@
+import json
+
+import pytest
+
+from cash_register_monitor.config_schema import GLOBAL_RULES, SCHEMA_VERSION, ConfigValidator, migrate
+from cash_register_monitor.settings_manager import SettingsManager
+
+
+V1_CONFIG = {"ip_address": "192.168.1.160", "port": 5000, "check_interval": 7}
+
+
+def make_settings(targets, **overrides):
+    settings = {"version": SCHEMA_VERSION, "port": 4999, "check_interval": 5, "probe": "tcp",
+                "targets": targets}
+    settings.update(overrides)
+    return settings
+
+
+def test_v1_config_is_migrated():
+    migrated, changed = migrate(dict(V1_CONFIG))
+    assert changed
+    assert migrated == {"version": SCHEMA_VERSION, "port": 5000, "check_interval": 7,
+                        "targets": [{"ip": "192.168.1.160"}]}
+    # Port and interval stay global and become the target's defaults
+    validator = ConfigValidator()
+    assert validator.validate(migrated) == {}
+    [target] = validator.targets
+    assert (target["target"], target["interval"]) == ("192.168.1.160:5000", 7.0)
+
+
+def test_current_config_is_left_alone():
+    settings = make_settings([{"ip": "10.0.0.1"}])
+    assert migrate(settings) == (settings, False)
+
+
+@pytest.mark.parametrize("config", [[], "x", {"version": 0}, {"version": "2"}, {"version": True}])
+def test_unusable_config_is_rejected(config):
+    with pytest.raises(ValueError):
+        migrate(config)
+
+
+def test_v1_file_is_migrated_with_a_backup(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(V1_CONFIG))
+    manager = SettingsManager(config_dir=str(tmp_path))
+    assert manager.get_primary_target()["target"] == "192.168.1.160:5000"
+    assert json.loads((tmp_path / "config.json.bak").read_text()) == V1_CONFIG
+    saved = json.loads(path.read_text())
+    assert saved["version"] == SCHEMA_VERSION
+    assert "ip_address" not in saved
+
+
+def test_per_target_errors_name_the_entry():
+    errors = ConfigValidator().validate(make_settings([
+        {"ip": "10.0.0.1"},
+        {"ip": "10.0.0.999"},
+        {"ip": "10.0.0.3", "port": 70000, "colour": "red"},
+        "10.0.0.4",
+    ]))
+    assert errors == {
+        "targets[1].ip": "Invalid IPv4 address",
+        "targets[2].port": "Port must be between 1 and 65535",
+        "targets[2].colour": "Unknown target setting",
+        "targets[3].ip": "Target must be an object",
+    }
+
+
+def test_targets_inherit_and_override_defaults():
+    validator = ConfigValidator()
+    assert validator.validate(make_settings([
+        {"ip": "10.0.0.1"},
+        {"ip": "10.0.0.2", "port": 5000, "interval": 2, "name": "Till 2", "group": "Store 1/a"},
+    ])) == {}
+    first, second = validator.targets
+    assert (first["target"], first["interval"], first["name"]) == ("10.0.0.1:4999", 5.0, "10.0.0.1:4999")
+    assert (second["target"], second["interval"], second["name"]) == ("10.0.0.2:5000", 2.0, "Till 2")
+    assert second["group"] == "Store 1/a"
+
+
+def test_duplicate_targets_are_reported_and_skipped():
+    validator = ConfigValidator()
+    errors = validator.validate(make_settings([
+        {"ip": "10.0.0.1"}, {"ip": "10.0.0.1", "port": 4999}, {"ip": "10.0.0.1", "port": 5000},
+    ]))
+    assert errors == {"targets[1].ip": "Duplicate target 10.0.0.1:4999"}
+    assert [t["target"] for t in validator.targets] == ["10.0.0.1:4999", "10.0.0.1:5000"]
+
+
+def test_global_errors():
+    errors = ConfigValidator().validate(make_settings(
+        "10.0.0.1", check_interval=0, fail_threshold=4, fail_window=3, log_level="LOUD"))
+    assert set(errors) == {"targets", "check_interval", "fail_threshold", "log_level"}
+
+
+def test_revalidation_only_checks_what_changed():
+    validator = ConfigValidator()
+    targets = [{"ip": f"10.0.0.{i}"} for i in range(1, 51)]
+    settings = make_settings(targets)
+    validator.validate(settings)
+    assert validator.checked == len(GLOBAL_RULES) + 50
+
+    assert validator.validate(json.loads(json.dumps(settings))) == {}
+    assert validator.checked == 0
+
+    settings["targets"][7]["port"] = 5000
+    settings["log_level"] = "DEBUG"
+    validator.validate(settings)
+    assert validator.checked == 2
+
+    # A changed default affects every target that inherits it
+    settings["check_interval"] = 10
+    validator.validate(settings)
+    assert validator.checked == 1 + 50
+    assert validator.targets[0]["interval"] == 10.0
+
+    del settings["targets"][0]
+    validator.validate(settings)
+    assert validator.checked == 0
+    assert len(validator.targets) == 49
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from cash_register_monitor import connection_monitor
+from cash_register_monitor.connection_monitor import ConnectionMonitor
+
+
+class RecordingDispatcher:
+    def __init__(self):
+        self.events = []
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish(self, event):
+        self.events.append(event)
+
+
+class RecordingHistory:
+    def __init__(self):
+        self.records = []
+
+    def record(self, *record):
+        self.records.append(record)
+
+
+class GatedProbe:
+    """Answers at once until blocked, then holds the probe until released"""
+
+    def __init__(self, monkeypatch, block_from: int):
+        self.calls = 0
+        self.block_from = block_from
+        self.waiting = threading.Event()
+        self.release = threading.Event()
+        monkeypatch.setattr(connection_monitor, "tcp_probe", self)
+
+    def __call__(self, ip, port, timeout, *args):
+        self.calls += 1
+        if self.calls >= self.block_from:
+            self.waiting.set()
+            self.release.wait(5)
+        return {"ok": True, "errno": 0, "reason": "ok", "rtt": 0.001}
+
+
+def make_monitor():
+    monitor = ConnectionMonitor("10.0.0.1", 4999, interval=0.05, dispatcher=RecordingDispatcher(),
+                                history=RecordingHistory())
+    monitor.publish_samples = True
+    return monitor
+
+
+def stop_while_probing(monitor, probe):
+    assert probe.waiting.wait(5)
+    events, records = len(monitor.dispatcher.events), len(monitor.history.records)
+    stopper = threading.Thread(target=monitor.stop_monitoring)
+    stopper.start()
+    time.sleep(0.05)
+    probe.release.set()
+    stopper.join(5)
+    return events, records
+
+
+def test_probe_finishing_after_stop_is_discarded(monkeypatch):
+    probe = GatedProbe(monkeypatch, block_from=2)
+    monitor = make_monitor()
+    monitor.start_monitoring()
+    events, records = stop_while_probing(monitor, probe)
+
+    assert not monitor.monitor_thread.is_alive()
+    time.sleep(0.1)
+    assert len(monitor.dispatcher.events) == events
+    assert len(monitor.history.records) == records
+
+
+def test_stop_during_the_initial_probe_does_not_start_the_loop(monkeypatch):
+    probe = GatedProbe(monkeypatch, block_from=1)
+    monitor = make_monitor()
+    starter = threading.Thread(target=monitor.start_monitoring)
+    starter.start()
+    stop_while_probing(monitor, probe)
+    starter.join(5)
+
+    assert monitor.monitor_thread is None
+    assert monitor.dispatcher.events == []
+    assert monitor.history.records == []
+    assert probe.calls == 1
+
+
+def test_monitor_can_be_started_again_after_stop(monkeypatch):
+    probe = GatedProbe(monkeypatch, block_from=10 ** 6)
+    monitor = make_monitor()
+    monitor.start_monitoring()
+    monitor.stop_monitoring()
+    calls = probe.calls
+    monitor.start_monitoring()
+    time.sleep(0.2)
+    monitor.stop_monitoring()
+    assert probe.calls > calls + 1
+    assert not monitor.monitor_thread.is_alive()
@@ -0,0 +1,101 @@
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from cash_register_monitor.control_api import ControlClient, ControlServer, connect
+from cash_register_monitor.event_dispatcher import EventDispatcher
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="uses a Unix domain socket")
+
+
+class StubSettings:
+    def __init__(self, config_dir):
+        self.config_dir = config_dir
+
+    def get_config_path(self):
+        return str(self.config_dir / "config.json")
+
+
+class StubMonitor:
+    target = "127.0.0.1:4999"
+    timeout = 0.5
+
+
+class StubCore:
+    def __init__(self, config_dir):
+        self.settings_manager = StubSettings(config_dir)
+        self.monitor = StubMonitor()
+        self.monitors = {self.monitor.target: self.monitor}
+        self.dispatcher = EventDispatcher(workers=1)
+
+    def get_status(self, target=None):
+        status = {"127.0.0.1:4999": {"state": "connected", "connected": True}}
+        return status[target] if target else status
+
+
+@pytest.fixture
+def server(tmp_path):
+    core = StubCore(tmp_path)
+    server = ControlServer(core, reload=lambda: {"port": "bad"})
+    assert server.address == str(tmp_path / "control.sock")
+    assert server.start()
+    yield server
+    server.stop()
+    core.dispatcher.stop()
+
+
+def test_ping_status_and_reload(server):
+    with ControlClient(server.address) as client:
+        assert client.request("ping") == "pong"
+        assert client.request("status") == {"127.0.0.1:4999": {"state": "connected", "connected": True}}
+        assert client.request("status", target="127.0.0.1:4999")["state"] == "connected"
+        with pytest.raises(RuntimeError, match="Unknown target"):
+            client.request("status", target="10.9.9.9:4999")
+        assert client.request("reload") == {"errors": {"port": "bad"}, "targets": ["127.0.0.1:4999"]}
+        with pytest.raises(RuntimeError, match="Unknown command"):
+            client.request("explode")
+
+
+@pytest.mark.parametrize("target", ["no-port", "10.0.0.1:", ":4999", "10.0.0.1:abc"])
+def test_probe_rejects_a_malformed_target(server, target):
+    with ControlClient(server.address) as client:
+        with pytest.raises(RuntimeError, match="ip:port"):
+            client.request("probe", target=target)
+        # The connection stays usable after an error
+        assert client.request("ping") == "pong"
+
+
+def test_second_server_on_the_same_socket_refuses(server):
+    assert not ControlServer(server.core, address=server.address).start()
+
+
+def test_subscribe_receives_a_published_event(server):
+    dispatcher = server.core.dispatcher
+
+    def publish_once_subscribed():
+        deadline = time.time() + 5
+        while not dispatcher.subscribers and time.time() < deadline:
+            time.sleep(0.01)
+        dispatcher.publish({"type": "sample", "target": "127.0.0.1:4999"})  # not streamed
+        dispatcher.publish({"type": "connection", "target": "127.0.0.1:4999", "connected": False,
+                            "state": "disconnected", "monitor": object(),
+                            "timestamp": datetime(2024, 5, 1, 9, 0)})
+
+    threading.Thread(target=publish_once_subscribed, daemon=True).start()
+    with ControlClient(server.address) as client:
+        event = next(client.subscribe())
+    assert event == {"type": "connection", "target": "127.0.0.1:4999", "connected": False,
+                     "state": "disconnected", "timestamp": "2024-05-01T09:00:00"}
+
+    # The subscription ends with the client
+    deadline = time.time() + 5
+    while dispatcher.subscribers and time.time() < deadline:
+        time.sleep(0.05)
+    assert dispatcher.subscribers == []
+
+
+def test_connect_without_a_server(tmp_path):
+    assert connect(str(tmp_path / "control.sock")) is None
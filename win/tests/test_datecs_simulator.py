@@ -0,0 +1,150 @@
+import socket
+import time
+
+import pytest
+
+from cash_register_monitor.datecs_simulator import (
+    CMD_DIAGNOSTIC, CMD_STATUS, FrameError, NAK, SYN, SimulatedRegister, SimulatorFleet,
+    build_request, build_response, compute_bcc, decode_status, parse_frame,
+)
+from cash_register_monitor.reachability import tcp_probe
+
+
+def test_bcc_is_the_body_sum_one_nibble_per_byte():
+    # 0x24 + 0x20 + 0x4A + 0x05 = 0x0093
+    assert compute_bcc(bytes([0x24, 0x20, 0x4A, 0x05])) == b"0093"
+    assert compute_bcc(bytes([0xFF] * 300)) == b"2:=4"  # 0x12AD4 truncated to 16 bits
+
+
+def test_request_frame_layout():
+    assert build_request(0x20, CMD_STATUS) == bytes([0x01, 0x24, 0x20, 0x4A, 0x05]) + b"0093" + bytes([0x03])
+
+
+def test_request_round_trip():
+    frame, consumed = parse_frame(build_request(0x21, CMD_DIAGNOSTIC, b"1"))
+    assert frame == {"seq": 0x21, "cmd": CMD_DIAGNOSTIC, "data": b"1"}
+    assert consumed == len(build_request(0x21, CMD_DIAGNOSTIC, b"1"))
+
+
+def test_response_round_trip_with_status():
+    status = bytes([0x80, 0x80, 0x81, 0x80, 0x80, 0x80])
+    data = build_response(0x22, CMD_STATUS, b"abc", status)
+    frame, consumed = parse_frame(data, response=True)
+    assert frame == {"seq": 0x22, "cmd": CMD_STATUS, "data": b"abc", "status": status}
+    assert consumed == len(data)
+    assert decode_status(frame["status"])["paper_out"]
+
+
+def test_parse_skips_syn_and_garbage_and_waits_for_more():
+    data = bytes([SYN, SYN, NAK]) + b"xx" + build_request(0x20, CMD_STATUS)
+    frame, consumed = parse_frame(data)
+    assert frame["cmd"] == CMD_STATUS
+    assert consumed == len(data)
+
+    partial = build_request(0x20, CMD_STATUS)[:-3]
+    assert parse_frame(partial) == (None, 0)
+    assert parse_frame(b"\x16\x16") == (None, 2)
+
+
+def test_parse_rejects_bad_bcc_and_missing_terminator():
+    frame = bytearray(build_request(0x20, CMD_STATUS))
+    frame[-2] ^= 0x01
+    with pytest.raises(FrameError, match="BCC"):
+        parse_frame(bytes(frame))
+    frame = bytearray(build_request(0x20, CMD_STATUS))
+    frame[-1] = 0x00
+    with pytest.raises(FrameError):
+        parse_frame(bytes(frame))
+
+
+def test_status_bytes_raise_general_error_bits():
+    register = SimulatedRegister()
+    assert register.status_bytes() == bytes([0x80] * 6)
+    register.set_flags(cover_open=True, fiscal_memory_full=True)
+    status = register.status_bytes()
+    assert status[0] == 0x80 | 0x40 | 0x20
+    assert status[4] == 0x80 | 0x10 | 0x20
+    with pytest.raises(KeyError):
+        register.set_flags(no_such_flag=True)
+
+
+def test_unknown_command_answers_invalid_command():
+    response, _ = parse_frame(SimulatedRegister().execute({"seq": 0x20, "cmd": 0x7E, "data": b""}),
+                              response=True)
+    assert decode_status(response["status"])["invalid_command"]
+
+
+def _exchange(address, request: bytes) -> dict:
+    with socket.create_connection(address, timeout=5) as sock:
+        sock.sendall(request)
+        buffer = b""
+        while True:
+            chunk = sock.recv(4096)
+            assert chunk, "connection closed before a response"
+            buffer += chunk
+            frame, _ = parse_frame(buffer, response=True)
+            if frame is not None:
+                return frame
+
+
+def test_fleet_answers_over_tcp_and_counts_requests():
+    fleet = SimulatorFleet()
+    try:
+        addresses = fleet.start(3, seed=1)
+        for address in addresses:
+            frame = _exchange(address, build_request(0x20, CMD_STATUS))
+            assert frame["cmd"] == CMD_STATUS and frame["seq"] == 0x20
+
+        fleet._apply_step(fleet.registers[:1], {"paper_out": True})
+        frame = _exchange(addresses[0], build_request(0x21, CMD_STATUS))
+        assert decode_status(frame["status"])["paper_out"]
+        assert fleet.get_stats()["requests"] == 4
+    finally:
+        fleet.stop()
+
+
+def test_corrupt_request_gets_nak():
+    fleet = SimulatorFleet()
+    try:
+        address = fleet.start(1)[0]
+        frame = bytearray(build_request(0x20, CMD_STATUS))
+        frame[-2] ^= 0x01
+        with socket.create_connection(address, timeout=5) as sock:
+            sock.sendall(bytes(frame))
+            assert sock.recv(1) == bytes([NAK])
+        assert fleet.get_stats()["bad_frames"] == 1
+    finally:
+        fleet.stop()
+
+
+def test_refusing_register_is_seen_as_port_closed():
+    fleet = SimulatorFleet()
+    try:
+        address = fleet.start(1)[0]
+        assert tcp_probe(*address, 1.0)["reason"] == "ok"
+
+        fleet.set_refuse_connections(True)
+        result = tcp_probe(*address, 1.0)
+        assert not result["ok"]
+        assert result["reason"] == "port_closed"
+
+        fleet.set_refuse_connections(False)
+        assert tcp_probe(*address, 1.0)["reason"] == "ok"
+        frame = _exchange(address, build_request(0x20, CMD_STATUS))
+        assert frame["cmd"] == CMD_STATUS
+    finally:
+        fleet.stop()
+
+
+def test_scripted_refusal_closes_the_port():
+    fleet = SimulatorFleet()
+    try:
+        refusing, other = fleet.start(2)
+        fleet.run_script([{"at": 0, "register": 0, "refuse_connections": True}])
+        deadline = time.time() + 5
+        while tcp_probe(*refusing, 1.0)["reason"] != "port_closed" and time.time() < deadline:
+            time.sleep(0.02)
+        assert tcp_probe(*refusing, 1.0)["reason"] == "port_closed"
+        assert tcp_probe(*other, 1.0)["reason"] == "ok"
+    finally:
+        fleet.stop()
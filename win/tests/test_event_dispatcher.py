@@ -0,0 +1,62 @@
+import threading
+import time
+
+from cash_register_monitor.event_dispatcher import COALESCE, DROP_NEWEST, EventDispatcher
+
+
+def _wait(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_no_delivery_after_unsubscribe():
+    dispatcher = EventDispatcher(workers=1)
+    gate = threading.Event()
+    blocker_started = threading.Event()
+    received = []
+
+    def blocker(event):
+        blocker_started.set()
+        gate.wait(2)
+
+    try:
+        # The single worker is busy, so the second subscriber's events wait in the ready queue
+        dispatcher.subscribe(blocker, name="blocker")
+        subscriber = dispatcher.subscribe(received.append, name="late")
+        dispatcher.publish({"type": "connection", "target": "a"})
+        assert blocker_started.wait(2)
+        dispatcher.publish({"type": "connection", "target": "b"})
+        dispatcher.unsubscribe(subscriber)
+        gate.set()
+        time.sleep(0.2)
+        assert [event["target"] for event in received] in ([], ["a"])
+        assert subscriber.pending() == 0
+    finally:
+        gate.set()
+        dispatcher.stop()
+
+
+def test_batches_and_policies():
+    dispatcher = EventDispatcher(workers=1)
+    batches = []
+    try:
+        dispatcher.subscribe(batches.append, batch_size=10, drop_policy=COALESCE)
+        for state in ("connected", "disconnected", "connected"):
+            with dispatcher._lock:  # publish the burst before the worker wakes up
+                dispatcher.subscribers[0].offer({"target": "a", "state": state})
+                dispatcher.subscribers[0].offer({"target": "b", "state": state})
+        dispatcher.publish({"target": "c", "state": "connected"})
+        assert _wait(lambda: sum(len(batch) for batch in batches) == 3)
+        assert {event["target"]: event["state"] for batch in batches for event in batch}["a"] == "connected"
+    finally:
+        dispatcher.stop()
+
+    dispatcher = EventDispatcher(workers=1)
+    subscriber = dispatcher.subscribe(lambda event: None, max_queue=2, drop_policy=DROP_NEWEST)
+    dispatcher.stop()
+    for target in "abc":
+        dispatcher.publish({"target": target})
+    assert [event["target"] for event in subscriber._queue] == ["a", "b"]
+    assert subscriber.dropped == 1
@@ -0,0 +1,83 @@
+from cash_register_monitor.event_stream import EventStream, StreamClient, parse_event_id
+
+
+class StubCore:
+    dispatcher = None
+
+    def get_status(self):
+        return {"10.0.0.1:4999": {"state": "connected"}}
+
+
+def state(target, value):
+    return {"type": "connection", "target": target, "state": value}
+
+
+def sample(target, rtt):
+    return {"type": "sample", "target": target, "rtt": rtt}
+
+
+def make_stream(ring_size=100):
+    stream = EventStream(StubCore(), ring_size=ring_size)
+    stream.on_events([state("a", "connected"), state("b", "connected")])  # ids 1, 2
+    return stream
+
+
+def test_event_ids_carry_the_run_epoch():
+    stream = make_stream()
+    assert stream.event_id(2) == f"{stream.epoch}-2"
+    assert parse_event_id(stream.event_id(2)) == (stream.epoch, 2)
+    assert EventStream(StubCore()).epoch != stream.epoch
+    for bad in (None, "", "17", "abc-", "abc-x1"):
+        assert parse_event_id(bad) is None
+
+
+def test_new_client_and_up_to_date_client_get_nothing():
+    stream = make_stream()
+    assert stream.attach(None)[1] == []
+    assert stream.attach(stream.event_id(2))[1] == []
+
+
+def test_delta_is_coalesced_per_target():
+    stream = make_stream()
+    stream.on_events([state("a", "disconnected"), sample("a", 0.01), state("b", "degraded"),
+                      state("a", "connected"), sample("a", 0.02)])  # ids 3..7
+    client, missed = stream.attach(stream.event_id(2))
+    assert [(seq, event["type"], event["target"]) for seq, event in missed] == [
+        (5, "connection", "b"), (6, "connection", "a"), (7, "sample", "a")]
+    assert missed[1][1]["state"] == "connected"
+    assert client in stream.clients
+
+    # Later events reach the attached client
+    stream.on_events([state("c", "connected")])
+    assert [seq for seq, _ in client.take(0)] == [8]
+    stream.detach(client)
+    assert client not in stream.clients
+
+
+def test_too_old_id_gets_a_snapshot():
+    stream = make_stream(ring_size=3)
+    stream.on_events([state("a", "disconnected"), state("a", "connected"), state("b", "degraded")])
+    [(seq, event)] = stream.attach(stream.event_id(1))[1]
+    assert seq == stream.seq == 5
+    assert event["type"] == "snapshot"
+    assert event["targets"] == StubCore().get_status()
+
+
+def test_id_from_another_run_gets_a_snapshot():
+    stream = make_stream()
+    stream.on_events([state("a", "disconnected")] * 5)
+    for last_id in ("0123456789ab-3", "3", "garbage", stream.event_id(99)):
+        [(_, event)] = stream.attach(last_id)[1]
+        assert event["type"] == "snapshot"
+
+
+def test_client_coalesces_per_target_and_drops_the_oldest():
+    client = StreamClient(max_pending=2)
+    client.offer(1, sample("a", 0.01))
+    client.offer(2, sample("b", 0.01))
+    client.offer(3, sample("a", 0.02))  # replaces 1 and moves behind 2
+    assert client.coalesced == 1
+    client.offer(4, state("c", "connected"))  # full: 2 is dropped
+    assert client.dropped == 1
+    assert [seq for seq, _ in client.take(0)] == [3, 4]
+    assert client.take(0) == []
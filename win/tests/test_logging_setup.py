@@ -0,0 +1,55 @@
+import json
+import logging
+
+from cash_register_monitor.logging_setup import JsonLinesFormatter, RateLimitFilter
+
+
+def make_record(msg, *args, level=logging.WARNING, **extra):
+    record = logging.LogRecord("cash_register_monitor.test", level, __file__, 1, msg, args, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_repeats_are_suppressed_and_counted():
+    limit = RateLimitFilter(period=60, burst=1)
+    assert limit.filter(make_record("Register %s down", "10.0.0.1"))
+    assert not limit.filter(make_record("Register %s down", "10.0.0.1"))
+    assert not limit.filter(make_record("Register %s down", "10.0.0.1"))
+
+    limit.period = 0
+    again = make_record("Register %s down", "10.0.0.1")
+    assert limit.filter(again)
+    assert again.suppressed == 2
+
+
+def test_distinct_messages_from_one_call_site_get_through():
+    limit = RateLimitFilter(period=60, burst=1)
+    assert limit.filter(make_record("Network %s", "down"))
+    assert limit.filter(make_record("Network %s", "up"))
+    assert limit.filter(make_record("Invalid setting %s: %s", "port", "out of range"))
+    assert limit.filter(make_record("Invalid setting %s: %s", "interval", "too small"))
+
+
+def test_same_message_for_another_target_gets_through():
+    limit = RateLimitFilter(period=60, burst=1)
+    assert limit.filter(make_record("Connection state changed", target="10.0.0.1:4999"))
+    assert limit.filter(make_record("Connection state changed", target="10.0.0.2:4999"))
+    assert not limit.filter(make_record("Connection state changed", target="10.0.0.1:4999"))
+
+
+def test_burst_allows_several_copies():
+    limit = RateLimitFilter(period=60, burst=3)
+    assert [limit.filter(make_record("Probe failed")) for _ in range(5)] == [True] * 3 + [False] * 2
+
+
+def test_bad_arguments_do_not_break_the_filter():
+    limit = RateLimitFilter()
+    assert limit.filter(make_record("Value %d", "not a number"))
+
+
+def test_json_lines_include_extra_fields():
+    entry = json.loads(JsonLinesFormatter().format(make_record("Register %s down", "a", target="a:1")))
+    assert entry["msg"] == "Register a down"
+    assert entry["level"] == "WARNING"
+    assert entry["target"] == "a:1"
@@ -0,0 +1,163 @@
+import errno
+import socket
+import threading
+import time
+
+import pytest
+
+from cash_register_monitor import connection_monitor, reachability
+from cash_register_monitor.connection_monitor import ConnectionMonitor
+from cash_register_monitor.reachability import (
+    NetworkReachability, classify_errno, parse_reference_target, tcp_probe,
+)
+
+
+@pytest.mark.parametrize("result, reason", [
+    (0, "ok"),
+    (errno.ECONNREFUSED, "port_closed"), (10061, "port_closed"),
+    (errno.ETIMEDOUT, "timeout"), (10060, "timeout"), (10035, "timeout"),
+    (errno.EHOSTUNREACH, "host_unreachable"), (10065, "host_unreachable"),
+    (errno.EHOSTDOWN, "host_unreachable"), (10064, "host_unreachable"),
+    (errno.ENETUNREACH, "network_unreachable"), (10051, "network_unreachable"),
+    (errno.ENETDOWN, "network_unreachable"), (10050, "network_unreachable"),
+    (-1, "error"), (errno.EACCES, "error"),
+])
+def test_errno_classification(result, reason):
+    assert classify_errno(result) == reason
+
+
+def closed_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_probe_of_a_closed_port_is_port_closed():
+    result = tcp_probe("127.0.0.1", closed_port(), 1.0)
+    assert result["ok"] is False
+    assert result["reason"] == "port_closed"
+    assert result["rtt"] < 1.0
+
+
+def test_probe_of_a_listening_port_is_ok():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        calls = []
+        result = tcp_probe("127.0.0.1", server.getsockname()[1], 1.0, calls.append, 0.5)
+    assert result["ok"] and result["reason"] == "ok"
+    assert calls == []
+
+
+def test_slow_probe_calls_on_slow_and_keeps_waiting():
+    # A listener whose backlog is full drops further SYNs, so the connect hangs
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen(0)
+        fillers = []
+        for _ in range(4):
+            filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            filler.setblocking(False)
+            filler.connect_ex(server.getsockname())
+            fillers.append(filler)
+        time.sleep(0.1)
+        calls = []
+        result = tcp_probe("127.0.0.1", server.getsockname()[1], 0.6,
+                           lambda: calls.append(time.monotonic()), 0.2)
+        for filler in fillers:
+            filler.close()
+    if result["reason"] != "timeout":
+        pytest.skip("this network stack does not let a connect hang")
+    assert len(calls) == 1
+    assert result["rtt"] >= 0.6
+
+
+def test_parse_reference_target():
+    assert parse_reference_target("off") is None
+    assert parse_reference_target("") is None
+    assert parse_reference_target("auto") == ("auto", None)
+    assert parse_reference_target("10.0.0.1:8080") == ("10.0.0.1", 8080)
+    assert parse_reference_target("10.0.0.1") == ("10.0.0.1", None)
+
+
+class FakeProbe:
+    """Stands in for tcp_probe with scripted reasons"""
+
+    def __init__(self, monkeypatch, reasons, delay=0.0):
+        self.reasons = list(reasons)
+        self.delay = delay
+        self.calls = []
+        monkeypatch.setattr(reachability, "tcp_probe", self)
+
+    def __call__(self, host, port, timeout, *args):
+        self.calls.append((host, port))
+        time.sleep(self.delay)
+        reason = self.reasons.pop(0) if len(self.reasons) > 1 else self.reasons[0]
+        return {"ok": reason == "ok", "errno": 0, "reason": reason, "rtt": 0.001}
+
+
+def test_unverified_reference_is_not_retried_on_every_failure(monkeypatch):
+    probe = FakeProbe(monkeypatch, ["timeout"])
+    net = NetworkReachability("10.0.0.1")
+    # It never answered, so it cannot prove an outage
+    assert net.check() is True
+    assert not net.verified
+    assert len(probe.calls) == 3  # every gateway port tried once
+    assert net.check(fresh_after=time.monotonic()) is True
+    assert len(probe.calls) == 3
+
+    net.checked_at -= NetworkReachability.UNVERIFIED_RETRY
+    net.check(fresh_after=time.monotonic())
+    assert len(probe.calls) == 6
+
+
+def test_verified_reference_reports_an_outage_once(monkeypatch):
+    probe = FakeProbe(monkeypatch, ["timeout", "port_closed", "timeout"])
+    net = NetworkReachability("10.0.0.1")
+    assert net.check() is True
+    assert net.verified
+    # Only the port that answered is probed from now on
+    assert probe.calls[-1] == ("10.0.0.1", 53)
+
+    assert net.check(fresh_after=time.monotonic()) is False
+    calls = len(probe.calls)
+    # While down, a recent result is reused by every monitor
+    assert net.check(fresh_after=time.monotonic()) is False
+    assert len(probe.calls) == calls
+
+    net.note_answer()
+    assert net.network_up
+
+
+def test_concurrent_checks_share_one_probe(monkeypatch):
+    probe = FakeProbe(monkeypatch, ["ok"], delay=0.2)
+    net = NetworkReachability("10.0.0.1", port=80)
+    started = time.monotonic()
+    threads = [threading.Thread(target=net.check, args=(started,)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(probe.calls) == 1
+
+
+def test_reference_probe_starts_while_the_register_probe_waits(monkeypatch):
+    reference = FakeProbe(monkeypatch, ["ok", "timeout"], delay=0.3)
+    net = NetworkReachability("10.0.0.1", port=80)
+    net.check()  # verified
+
+    def slow_register_probe(ip, port, timeout, on_slow, slow_after):
+        on_slow()
+        time.sleep(0.3)  # the reference probe runs meanwhile
+        return {"ok": False, "errno": errno.ETIMEDOUT, "reason": "timeout", "rtt": 0.3}
+
+    monkeypatch.setattr(connection_monitor, "tcp_probe", slow_register_probe)
+    monitor = ConnectionMonitor("10.0.0.2", 4999, reachability=net)
+    started = time.monotonic()
+    monitor.probe(on_slow=monitor._reference_hook(started))
+    assert monitor._network_is_down(started) is True
+    assert len(reference.calls) == 2
+    # Both probes overlapped instead of running one after the other
+    assert time.monotonic() - started < 0.55
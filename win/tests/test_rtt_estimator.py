@@ -0,0 +1,112 @@
+import pytest
+
+from cash_register_monitor.connection_monitor import ConnectionMonitor, DEFAULT_TIMEOUT
+from cash_register_monitor.rtt_estimator import RttEstimator
+
+
+def test_initial_timeout_before_any_sample():
+    assert RttEstimator(max_timeout=3.0).timeout == 3.0
+    assert RttEstimator(max_timeout=3.0, initial_timeout=1.0).timeout == 1.0
+
+
+def test_rfc6298_smoothing():
+    rtt = RttEstimator()
+    rtt.add_sample(0.1)
+    # First sample: SRTT = R, RTTVAR = R / 2
+    assert rtt.srtt == pytest.approx(0.1)
+    assert rtt.rttvar == pytest.approx(0.05)
+    assert rtt.timeout == pytest.approx(0.1 + 4 * 0.05)
+
+    rtt.add_sample(0.2)
+    # RTTVAR uses the SRTT from before this sample
+    assert rtt.rttvar == pytest.approx(0.75 * 0.05 + 0.25 * 0.1)
+    assert rtt.srtt == pytest.approx(0.875 * 0.1 + 0.125 * 0.2)
+    assert rtt.timeout == pytest.approx(0.1125 + 4 * 0.0625)
+    assert rtt.samples == 2
+
+
+def test_timeout_is_clamped_to_bounds():
+    fast = RttEstimator(min_timeout=0.25, max_timeout=3.0)
+    fast.add_sample(0.001)
+    assert fast.timeout == 0.25
+    slow = RttEstimator(min_timeout=0.25, max_timeout=3.0)
+    slow.add_sample(2.0)
+    assert slow.timeout == 3.0
+
+
+def test_backoff_is_capped_at_the_limit():
+    rtt = RttEstimator()
+    rtt.add_sample(0.1)
+    timeouts = []
+    for _ in range(RttEstimator.BACKOFF_LIMIT + 2):
+        rtt.on_timeout()
+        timeouts.append(rtt.timeout)
+    # Doubles BACKOFF_LIMIT times, then probes a dead target at the RTT timeout again
+    assert timeouts == pytest.approx([0.6, 1.2, 0.3, 0.3])
+
+    rtt.on_timeout()
+    rtt.add_sample(0.1)
+    assert (rtt.backoff, rtt.timeouts) == (1, 0)
+
+
+def test_backoff_stops_at_max_timeout():
+    rtt = RttEstimator(max_timeout=3.0)
+    rtt.add_sample(1.0)
+    rtt.on_timeout()
+    assert rtt.backoff == 1
+    assert rtt.timeout == 3.0
+
+
+def test_state_round_trip_keeps_the_timeout_streak():
+    rtt = RttEstimator()
+    for sample in (0.01, 0.012, 0.011):
+        rtt.add_sample(sample)
+    rtt.on_timeout()
+    rtt.on_timeout()
+
+    restored = RttEstimator()
+    restored.load_state(rtt.get_state())
+    assert restored.get_state() == rtt.get_state()
+    # The streak continues: a third timeout ends the backoff as it would have
+    restored.on_timeout()
+    rtt.on_timeout()
+    assert restored.backoff == rtt.backoff == 1
+
+    restored.reset()
+    assert restored.get_state()["timeouts"] == 0
+    assert restored.srtt is None
+
+
+def test_without_slo_the_configured_values_are_used():
+    monitor = ConnectionMonitor(interval=5)
+    assert monitor.interval == 5
+    assert monitor.rtt.max_timeout == DEFAULT_TIMEOUT
+    assert monitor.timeout == DEFAULT_TIMEOUT
+
+
+@pytest.mark.parametrize("slo, interval, timeout", [(10, 3.5, 3.0), (2, 0.7, 0.6)])
+def test_slo_budget_is_split_between_interval_and_timeout(slo, interval, timeout):
+    monitor = ConnectionMonitor(interval=5, detection_slo=slo, fail_threshold=2)
+    assert monitor.interval == pytest.approx(interval)
+    assert monitor.rtt.max_timeout == pytest.approx(timeout)
+    # Worst case: fail_threshold intervals plus one probe timeout
+    assert 2 * monitor.interval + monitor.rtt.max_timeout <= slo + 1e-9
+
+
+def test_slo_never_goes_below_the_minimums():
+    monitor = ConnectionMonitor(interval=5, detection_slo=0.5)
+    assert monitor.interval == 0.5
+    assert monitor.rtt.max_timeout == 0.2
+
+
+def test_slo_does_not_lengthen_the_configured_interval():
+    monitor = ConnectionMonitor(interval=1, detection_slo=60)
+    assert monitor.interval == 1
+    assert monitor.rtt.max_timeout == DEFAULT_TIMEOUT
+
+
+def test_fixed_timeout_uses_the_whole_budget():
+    monitor = ConnectionMonitor(interval=5, detection_slo=2, adaptive_timeout=False)
+    monitor.rtt.add_sample(0.01)
+    monitor.update_settings(monitor.ip, monitor.port, 5, detection_slo=2)
+    assert monitor.timeout == pytest.approx(0.6)
@@ -0,0 +1,29 @@
+import json
+
+from cash_register_monitor.settings_manager import SettingsManager
+
+
+MAC_DEFAULTS = {"targets": [{"ip": "192.168.1.100"}], "port": 9100, "log_level": "WARNING"}
+
+
+def write_config(tmp_path, config):
+    (tmp_path / "config.json").write_text(json.dumps(config))
+
+
+def test_fresh_install_uses_platform_defaults(tmp_path):
+    manager = SettingsManager(config_dir=str(tmp_path), defaults=MAC_DEFAULTS)
+    primary = manager.get_primary_target()
+    assert (primary["ip"], primary["port"]) == ("192.168.1.100", 9100)
+    assert manager.get_setting("log_level") == "WARNING"
+    assert json.loads((tmp_path / "config.json").read_text())["port"] == 9100
+
+    windows = SettingsManager(config_dir=str(tmp_path / "win"))
+    assert windows.get_primary_target()["target"] == "192.168.1.155:4999"
+
+
+def test_old_mac_config_keeps_its_printer(tmp_path):
+    write_config(tmp_path, {"printer_ip": "10.0.0.5"})
+    manager = SettingsManager(config_dir=str(tmp_path), defaults=MAC_DEFAULTS)
+    assert manager.get_primary_target()["target"] == "10.0.0.5:9100"
+    assert manager.get_setting("version") == 2
+
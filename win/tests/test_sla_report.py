@@ -0,0 +1,96 @@
+import io
+import json
+import math
+import socket
+from datetime import date
+
+import pytest
+
+from cash_register_monitor.probe_history import FLAG_NETWORK_DOWN, FORMAT_VERSION, HEADER, MAGIC, RECORD
+from cash_register_monitor.sla_report import build_report, write_csv, write_json
+
+UP, DOWN = 1, 2  # state codes of connected and disconnected
+T0 = 1714550400.0  # 2024-05-01 08:00 UTC
+
+A = "10.0.0.1:4999"
+B = "10.0.0.2:4999"
+
+
+def record(offset, target, state, flags=0):
+    ip, port = target.split(":")
+    return RECORD.pack(T0 + offset, 0.004 if state == UP else math.nan,
+                       socket.inet_aton(ip), int(port), int(state == UP), state, 0, flags)
+
+
+def write_day(directory, day, records):
+    with open(directory / f"{day}.bin", "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.size))
+        f.write(b"".join(records))
+
+
+@pytest.fixture
+def history(tmp_path):
+    # A: up 20 s, down 20 s, up 20 s, down 10 s, then back up; records 10 s apart
+    a = [(0, UP), (10, UP), (20, DOWN), (30, DOWN), (40, UP), (50, UP), (60, DOWN), (70, UP)]
+    # B: already down when the period starts, back after 20 s
+    b = [(0, DOWN), (10, DOWN), (20, UP), (30, UP)]
+    records = [record(t, A, state) for t, state in a] + [record(t, B, state) for t, state in b]
+    records.sort(key=lambda data: RECORD.unpack(data)[0])
+    write_day(tmp_path, "2024-05-01", records)
+    write_day(tmp_path, "2024-05-02", [
+        # The monitor was off for 930 s: unmonitored, not up
+        record(1000, A, UP),
+        record(1010, A, DOWN, FLAG_NETWORK_DOWN),  # the LAN was down, not the register
+        record(1020, A, UP),
+        record(1030, A, UP),
+    ])
+    return tmp_path
+
+
+def by_target(report):
+    return {row["target"]: row for row in report["registers"]}
+
+
+def test_uptime_and_mttr_per_register(history):
+    registers = by_target(build_report(str(history)))
+    a = registers[A]
+    assert (a["up_s"], a["down_s"], a["unmonitored_s"]) == (60, 30, 940)
+    # The network-down probe still starts an outage, but its time is not counted
+    assert a["outages"] == 3
+    assert a["uptime_pct"] == pytest.approx(100 * 60 / 90, abs=0.001)
+    assert a["mttr_s"] == 10.0
+    assert a["mtbf_s"] == 20.0
+
+    b = registers[B]
+    assert (b["up_s"], b["down_s"], b["outages"]) == (10, 20, 1)
+    assert b["mttr_s"] == 20.0
+
+
+def test_store_totals(history):
+    report = build_report(str(history), stores={A: "Store 1"}, default_store="Other")
+    stores = {row["store"]: row for row in report["stores"]}
+    assert stores["Store 1"]["up_s"] == 60
+    assert stores["Other"]["outages"] == 1
+    assert stores["Other"]["uptime_pct"] == pytest.approx(100 * 10 / 30, abs=0.001)
+
+
+def test_period_selects_day_files(history):
+    registers = by_target(build_report(str(history), start=date(2024, 5, 1), end=date(2024, 5, 1)))
+    assert (registers[A]["up_s"], registers[A]["down_s"], registers[A]["outages"]) == (40, 30, 2)
+    assert registers[A]["mttr_s"] == 15.0
+
+    assert build_report(str(history), start=date(2024, 6, 1))["registers"] == []
+
+
+def test_report_formats(history):
+    report = build_report(str(history), names={A: "Till 1"})
+    out = io.StringIO()
+    write_csv(report, out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith("level,store,target,name,uptime_pct")
+    assert lines[1].startswith(f"register,,{A},Till 1,")
+    assert len(lines) == 1 + 2 + 1
+
+    out = io.StringIO()
+    write_json(report, out)
+    assert json.loads(out.getvalue())["registers"][0]["target"] == A
@@ -0,0 +1,114 @@
+import os
+import zlib
+
+from cash_register_monitor.spool import RECORD_HEADER, SEGMENT_HEADER, Spool
+
+
+def payloads(n, size=20, start=0):
+    return [b"%06d" % i + b"x" * (size - 6) for i in range(start, start + n)]
+
+
+def read_all(spool):
+    records, cursor = spool.read_batch(max_records=100000, max_bytes=1 << 30)
+    return records, cursor
+
+
+def segment_paths(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.endswith(".seg"))
+
+
+def test_records_survive_reopen(tmp_path):
+    spool = Spool(str(tmp_path))
+    for payload in payloads(10):
+        spool.append(payload)
+    spool.close()
+
+    reopened = Spool(str(tmp_path))
+    assert reopened.pending()
+    assert read_all(reopened)[0] == payloads(10)
+
+
+def test_torn_record_is_cut_off_on_open(tmp_path):
+    spool = Spool(str(tmp_path))
+    for payload in payloads(5):
+        spool.append(payload)
+    spool.close()
+
+    # A power cut in the middle of the sixth record
+    path = segment_paths(str(tmp_path))[-1]
+    size = os.path.getsize(path)
+    torn = RECORD_HEADER.pack(20, zlib.crc32(b"y" * 20)) + b"y" * 7
+    with open(path, "ab") as f:
+        f.write(torn)
+
+    reopened = Spool(str(tmp_path))
+    assert os.path.getsize(path) == size
+    assert read_all(reopened)[0] == payloads(5)
+
+    # New records go after the repaired end
+    reopened.append(b"after")
+    assert read_all(reopened)[0] == payloads(5) + [b"after"]
+
+
+def test_corrupt_record_is_skipped_not_replayed(tmp_path):
+    spool = Spool(str(tmp_path))
+    for payload in payloads(3):
+        spool.append(payload)
+    spool.close()
+
+    path = segment_paths(str(tmp_path))[0]
+    with open(path, "r+b") as f:
+        # Flip a payload byte of the second record
+        f.seek(SEGMENT_HEADER.size + (RECORD_HEADER.size + 20) + RECORD_HEADER.size + 3)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    records, _ = read_all(Spool(str(tmp_path)))
+    assert records == [payloads(3)[0], payloads(3)[2]]
+
+
+def test_cap_drops_oldest_segment(tmp_path):
+    spool = Spool(str(tmp_path), max_bytes=16384, segment_bytes=4096)
+    for payload in payloads(2000, size=100):
+        spool.append(payload)
+
+    assert spool.size <= 16384
+    assert spool.dropped_bytes > 0
+    records, _ = read_all(spool)
+    # What is left is the newest, still in order and ending with the last record
+    assert records == payloads(2000, size=100)[-len(records):]
+
+
+def test_ack_and_cursor_replay_after_restart(tmp_path):
+    spool = Spool(str(tmp_path), max_bytes=65536, segment_bytes=4096)
+    for payload in payloads(300, size=50):
+        spool.append(payload)
+
+    records, cursor = spool.read_batch(max_records=120)
+    assert records == payloads(120, size=50)
+    spool.ack(cursor)
+    # Read but not acknowledged: replayed after a restart
+    spool.read_batch(max_records=50)
+    spool.close()
+
+    reopened = Spool(str(tmp_path), max_bytes=65536, segment_bytes=4096)
+    records, cursor = read_all(reopened)
+    assert records == payloads(180, size=50, start=120)
+    reopened.ack(cursor)
+    assert not reopened.pending()
+    # Fully delivered segments are gone; only the one being written remains
+    assert len(segment_paths(str(tmp_path))) == 1
+
+    reopened.append(b"next")
+    assert read_all(reopened)[0] == [b"next"]
+
+
+def test_batch_limits(tmp_path):
+    spool = Spool(str(tmp_path))
+    for payload in payloads(10, size=100):
+        spool.append(payload)
+    records, _ = spool.read_batch(max_records=100, max_bytes=250)
+    # Stops once the byte budget is reached
+    assert records == payloads(3, size=100)
@@ -0,0 +1,92 @@
+import pytest
+
+from cash_register_monitor.state_filter import FlapDetector, HysteresisFilter
+
+
+def feed(detector, results):
+    return [detector.update(ok) for ok in results]
+
+
+def test_first_result_sets_state():
+    assert HysteresisFilter().update(False) is False
+    assert HysteresisFilter().update(True) is True
+
+
+def test_single_failure_does_not_go_down():
+    f = HysteresisFilter(fail_threshold=2, fail_window=3, recover_threshold=2)
+    assert feed(f, [True, False, True, True, False, True]) == [True] * 6
+
+
+def test_n_of_m_failures_go_down():
+    f = HysteresisFilter(fail_threshold=2, fail_window=3, recover_threshold=2)
+    # Two failures within three probes, not necessarily in a row
+    assert feed(f, [True, False, True, False]) == [True, True, True, False]
+
+
+def test_failures_outside_window_do_not_count():
+    f = HysteresisFilter(fail_threshold=2, fail_window=3, recover_threshold=2)
+    assert feed(f, [True, False, True, True, False]) == [True] * 5
+
+
+def test_recovery_needs_consecutive_successes():
+    f = HysteresisFilter(fail_threshold=1, fail_window=1, recover_threshold=3)
+    assert feed(f, [False, True, True, False, True, True, True]) == [False] * 6 + [True]
+
+
+def test_hysteresis_state_round_trip():
+    f = HysteresisFilter(fail_threshold=2, fail_window=3, recover_threshold=2)
+    feed(f, [True, False])
+    restored = HysteresisFilter(fail_threshold=2, fail_window=3, recover_threshold=2)
+    restored.load_state(f.get_state())
+    # The failure before the save still counts toward going down
+    assert restored.update(False) is False
+
+
+def test_hysteresis_rejects_bad_thresholds():
+    with pytest.raises(ValueError):
+        HysteresisFilter(fail_threshold=4, fail_window=3)
+    with pytest.raises(ValueError):
+        HysteresisFilter(recover_threshold=0)
+
+
+def test_steady_target_is_not_flapping():
+    detector = FlapDetector()
+    assert not any(feed(detector, [True] * 30))
+    assert detector.percent_change == 0.0
+
+
+def test_alternating_target_flaps_then_settles():
+    detector = FlapDetector(low_threshold=20.0, high_threshold=30.0)
+    flags = feed(detector, [i % 2 == 0 for i in range(FlapDetector.HISTORY)])
+    assert detector.percent_change == pytest.approx(100.0)
+    assert detector.is_flapping
+    onset = flags.index(True)
+    assert 0 < onset < FlapDetector.HISTORY
+
+    percent = []
+    for _ in range(FlapDetector.HISTORY):
+        detector.update(True)
+        percent.append(detector.percent_change)
+        if not detector.is_flapping:
+            break
+    assert not detector.is_flapping
+    # Clears only once the change rate fell below the low threshold
+    assert percent[-1] < 20.0
+    assert all(p >= 20.0 for p in percent[:-1])
+
+
+def test_recent_changes_weigh_more():
+    old = FlapDetector()
+    feed(old, [True, False] + [False] * 19)
+    new = FlapDetector()
+    feed(new, [True] * 20 + [False])
+    assert new.percent_change > old.percent_change > 0
+
+
+def test_flap_state_round_trip():
+    detector = FlapDetector()
+    feed(detector, [i % 2 == 0 for i in range(FlapDetector.HISTORY)])
+    restored = FlapDetector()
+    restored.load_state(detector.get_state())
+    assert restored.is_flapping
+    assert restored.percent_change == pytest.approx(detector.percent_change)
@@ -0,0 +1,123 @@
+import os
+from datetime import datetime
+
+from cash_register_monitor import state_snapshot
+from cash_register_monitor.connection_monitor import ConnectionMonitor
+from cash_register_monitor.state_snapshot import (
+    HEADER, HISTOGRAM_BUCKETS, load_snapshot, pack_record, save_snapshot, unpack_record,
+)
+
+
+def make_snapshot(ip="192.168.1.155", port=4999, **overrides):
+    snapshot = {
+        "ip": ip,
+        "port": port,
+        "state": "flapping",
+        "connected": True,
+        "reason": "timeout",
+        "last_check": datetime(2024, 5, 1, 12, 30, 15, 250000),
+        "rtt": {"srtt": 0.0125, "rttvar": 0.004, "samples": 1234, "backoff": 2, "timeouts": 1},
+        "hysteresis": {"state": False, "recent": [True, False, False], "successes_in_row": 0},
+        "flap": {"history": [i % 3 == 0 for i in range(21)], "is_flapping": True},
+        "anomaly": {"mean": -4.5, "var": 0.03, "fast": -4.1, "loss": 0.125, "samples": 600,
+                    "degraded": True},
+        "rtt_histogram": list(range(HISTOGRAM_BUCKETS)),
+    }
+    snapshot.update(overrides)
+    return snapshot
+
+
+def without_target(snapshot):
+    return {key: value for key, value in snapshot.items() if key != "target"}
+
+
+def test_record_round_trip():
+    snapshot = make_snapshot()
+    restored = unpack_record(pack_record(snapshot))
+    assert restored["target"] == "192.168.1.155:4999"
+    assert without_target(restored) == snapshot
+
+
+def test_record_round_trip_of_a_fresh_target():
+    snapshot = make_snapshot(
+        state=None, connected=False, reason=None, last_check=None,
+        rtt={"srtt": None, "rttvar": None, "samples": 0, "backoff": 1, "timeouts": 0},
+        hysteresis={"state": None, "recent": [], "successes_in_row": 0},
+        flap={"history": [], "is_flapping": False},
+        anomaly={"mean": None, "var": 0.0, "fast": None, "loss": 0.0, "samples": 0,
+                 "degraded": False},
+        rtt_histogram=[0] * HISTOGRAM_BUCKETS,
+    )
+    assert without_target(unpack_record(pack_record(snapshot))) == snapshot
+
+
+def test_file_round_trip(tmp_path):
+    path = str(tmp_path / "state.bin")
+    snapshots = [make_snapshot(ip=f"10.0.{i // 256}.{i % 256}") for i in range(300)]
+    assert save_snapshot(path, snapshots)
+    assert not os.path.exists(path + ".tmp")
+
+    loaded = load_snapshot(path)
+    assert len(loaded) == 300
+    for snapshot in snapshots:
+        assert without_target(loaded[f"{snapshot['ip']}:4999"]) == snapshot
+
+
+def test_missing_or_empty_file_loads_nothing(tmp_path):
+    assert load_snapshot(str(tmp_path / "missing.bin")) == {}
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    assert load_snapshot(str(empty)) == {}
+
+
+def test_corrupt_or_truncated_file_is_ignored(tmp_path):
+    path = tmp_path / "state.bin"
+    assert save_snapshot(str(path), [make_snapshot(), make_snapshot(port=5000)])
+    data = path.read_bytes()
+
+    corrupt = bytearray(data)
+    corrupt[HEADER.size + 3] ^= 0xFF
+    path.write_bytes(bytes(corrupt))
+    assert load_snapshot(str(path)) == {}
+
+    path.write_bytes(data[:-1])
+    assert load_snapshot(str(path)) == {}
+
+
+def test_other_format_version_is_ignored(tmp_path, monkeypatch):
+    path = str(tmp_path / "state.bin")
+    monkeypatch.setattr(state_snapshot, "FORMAT_VERSION", state_snapshot.FORMAT_VERSION + 1)
+    assert save_snapshot(path, [make_snapshot()])
+    monkeypatch.undo()
+    assert load_snapshot(path) == {}
+
+
+def test_monitor_restores_its_own_snapshot(tmp_path):
+    monitor = ConnectionMonitor("10.1.2.3", 4999, degraded_threshold=3.0)
+    monitor.state = "disconnected"
+    monitor.is_connected = False
+    monitor.last_check_time = datetime(2024, 5, 1, 8, 0, 0)
+    monitor.last_probe = {"ok": False, "errno": 111, "reason": "port_closed", "rtt": 0.002}
+    for rtt in (0.010, 0.012, 0.011):
+        monitor.rtt.add_sample(rtt)
+    monitor.rtt.on_timeout()
+    for ok in (True, False, False):
+        monitor.hysteresis.update(ok)
+        monitor.flap_detector.update(ok)
+    for i in range(40):
+        monitor.anomaly.update(0.010 + 0.001 * (i % 4) if i % 10 else None)
+    monitor.rtt_histogram[3] = 7
+
+    path = str(tmp_path / "state.bin")
+    assert save_snapshot(path, [monitor.get_snapshot()])
+    restored = ConnectionMonitor("10.1.2.3", 4999, degraded_threshold=3.0)
+    restored.restore_snapshot(load_snapshot(path)["10.1.2.3:4999"])
+
+    assert restored.restored
+    assert restored.get_snapshot() == monitor.get_snapshot()
+    assert restored.rtt.timeout == monitor.rtt.timeout
+    assert restored.anomaly.get_state() == monitor.anomaly.get_state()
+    # The restored baseline keeps learning where it left off
+    assert restored.anomaly.update(0.011) == monitor.anomaly.update(0.011)
+    for key in ("mean", "var", "samples"):
+        assert restored.anomaly.get_baseline()[key] == monitor.anomaly.get_baseline()[key]